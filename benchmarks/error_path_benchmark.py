@@ -0,0 +1,216 @@
+"""
+Error-path micro-benchmarks covering every handler installed by configure_app.
+
+Each scenario is timed (median and mean latency) and traced with tracemalloc (peak bytes
+allocated by one call). Results are written as JSON so that releases can be diffed.
+
+Requires Python 3.9+ (tracemalloc.reset_peak). Run from the repository root:
+    PYTHONPATH=src python benchmarks/error_path_benchmark.py --output baseline.json
+    PYTHONPATH=src python benchmarks/error_path_benchmark.py --compare baseline.json
+"""
+from flask import Flask
+from flask_openapi3 import OpenAPI
+from pydantic import BaseModel, ValidationError
+from werkzeug.exceptions import NotFound
+from typing import Callable, Dict, List
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import flask_problem_details as problem
+
+SMALL_EXTRAS : dict = {"code": "E42", "retryable": False}
+LARGE_EXTRAS : dict = {"errors": [{"loc": ["items", index], "msg": "Input should be a valid integer", "input": "bad"} for index in range(1000)]}
+
+class ItemsModel(BaseModel):
+    items: List[int]
+
+def make_app(kind: str, with_traceback: bool) -> Flask:
+    """
+    Build a configured app with routes raising each kind of error.
+
+    Parameters
+    ----------
+    kind : str
+        Either "flask" or "openapi".
+    with_traceback : bool
+        If True, include traceback information in the problem details.
+
+    Returns
+    -------
+    Flask
+        The configured app.
+    """
+    config = problem.ProblemDetailsConfig(with_traceback=with_traceback)
+    if kind == "flask":
+        app = problem.configure_app(Flask(__name__), config=config)
+    else:
+        app = problem.configure_app(lambda args: OpenAPI(__name__, **args), config=config)
+
+        @app.post('/items')
+        def items_route(body: ItemsModel):
+            return {}
+
+    @app.route('/exception')
+    def exception_route():
+        raise Exception("The method is not implemented")
+
+    @app.route('/problem')
+    def problem_route():
+        raise problem.from_exception(Exception("The method is not implemented"), extras=SMALL_EXTRAS)
+    return app
+
+def validation_error(count: int) -> ValidationError:
+    try:
+        ItemsModel(items=["bad"] * count)
+    except ValidationError as error:
+        return error
+
+def raised(exception: Exception) -> Exception:
+    try:
+        raise exception
+    except Exception as caught:
+        return caught
+
+def scenarios() -> Dict[str, Callable[[], object]]:
+    """
+    Build the benchmark scenarios.
+
+    Returns
+    -------
+    Dict[str, Callable[[], object]]
+        The scenarios by name.
+    """
+    result : Dict[str, Callable[[], object]] = {}
+    exception : Exception = raised(Exception("The method is not implemented"))
+    for extras_name, extras in (("no_extras", {}), ("small_extras", SMALL_EXTRAS), ("large_extras", LARGE_EXTRAS)):
+        result[f"from_exception/{extras_name}"] = lambda extras=extras: problem.from_exception(exception, extras=extras)
+        for traceback_name, with_traceback in (("without_traceback", False), ("with_traceback", True)):
+            settings = problem.ProblemDetailsConfig(with_traceback=with_traceback).resolve()
+            for method in ("to_dict", "to_json", "to_bytes", "to_http_response"):
+                result[f"{method}/{extras_name}/{traceback_name}"] = (
+                    lambda method=method, extras=extras, settings=settings:
+                        getattr(problem.from_exception(exception, extras=extras), method)(settings=settings))
+
+    for kind in ("flask", "openapi"):
+        for traceback_name, with_traceback in (("without_traceback", False), ("with_traceback", True)):
+            app = make_app(kind, with_traceback)
+            client = app.test_client()
+            handlers = app.error_handler_spec[None][None]
+            handle, handle_exception = handlers[problem.ProblemDetailsError], handlers[Exception]
+            prefix : str = f"{kind}/{traceback_name}"
+            result[f"handle/{prefix}"] = lambda handle=handle: handle(problem.from_exception(exception, extras=SMALL_EXTRAS))
+            result[f"handle_exception/{prefix}/http"] = lambda handle_exception=handle_exception: handle_exception(NotFound())
+            result[f"handle_exception/{prefix}/generic"] = lambda handle_exception=handle_exception: handle_exception(exception)
+            result[f"request/{prefix}/not_found"] = lambda client=client: client.get('/missing')
+            result[f"request/{prefix}/exception"] = lambda client=client: client.get('/exception')
+            result[f"request/{prefix}/problem"] = lambda client=client: client.get('/problem')
+            if kind == "openapi":
+                for size in (1, 1000):
+                    error : ValidationError = validation_error(size)
+                    result[f"handle_validation_error/{prefix}/{size}_errors"] = (
+                        lambda app=app, error=error: app.validation_error_callback(error))
+                result[f"request/{prefix}/validation_error"] = (
+                    lambda client=client: client.post('/items', json={"items": ["bad"] * 10}))
+    return result
+
+def measure(function: Callable[[], object], min_time: float) -> Dict[str, float]:
+    """
+    Measure the latency and allocations of one scenario.
+
+    Parameters
+    ----------
+    function : Callable[[], object]
+        The scenario.
+    min_time : float
+        The minimum time in seconds spent timing the scenario.
+
+    Returns
+    -------
+    Dict[str, float]
+        The median and mean latency in microseconds, and the peak bytes allocated by one call.
+    """
+    function()
+    samples : List[float] = []
+    deadline : float = time.perf_counter() + min_time
+    while len(samples) < 5 or time.perf_counter() < deadline:
+        start : float = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1e6)
+
+    peaks : List[int] = []
+    tracemalloc.start()
+    for _ in range(5):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        function()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {
+        "median_us": round(statistics.median(samples), 2),
+        "mean_us": round(statistics.mean(samples), 2),
+        "peak_alloc_bytes": int(statistics.median(peaks)),
+        "iterations": len(samples),
+    }
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    List the scenarios slower or allocating more than the baseline by more than the tolerance.
+
+    Parameters
+    ----------
+    results : Dict[str, dict]
+        The current results.
+    baseline : Dict[str, dict]
+        The baseline results.
+    tolerance : float
+        The accepted relative increase, e.g. 0.2 for 20%.
+
+    Returns
+    -------
+    List[str]
+        One message per regression.
+    """
+    regressions : List[str] = []
+    for name, result in results.items():
+        reference : dict = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in ("median_us", "peak_alloc_bytes"):
+            if reference[metric] and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {reference[metric]} -> {result[metric]}")
+    return regressions
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="compare the results with a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="accepted relative regression (default 0.2)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds spent per scenario (default 0.2)")
+    parser.add_argument("--filter", default="", help="only run the scenarios whose name contains this text")
+    args = parser.parse_args(argv)
+
+    results : Dict[str, dict] = {}
+    for name, function in scenarios().items():
+        if args.filter in name:
+            results[name] = measure(function, args.min_time)
+            print(f"{name:<70} {results[name]['median_us']:>10.2f} us {results[name]['peak_alloc_bytes']:>10} B")
+
+    report : dict = {"python": platform.python_version(), "platform": platform.platform(), "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions : List[str] = compare(results, json.load(file)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Cold import time of flask_problem_details, measured in fresh interpreters.
+
+The import of flask is reported separately, as every app pays for it anyway.
+
+Run from the repository root:
+    PYTHONPATH=src python benchmarks/import_benchmark.py --runs 20
+"""
+from typing import Dict, List
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPT : str = """
+import sys, time
+start = time.perf_counter()
+import flask
+middle = time.perf_counter()
+import flask_problem_details
+end = time.perf_counter()
+print(middle - start, end - middle, "pydantic" in sys.modules, "flask_openapi3" in sys.modules)
+"""
+
+def cold_import() -> Dict[str, object]:
+    """
+    Import flask and flask_problem_details in a fresh interpreter.
+
+    Returns
+    -------
+    Dict[str, object]
+        The import times in milliseconds, and whether pydantic and flask_openapi3 were imported.
+    """
+    output : List[str] = subprocess.run([sys.executable, "-c", SCRIPT], env=os.environ.copy(),
+                                        capture_output=True, text=True, check=True).stdout.split()
+    return {"flask_ms": float(output[0]) * 1000, "flask_problem_details_ms": float(output[1]) * 1000,
+            "pydantic": output[2] == "True", "flask_openapi3": output[3] == "True"}
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="number of fresh interpreters")
+    args = parser.parse_args(argv)
+
+    results : List[Dict[str, object]] = [cold_import() for _ in range(args.runs)]
+    for name in ("flask_ms", "flask_problem_details_ms"):
+        print(f"{name:<28}median {statistics.median(result[name] for result in results):8.1f}")
+    print(f"{'pydantic imported':<28}{results[-1]['pydantic']}")
+    print(f"{'flask_openapi3 imported':<28}{results[-1]['flask_openapi3']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
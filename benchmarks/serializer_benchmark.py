@@ -0,0 +1,81 @@
+"""
+Compare the errors/sec of the trusted fast-path serializer against full pydantic validation,
+and the cost of collecting the item problems of a bulk request.
+
+Run from the repository root:
+    PYTHONPATH=src python benchmarks/serializer_benchmark.py
+"""
+from werkzeug.exceptions import NotFound
+from typing import Callable
+import timeit
+
+import flask_problem_details as problem
+
+NUMBER : int = 20000
+ITEM_ERRORS : list = [ValueError(f"Item {index} is invalid") for index in range(1000)]
+#the extension members of a validation problem on a bulk request, about 100 kB of JSON
+VALIDATION_ERRORS : list = [{"loc": ["body", "items", index, "name"], "msg": "Field required", "type": "missing",
+                             "input": {"id": index}} for index in range(1000)]
+
+def pydantic_path():
+    exception = NotFound()
+    model = problem.ProblemDetails(status=exception.code, title=exception.__class__.__name__, detail=exception.description)
+    problem.ProblemDetailsError(model, exception).to_json(with_traceback=False)
+
+def trusted_path():
+    problem.from_exception(NotFound()).to_json(with_traceback=False)
+
+def pydantic_large_extras():
+    exception = NotFound()
+    model = problem.ProblemDetails(status=exception.code, title=exception.__class__.__name__, errors=VALIDATION_ERRORS)
+    problem.ProblemDetailsError(model, exception).to_json(with_traceback=False)
+
+def trusted_large_extras():
+    problem.from_exception(NotFound(), extras={"errors": VALIDATION_ERRORS}).to_json(with_traceback=False)
+
+def collect_tuples():
+    items = []
+    for index, exception in enumerate(ITEM_ERRORS):
+        items.append((index, exception.__class__, str(exception), None))
+
+def collect_batch():
+    batch = problem.ProblemDetailsBatch()
+    for index, exception in enumerate(ITEM_ERRORS):
+        batch.add(index, exception)
+
+def collect_pydantic():
+    items = []
+    for index, exception in enumerate(ITEM_ERRORS):
+        items.append(problem.ProblemDetails(status=500, title="InternalServerError", detail=str(exception), index=index))
+
+def errors_per_second(function: Callable[[], None], number: int = NUMBER) -> float:
+    """
+    Measure how many problems per second a serialization path produces.
+
+    Parameters
+    ----------
+    function : Callable[[], None]
+        The path building and serializing one problem.
+    number : int, optional
+        The number of problems per measurement (default is NUMBER).
+
+    Returns
+    -------
+    float
+        The best rate out of five measurements.
+    """
+    return number / min(timeit.repeat(function, number=number, repeat=5))
+
+if __name__ == "__main__":
+    pydantic_rate : float = errors_per_second(pydantic_path)
+    trusted_rate : float = errors_per_second(trusted_path)
+    print(f"pydantic ProblemDetails : {pydantic_rate:>12,.0f} errors/sec")
+    print(f"TrustedProblemDetails   : {trusted_rate:>12,.0f} errors/sec ({trusted_rate / pydantic_rate:.1f}x)")
+    pydantic_rate = errors_per_second(pydantic_large_extras, 200)
+    trusted_rate = errors_per_second(trusted_large_extras, 200)
+    print(f"pydantic, 1000 errors   : {pydantic_rate:>12,.0f} errors/sec")
+    print(f"trusted, 1000 errors    : {trusted_rate:>12,.0f} errors/sec ({trusted_rate / pydantic_rate:.1f}x)")
+    tuple_rate : float = errors_per_second(collect_tuples, 100) * len(ITEM_ERRORS)
+    for name, function in (("ProblemDetailsBatch.add", collect_batch), ("ProblemDetails per item", collect_pydantic)):
+        rate : float = errors_per_second(function, 100) * len(ITEM_ERRORS)
+        print(f"{name:<24}: {rate:>12,.0f} items/sec ({rate / tuple_rate:.2f}x plain tuples)")
@@ -0,0 +1,65 @@
+"""
+Latency of the first problem response of a fresh worker, relative to the steady state, with
+and without warmup().
+
+The requests are timed inside the app, from before_request to after_request, in fresh interpreters.
+
+Run from the repository root:
+    PYTHONPATH=src python benchmarks/warmup_benchmark.py --runs 5
+"""
+from typing import List
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SCRIPT : str = """
+import statistics, sys, time, flask, flask_problem_details as problem
+app = problem.configure_app(flask.Flask('warm'), config=problem.ProblemDetailsConfig(with_traceback=True))
+app.add_url_rule('/exception', 'exception', lambda: 1 / 0)
+app.add_url_rule('/ok', 'ok', lambda: 'ok')
+timings = []
+app.before_request(lambda: setattr(flask.g, 'started', time.perf_counter()))
+@app.after_request
+def timed(response):
+    timings.append(time.perf_counter() - flask.g.started)
+    return response
+client = app.test_client()
+client.get('/ok')
+if sys.argv[1] == 'warm':
+    problem.warmup(app)
+for _ in range(51):
+    client.get('/exception')
+print(timings[1] / statistics.median(timings[2:]))
+"""
+
+def first_error_ratio(mode: str) -> float:
+    """
+    Measure the first error latency of a fresh worker over its steady state latency.
+
+    Parameters
+    ----------
+    mode : str
+        Either "cold" or "warm", the latter calling warmup(app) before the first error.
+
+    Returns
+    -------
+    float
+        The ratio of the first error latency to the median of the next 50.
+    """
+    return float(subprocess.run([sys.executable, "-c", SCRIPT, mode], env=os.environ.copy(),
+                                capture_output=True, text=True, check=True).stdout)
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters per mode")
+    args = parser.parse_args(argv)
+
+    for mode in ("cold", "warm"):
+        ratios : List[float] = [first_error_ratio(mode) for _ in range(args.runs)]
+        print(f"{mode:<6}first error / steady state  median {statistics.median(ratios):6.2f}  min {min(ratios):6.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
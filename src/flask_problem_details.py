@@ -1,28 +1,286 @@
 from __future__ import annotations
-from flask import Flask, Response
-from flask_openapi3 import OpenAPI
-from pydantic import BaseModel, Field, ValidationError, AnyUrl
-from werkzeug.exceptions import HTTPException, BadRequest, InternalServerError
-from typing import Union, Callable
+from flask import Flask, Response, request
+from werkzeug.exceptions import HTTPException, BadRequest, InternalServerError, default_exceptions
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from typing import Union, Callable, Hashable, Optional, Tuple, Dict, NamedTuple, Iterable, Iterator, List, Awaitable, IO, TYPE_CHECKING
+from dataclasses import dataclass, field, replace, fields, is_dataclass
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from datetime import date, time as datetime_time
+from decimal import Decimal
+from enum import Enum
+from uuid import UUID
+from functools import lru_cache
+from bisect import bisect_left
+from threading import Lock, local, Event, Thread, Condition
+from types import TracebackType
+from time import perf_counter, monotonic, time
+from hashlib import blake2b
 import traceback
+import linecache
+import weakref
+import inspect
+import json
+import re
+import atexit
+import sys
+import warnings
+import os
+import random
+from itertools import count
+
+#flask_openapi3 and pydantic are only imported when needed, to keep plain Flask workers light
+if TYPE_CHECKING:
+    from flask_openapi3 import OpenAPI
+    from pydantic import ValidationError
+
+def _to_jsonable_python(value: object) -> object:
+    """
+    Convert a value that JSON backends do not support natively, as pydantic does.
+
+    Parameters
+    ----------
+    value : object
+        The value, e.g. an AnyUrl, a datetime or a set.
+
+    Returns
+    -------
+    object
+        The JSON-compatible value.
+    """
+    from pydantic_core import to_jsonable_python
+    return to_jsonable_python(value)
 
 WITH_TRACEBACK : bool = False
 
-def activate_traceback():
+JsonEncoder = Callable[[dict], bytes]
+
+def json_encoder(backend: str = "auto") -> JsonEncoder:
+    """
+    Build a JSON encoder producing bytes from a problem details dictionary.
+
+    Parameters
+    ----------
+    backend : str, optional
+        One of "orjson", "msgspec", "json" or "auto", the fastest installed one (default is "auto").
+
+    Returns
+    -------
+    JsonEncoder
+        The encoder. Values the backend does not support natively are converted as pydantic does.
+
+    Raises
+    ------
+    ImportError
+        If the requested backend is not installed.
+    ValueError
+        If the backend is unknown.
+    """
+    if backend == "auto":
+        for candidate in ("orjson", "msgspec"):
+            try:
+                return json_encoder(candidate)
+            except ImportError:
+                pass
+        return json_encoder("json")
+    if backend == "orjson":
+        import orjson
+        return lambda data: orjson.dumps(data, default=_to_jsonable_python)
+    if backend == "msgspec":
+        import msgspec
+        return msgspec.json.Encoder(enc_hook=_to_jsonable_python).encode
+    if backend == "json":
+        encode : Callable[[object], str] = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_to_jsonable_python).encode
+        return lambda data: encode(data).encode()
+    raise ValueError(f"Unknown JSON backend: {backend}")
+
+class ProblemDetailsSettings(NamedTuple):
+    """
+    Frozen, resolved settings the error handlers close over.
+    """
+    with_traceback: bool = False
+    traceback_limit: Optional[int] = None
+    traceback_max_bytes: Optional[int] = None
+    traceback_summary: bool = False
+    json_encoder: Optional[JsonEncoder] = None
+    max_validation_errors: Optional[int] = None
+    stream_validation_errors: bool = False
+    compact_validation_errors: bool = False
+    validation_input_max_length: int = 0
+    traceback_sampler: Optional[TracebackSampler] = None
+    fingerprint: bool = False
+    media_types: Tuple[str, ...] = ()
+    compress_min_bytes: Optional[int] = None
+    max_body_bytes: Optional[int] = None
+    detach_tracebacks: bool = False
+    extras_limits: Optional[ExtrasLimits] = None
+
+_TRACEBACK_FIELDS : Tuple[str, ...] = ("with_traceback", "traceback_limit", "traceback_max_bytes", "traceback_summary")
+
+_GLOBAL_SETTINGS : ProblemDetailsSettings = ProblemDetailsSettings()
+
+@dataclass
+class ProblemDetailsConfig:
+    """
+    Per-app problem details configuration, stored in app.extensions["problem_details"].
+
+    Attributes
+    ----------
+    with_traceback : bool
+        If True, include traceback information in the problem details.
+    traceback_limit : Optional[int]
+        Maximum number of frames to include, keeping the innermost ones.
+    traceback_max_bytes : Optional[int]
+        Maximum size in bytes of the formatted traceback, keeping its tail.
+    traceback_summary : bool
+        If True, render one compact "file:line in function" entry per frame.
+    response_cache_size : int
+        Maximum number of prebuilt HTTPException responses to cache, zero disables the cache.
+    json_encoder : Union[str, JsonEncoder, None]
+        A JSON backend name accepted by json_encoder, or an encoder producing bytes.
+        None serializes through the problem model itself.
+    max_validation_errors : Optional[int]
+        Maximum number of validation errors reported, the number of omitted ones goes in "truncated".
+    stream_validation_errors : bool
+        If True, write the validation "errors" array incrementally through a streamed response.
+        The stream stops within max_body_bytes, and streamed bodies are not compressed.
+    compact_validation_errors : bool
+        If True, report validation errors grouped by (type, msg), see compact_validation_errors.
+    validation_input_max_length : int
+        In the compact format, the maximum length of the one "input" sample kept per group, zero drops it.
+    traceback_sampler : Optional[TracebackSampler]
+        Sampling policy of tracebacks, rejected occurrences only get a "traceback_id" member.
+    fingerprint : bool
+        If True, add the "fingerprint" member computed by exception_fingerprint.
+    media_types : Tuple[str, ...]
+        The problem media types negotiated with the Accept header, among MEDIA_TYPES. Those whose
+        library is not installed are left out. Empty disables the negotiation, responses are JSON.
+    compress_min_bytes : Optional[int]
+        Compress the problem bodies of at least this size with brotli or gzip, when the client
+        accepts it. None disables the compression.
+    max_body_bytes : Optional[int]
+        Hard budget of the uncompressed problem bodies: the traceback is cut first, then the
+        extension members are omitted, their names listed in "omitted", and the detail is truncated
+        last. None disables the budget.
+    detach_tracebacks : bool
+        If True, release the frames of the handled exception once its response is built, see
+        detach_traceback, so nothing holding the exception keeps the frame locals alive.
+    extras_limits : Optional[ExtrasLimits]
+        Bounds of the rendering of the extension members, see bound_extras. None renders them as is.
+    aggregator : Optional[ProblemAggregator]
+        Store aggregating problem occurrences by fingerprint, None disables it.
+    reporter : Optional[ProblemReporter]
+        Background reporter receiving a problem_record per problem response, None disables it.
+    metrics : Optional[ProblemMetrics]
+        Collector of error-path metrics, None disables the instrumentation.
+    logger : Optional[ProblemLogger]
+        Structured logger of the problem responses, None disables it.
+    request_ids : Optional[RequestIds]
+        Request ids filling the "instance" member and echoed in a response header, None disables them.
+    load_shedder : Optional[LoadShedder]
+        Overload mode answering with a pre-encoded 503/429 problem while the worker is saturated,
+        None disables it.
+    catalog : Optional[ProblemCatalog]
+        Catalog of the domain problems, whose schemas and responses are added to the components
+        of OpenAPI apps. Its templates are registered when the problems are declared.
+    blueprints : Dict[str, dict]
+        Settings overrides by blueprint name, e.g. {"admin": {"with_traceback": True}}. Nested
+        blueprints match by dotted name ("api.admin") or by their own name, the innermost first.
+        Unknown names raise a ValueError in configure_app, or a warning on the first problem
+        response when the blueprints are registered after configure_app.
+    """
+    with_traceback: bool = False
+    traceback_limit: Optional[int] = None
+    traceback_max_bytes: Optional[int] = None
+    traceback_summary: bool = False
+    response_cache_size: int = 0
+    json_encoder: Union[str, JsonEncoder, None] = None
+    max_validation_errors: Optional[int] = None
+    stream_validation_errors: bool = False
+    compact_validation_errors: bool = False
+    validation_input_max_length: int = 0
+    traceback_sampler: Optional[TracebackSampler] = None
+    fingerprint: bool = False
+    media_types: Tuple[str, ...] = ()
+    compress_min_bytes: Optional[int] = None
+    max_body_bytes: Optional[int] = None
+    detach_tracebacks: bool = False
+    extras_limits: Optional[ExtrasLimits] = None
+    aggregator: Optional[ProblemAggregator] = None
+    reporter: Optional[ProblemReporter] = None
+    metrics: Optional[ProblemMetrics] = None
+    logger: Optional[ProblemLogger] = None
+    request_ids: Optional[RequestIds] = None
+    load_shedder: Optional[LoadShedder] = None
+    catalog: Optional[ProblemCatalog] = None
+    blueprints: Dict[str, dict] = field(default_factory=dict)
+
+    def resolve(self, blueprint: Optional[str] = None) -> ProblemDetailsSettings:
+        """
+        Resolve the configuration into frozen settings.
+
+        Parameters
+        ----------
+        blueprint : str, optional
+            The name of the blueprint whose overrides are applied (default is None).
+
+        Returns
+        -------
+        ProblemDetailsSettings
+            The resolved settings.
+        """
+        if blueprint is not None:
+            return replace(self, blueprints={}, **self.blueprints[blueprint]).resolve()
+        if self.stream_validation_errors and self.compress_min_bytes is not None:
+            raise ValueError("stream_validation_errors and compress_min_bytes cannot be combined, streamed bodies are not compressed")
+        return ProblemDetailsSettings(
+            with_traceback=self.with_traceback,
+            traceback_limit=self.traceback_limit,
+            traceback_max_bytes=self.traceback_max_bytes,
+            traceback_summary=self.traceback_summary,
+            json_encoder=json_encoder(self.json_encoder) if isinstance(self.json_encoder, str) else self.json_encoder,
+            max_validation_errors=self.max_validation_errors,
+            stream_validation_errors=self.stream_validation_errors,
+            compact_validation_errors=self.compact_validation_errors,
+            validation_input_max_length=self.validation_input_max_length,
+            traceback_sampler=self.traceback_sampler,
+            fingerprint=self.fingerprint,
+            media_types=available_media_types(self.media_types) if self.media_types else (),
+            compress_min_bytes=self.compress_min_bytes,
+            max_body_bytes=self.max_body_bytes,
+            detach_tracebacks=self.detach_tracebacks,
+            extras_limits=self.extras_limits)
+
+def activate_traceback(limit: Optional[int] = None, max_bytes: Optional[int] = None, summary: bool = False):
     """
     Activate the inclusion of traceback information in problem details.
+    It applies to apps configured without a ProblemDetailsConfig and to direct ProblemDetailsError calls.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Maximum number of frames to include, keeping the innermost ones (default is None, no limit).
+    max_bytes : int, optional
+        Maximum size in bytes of the formatted traceback, keeping its tail (default is None, no limit).
+    summary : bool, optional
+        If True, render one compact "file:line in function" entry per frame instead of the full traceback (default is False).
     """
-    global WITH_TRACEBACK
+    global WITH_TRACEBACK, _GLOBAL_SETTINGS
     WITH_TRACEBACK = True
+    _GLOBAL_SETTINGS = ProblemDetailsSettings(True, limit, max_bytes, summary)
 
 def deactivate_traceback():
     """
     Deactivate the inclusion of traceback information in problem details.
     """
-    global WITH_TRACEBACK
+    global WITH_TRACEBACK, _GLOBAL_SETTINGS
     WITH_TRACEBACK = False
+    _GLOBAL_SETTINGS = _GLOBAL_SETTINGS._replace(with_traceback=False)
 
-def configure_app(app: Union[Flask, Callable[[dict],OpenAPI]], with_traceback: bool = False) -> Union[Flask, OpenAPI]:
+def configure_app(app: Union[Flask, Callable[[dict],OpenAPI]], with_traceback: bool = False,
+                  response_cache_size: int = 0, json_encoder: Union[str, JsonEncoder, None] = None,
+                  config: ProblemDetailsConfig = None) -> Union[Flask, OpenAPI]:
     """
     Configure the Flask or OpenAPI app to handle ProblemDetailsError and other exceptions.
 
@@ -32,6 +290,17 @@ def configure_app(app: Union[Flask, Callable[[dict],OpenAPI]], with_traceback: b
         The Flask or OpenAPI application instance to configure.
     with_traceback : bool, optional
         If True, include traceback information in the problem details (default is False).
+        Ignored when config is given.
+    response_cache_size : int, optional
+        Maximum number of prebuilt HTTPException responses to keep in an LRU cache.
+        Zero disables the cache (default is 0). Ignored when config is given.
+    json_encoder : Union[str, JsonEncoder, None], optional
+        A JSON backend name ("orjson", "msgspec", "json", "auto") or an encoder producing bytes
+        (default is None, the problem model serializes itself). Custom encoders receive the
+        model_dump dictionary, which may hold values like AnyUrl. Ignored when config is given.
+    config : ProblemDetailsConfig, optional
+        Per-app configuration, resolved once into the settings used by the handlers (default is None,
+        the handlers follow activate_traceback/deactivate_traceback).
 
     Returns
     -------
@@ -52,7 +321,14 @@ def configure_app(app: Union[Flask, Callable[[dict],OpenAPI]], with_traceback: b
         Response
             An HTTP response representing the problem details.
         """
-        return problem.to_http_response()
+        if shedder is not None and shedder.overloaded():
+            return shedder.response()
+        started : float = perf_counter() if observing else 0.0
+        settings : ProblemDetailsSettings = current_settings()
+        problem = problem._for_response()
+        request_id : Optional[str] = correlate(problem) if request_ids is not None else None
+        response : Response = problem.to_http_response(settings=settings, media_type=negotiate(settings))
+        return complete(problem.inner_exception or problem, problem, response, settings, request_id, started)
     def handle_validation_error(error: ValidationError) -> Response:
         """
         Handle a ValidationError and return an HTTP response.
@@ -67,8 +343,32 @@ def configure_app(app: Union[Flask, Callable[[dict],OpenAPI]], with_traceback: b
         Response
             An HTTP response representing the validation error details.
         """
+        if shedder is not None and shedder.overloaded():
+            return shedder.response()
+        started : float = perf_counter() if observing else 0.0
+        settings : ProblemDetailsSettings = current_settings()
         bad_request_exception = BadRequest(f"Validation Failed! Error count: {error.error_count()}")
-        return handle(from_exception(bad_request_exception, extras={"errors": error.errors()}))
+        if settings.compact_validation_errors:
+            errors : list = error.errors(include_url=False, include_context=False,
+                                         include_input=settings.validation_input_max_length > 0)
+        else:
+            errors : list = error.errors()
+        extras : dict = {}
+        if settings.max_validation_errors is not None and len(errors) > settings.max_validation_errors:
+            extras["truncated"] = len(errors) - settings.max_validation_errors
+            errors = errors[:settings.max_validation_errors]
+        if settings.compact_validation_errors:
+            errors = compact_validation_errors(errors, settings.validation_input_max_length)
+        media_type : str = negotiate(settings)
+        if settings.stream_validation_errors and media_type == PROBLEM_JSON:
+            problem : ProblemDetailsError = from_exception(bad_request_exception, extras=extras)
+            request_id : Optional[str] = correlate(problem) if request_ids is not None else None
+            response : Response = problem.to_http_stream("errors", errors, settings=settings)
+        else:
+            problem : ProblemDetailsError = from_exception(bad_request_exception, extras={"errors": errors, **extras})
+            request_id : Optional[str] = correlate(problem) if request_ids is not None else None
+            response : Response = problem.to_http_response(settings=settings, media_type=media_type)
+        return complete(error, problem, response, settings, request_id, started)
     def handle_exception(exception: Exception)-> Response:
         """
         Handle any exception and return an HTTP response.
@@ -83,130 +383,3157 @@ def configure_app(app: Union[Flask, Callable[[dict],OpenAPI]], with_traceback: b
         Response
             An HTTP response representing the exception details.
         """
-        return handle(problem=from_exception(exception))
+        if shedder is not None and shedder.overloaded():
+            return shedder.response()
+        started : float = perf_counter() if observing else 0.0
+        settings : ProblemDetailsSettings = current_settings()
+        problem : Optional[ProblemDetailsError] = None
+        body : Optional[bytes] = None
+        media_type : str = negotiate(settings)
+        if (response_cache is not None and isinstance(exception, HTTPException) and media_type == PROBLEM_JSON
+                and not settings.with_traceback and not settings.fingerprint):
+            key : Optional[Hashable] = ProblemResponseCache.key(exception)
+            if key is not None:
+                body = response_cache.get(key)
+                if body is None:
+                    body = from_exception(exception).to_bytes(with_traceback=False, settings=settings)
+                    response_cache.put(key, body)
+        request_id : Optional[str] = None
+        if body is not None and request_ids is not None:
+            #the cached bodies are JSON objects without instance, a custom encoder may add whitespace after them
+            body = body.rstrip()
+            if body.endswith(b"}"):
+                request_id = correlate(None)
+                body = body[:-1] + b',"instance":' + _encode_string(request_ids.instance(request_id)).encode() + b"}"
+            else:
+                body = None
+        if body is not None:
+            response : Response = Response(status=exception.code, response=body, mimetype=PROBLEM_JSON)
+        else:
+            problem = from_exception(exception)
+            if request_ids is not None:
+                request_id = correlate(problem)
+            response : Response = problem.to_http_response(settings=settings, media_type=media_type)
+        return complete(exception, problem, response, settings, request_id, started)
+    def complete(exception: BaseException, problem: Optional[ProblemDetailsError], response: Response,
+                 settings: ProblemDetailsSettings, request_id: Optional[str], started: float) -> Response:
+        """
+        Log, finish and observe a problem response, then release the frames of the exception.
+
+        Parameters
+        ----------
+        exception : BaseException
+            The handled exception.
+        problem : Optional[ProblemDetailsError]
+            The problem, None when the response was served from the response cache.
+        response : Response
+            The problem response.
+        settings : ProblemDetailsSettings
+            The settings the response was built with.
+        request_id : Optional[str]
+            The request id given by request_ids, None when request_ids is not configured.
+        started : float
+            The perf_counter value when the handler started.
+
+        Returns
+        -------
+        Response
+            The same response.
+        """
+        if logging_responses and response.status_code >= logger.min_status:
+            log(response, problem, settings, request_id)
+        finish(response, settings, request_id)
+        if observing:
+            observe(exception, response, started, problem, settings)
+        if settings.detach_tracebacks:
+            detach_traceback(exception)
+            if problem is not None:
+                problem.detach()
+        return response
+    def log(response: Response, problem: Optional[ProblemDetailsError], settings: ProblemDetailsSettings,
+            request_id: Optional[str]):
+        """
+        Log a problem response, reusing its JSON body. Streamed bodies are logged once
+        they are fully written, lines of interrupted streams are dropped.
+
+        Parameters
+        ----------
+        response : Response
+            The problem response, before compression.
+        problem : Optional[ProblemDetailsError]
+            The problem, None when the response was served from the response cache.
+        settings : ProblemDetailsSettings
+            The settings the response was built with.
+        request_id : Optional[str]
+            The request id given by request_ids, None takes it from the request header of the logger.
+        """
+        if request_id is None:
+            request_id = request.headers.get(logger.request_id_header)
+        if response.mimetype != PROBLEM_JSON:
+            logger.log(problem.to_bytes(settings=settings), response.status_code, request.method, request.path, request_id)
+        elif response.is_streamed:
+            response.response = logged_stream(response.response, response.status_code, request.method, request.path, request_id)
+        else:
+            logger.log(response.get_data(), response.status_code, request.method, request.path, request_id)
+    def logged_stream(chunks: Iterable[bytes], status: int, method: str, path: str, request_id: Optional[str]) -> Iterator[bytes]:
+        """
+        Pass the chunks of a streamed body through, and log the body after the last one.
+
+        Parameters
+        ----------
+        chunks : Iterable[bytes]
+            The chunks of the streamed response.
+        status : int
+            The status of the response.
+        method : str
+            The request method.
+        path : str
+            The request path.
+        request_id : Optional[str]
+            The request id.
+
+        Yields
+        ------
+        bytes
+            The chunks, unchanged.
+        """
+        written : List[bytes] = []
+        for chunk in chunks:
+            written.append(chunk)
+            yield chunk
+        logger.log(b"".join(written), status, method, path, request_id)
+    def correlate(problem: Optional[ProblemDetailsError]) -> str:
+        """
+        Set the instance member of a problem from the request id, unless it is already set.
+
+        Parameters
+        ----------
+        problem : Optional[ProblemDetailsError]
+            The problem, None only resolves the request id.
+
+        Returns
+        -------
+        str
+            The request id.
+        """
+        request_id : str = request_ids.current()
+        if problem is not None and problem.problem.instance is None:
+            _set_instance(problem, request_ids.instance(request_id))
+        return request_id
+    def finish(response: Response, settings: ProblemDetailsSettings, request_id: Optional[str]):
+        """
+        Apply the response policies depending on the request headers.
+
+        Parameters
+        ----------
+        response : Response
+            The problem response.
+        settings : ProblemDetailsSettings
+            The settings the response was built with.
+        request_id : Optional[str]
+            The request id given by request_ids, None when request_ids is not configured.
+        """
+        if settings.media_types:
+            response.vary.add("Accept")
+        if request_id is not None:
+            response.headers[request_ids.response_header] = request_id
+        if settings.compress_min_bytes is not None and not response.is_streamed:
+            compress_response(response, request.headers.get("Accept-Encoding", ""), settings.compress_min_bytes)
+    def negotiate(settings: ProblemDetailsSettings) -> str:
+        """
+        Select the media type of the problem response from the Accept header of the request.
+
+        Parameters
+        ----------
+        settings : ProblemDetailsSettings
+            The settings holding the offered media types.
+
+        Returns
+        -------
+        str
+            The negotiated media type, PROBLEM_JSON when the negotiation is disabled.
+        """
+        if not settings.media_types:
+            return PROBLEM_JSON
+        return negotiate_media_type(request.headers.get("Accept", ""), settings.media_types)
+    def observe(exception: BaseException, response: Response, started: float,
+                problem: Optional[ProblemDetailsError], settings: ProblemDetailsSettings):
+        """
+        Feed a problem response to the aggregator, the reporter and the metrics.
+
+        Parameters
+        ----------
+        exception : BaseException
+            The handled exception.
+        response : Response
+            The problem response.
+        started : float
+            The perf_counter value when the handler started.
+        problem : Optional[ProblemDetailsError]
+            The problem, None when the response was served from the response cache.
+        settings : ProblemDetailsSettings
+            The settings the response was built with.
+        """
+        if problem is None and (aggregator is not None or reporter is not None):
+            problem = from_exception(exception)
+        if aggregator is not None:
+            aggregator.record(problem, settings)
+        if reporter is not None:
+            reporter.submit(problem_record(problem))
+        if metrics is not None:
+            metrics.observe(exception, response, started, problem)
+    def prime(exceptions: List[BaseException]):
+        """
+        Run the handlers once per exception and offered media type, without observing nor logging them.
+
+        Parameters
+        ----------
+        exceptions : List[BaseException]
+            The exceptions to handle, through the error handler lookup of the app.
+        """
+        nonlocal observing, logging_responses
+        was_observing, was_logging = observing, logging_responses
+        observing = logging_responses = False
+        try:
+            settings : ProblemDetailsSettings = current_settings()
+            accept_encoding : str = "br, gzip" if settings.compress_min_bytes is not None else ""
+            for media_type in settings.media_types or (PROBLEM_JSON,):
+                with app.test_request_context(headers={"Accept": media_type, "Accept-Encoding": accept_encoding}):
+                    for exception in exceptions:
+                        app.handle_user_exception(exception)
+                    if hasattr(app, "validation_error_callback"):
+                        from pydantic import TypeAdapter, ValidationError
+                        try:
+                            TypeAdapter(int).validate_python("warmup")
+                        except ValidationError as error:
+                            handle_validation_error(error)
+        finally:
+            observing, logging_responses = was_observing, was_logging
     
-    if with_traceback:
-        activate_traceback()
+    if config is None:
+        if with_traceback:
+            activate_traceback()
+        config = ProblemDetailsConfig(with_traceback=with_traceback, response_cache_size=response_cache_size, json_encoder=json_encoder)
+        current_settings : Callable[[], ProblemDetailsSettings] = _follow_global_settings(config.resolve())
+    else:
+        app_settings : ProblemDetailsSettings = config.resolve()
+        if config.blueprints:
+            blueprint_settings : Dict[str, ProblemDetailsSettings] = {name: config.resolve(name) for name in config.blueprints}
+            #blueprints registered after configure_app are checked on the first problem response
+            unchecked : List[bool] = [True]
+            def current_settings() -> ProblemDetailsSettings:
+                if unchecked[0]:
+                    unchecked[0] = False
+                    unknown : List[str] = _unknown_blueprints(app, config.blueprints)
+                    if unknown:
+                        warnings.warn(f"ProblemDetailsConfig.blueprints names unknown blueprints: {unknown}", stacklevel=2)
+                #innermost blueprint first, by dotted name of nested blueprints, then by its own name
+                for name in request.blueprints:
+                    settings : Optional[ProblemDetailsSettings] = blueprint_settings.get(name) or blueprint_settings.get(name.rpartition(".")[2])
+                    if settings is not None:
+                        return settings
+                return app_settings
+        else:
+            current_settings = lambda: app_settings
+
+    response_cache : Optional[ProblemResponseCache] = ProblemResponseCache(config.response_cache_size) if config.response_cache_size > 0 else None
+    metrics : Optional[ProblemMetrics] = config.metrics
+    aggregator : Optional[ProblemAggregator] = config.aggregator
+    reporter : Optional[ProblemReporter] = config.reporter
+    observing : bool = metrics is not None or aggregator is not None or reporter is not None
+    shedder : Optional[LoadShedder] = config.load_shedder
+    logger : Optional[ProblemLogger] = config.logger
+    logging_responses : bool = logger is not None
+    request_ids : Optional[RequestIds] = config.request_ids
     
     #app is always a callable object, more specific check on Flask class
     if not isinstance(app, Flask):
         app : OpenAPI = app(
             {"validation_error_status" : 400, 
-                "validation_error_model" : ProblemDetails, 
+                "validation_error_model" : _problem_details_model(), 
                     "validation_error_callback": handle_validation_error})
+        if config.catalog is not None:
+            config.catalog.install(app)
     
+    if config.blueprints and app.blueprints:
+        unknown : List[str] = _unknown_blueprints(app, config.blueprints)
+        if unknown:
+            raise ValueError(f"ProblemDetailsConfig.blueprints names unknown blueprints: {unknown}")
+        unchecked[0] = False
     app.register_error_handler(ProblemDetailsError, handle)
     app.register_error_handler(Exception, handle_exception)
+    if shedder is not None:
+        #first before_request function, so rejected requests skip the ones of the app
+        app.before_request_funcs.setdefault(None, []).insert(0, lambda: shedder.enter(request.environ))
+        app.teardown_request(lambda exception: shedder.leave(request.environ))
+    app.extensions["problem_details"] = config
+    app.extensions["problem_details_response_cache"] = response_cache
+    app.extensions["problem_details_warmup"] = prime
     
     return app
 
-def from_exception(exception: Exception, extras: dict = {}) -> ProblemDetailsError:
+def _unknown_blueprints(app: Flask, names: Iterable[str]) -> List[str]:
     """
-    Create a ProblemDetailsError from an exception.
+    Find the names of blueprint overrides matching no blueprint of an app.
 
     Parameters
     ----------
-    exception : Exception
-        The exception that caused the problem.
-    extras : dict, optional
-        Additional information to include in the problem details (default is {}).
+    app : Flask
+        The app.
+    names : Iterable[str]
+        The names, either the dotted name of a nested blueprint ("api.admin") or a blueprint name ("admin").
 
     Returns
     -------
-    ProblemDetailsError
-        The created ProblemDetailsError instance.
+    List[str]
+        The unknown names.
     """
-    problem = ProblemDetails(
-        status=InternalServerError.code,
-        title= InternalServerError.__name__,
-        detail= str(exception),
-        **extras
-    )
-    
-    if isinstance(exception, HTTPException):
-        problem.status = exception.code
-        problem.title = exception.__class__.__name__
-        problem.detail = exception.description
-    
-    return ProblemDetailsError(problem=problem, exception=exception)
+    known : set = set(app.blueprints) | {name.rpartition(".")[2] for name in app.blueprints}
+    return sorted(name for name in names if name not in known)
 
-class ProblemDetails(BaseModel, extra="allow"):
-    status: int = Field(..., description = "HTTP status code")
-    title: str  = Field(..., description = "A short, human-readable summary of the problem type")
-    detail: Union[str|None]  = Field(None, description = "An human readable explanation specific to this occurrence of the problem")
-    type: Union[AnyUrl|None]  = Field(None, description = "An absolute URI that identifies the problem type")
-    instance: Union[AnyUrl|None] = Field(None, description = "An URI reference that identifies the specific occurrence of the problem")
-    traceback : Union[str|None] = Field(None, description = "The stack trace of the problem")
+def _follow_global_settings(app_settings: ProblemDetailsSettings) -> Callable[[], ProblemDetailsSettings]:
+    """
+    Build the settings getter of an app configured without a ProblemDetailsConfig.
 
-class ProblemDetailsError(Exception):
+    Parameters
+    ----------
+    app_settings : ProblemDetailsSettings
+        The app settings, whose traceback fields are replaced by the module traceback settings.
+
+    Returns
+    -------
+    Callable[[], ProblemDetailsSettings]
+        A getter following activate_traceback/deactivate_traceback.
+    """
+    if app_settings[len(_TRACEBACK_FIELDS):] == ProblemDetailsSettings()[len(_TRACEBACK_FIELDS):]:
+        return lambda: _GLOBAL_SETTINGS
+    merged : list = [None, None]
+    def current_settings() -> ProblemDetailsSettings:
+        global_settings : ProblemDetailsSettings = _GLOBAL_SETTINGS
+        if merged[0] is not global_settings:
+            merged[:] = [global_settings, app_settings._replace(**{name: getattr(global_settings, name) for name in _TRACEBACK_FIELDS})]
+        return merged[1]
+    return current_settings
+
+WARMUP_STATUSES : Tuple[int, ...] = (400, 401, 403, 404, 405, 409, 422, 429, 500, 503)
+
+def warmup(app: Optional[Flask] = None, statuses: Iterable[int] = WARMUP_STATUSES):
+    """
+    Pay the one-off costs of the first problem response ahead of the first error.
+
+    Builds the ProblemDetails model and its serializer, the media type encoders, the traceback
+    and fingerprint machinery, then renders one response per status through the handlers of the
+    app, which fills its response cache. Call it from a post_fork hook so each worker starts warm,
+    or before forking to share the warmed state copy-on-write. The warmup responses are not recorded by the observers.
+
+    Parameters
+    ----------
+    app : Optional[Flask], optional
+        An app configured with configure_app (default is None, only the module is warmed up).
+    statuses : Iterable[int], optional
+        The HTTP status codes rendered through the handlers (default is WARMUP_STATUSES).
+    """
+    sample = _problem_details_model()(status=500, title="InternalServerError", type="about:blank", instance="urn:warmup")
+    sample.model_dump_json()
+    for media_type in available_media_types(MEDIA_TYPES):
+        media_type_encoder(media_type)(_to_jsonable_python(sample.model_dump(exclude_none=True)))
+    try:
+        raise RuntimeError("warmup")
+    except RuntimeError as exception:
+        error : ProblemDetailsError = from_exception(exception)
+        error.format_traceback(_GLOBAL_SETTINGS)
+        error.fingerprint()
+    if app is not None:
+        #the frames of the first tracebacks are in the views and in the dispatching code of flask
+        filenames : set = {getattr(sys.modules.get(cls.__module__), "__file__", None) for cls in type(app).__mro__}
+        for view in app.view_functions.values():
+            filenames.add(getattr(getattr(inspect.unwrap(view), "__code__", None), "co_filename", None))
+        for filename in filenames - {None}:
+            linecache.getlines(filename)
+        prime : Callable[[List[BaseException]], None] = app.extensions["problem_details_warmup"]
+        prime([default_exceptions[status]() for status in statuses] + [error.inner_exception])
+
+class ProblemTemplate(NamedTuple):
+    """
+    Prebuilt problem members of an exception class.
+    """
+    status: int
+    title: str
+    type: Optional[str] = None
+    detail: Optional[str] = None
+    extras: Optional[dict] = None
 
-    def __init__(self, problem: ProblemDetails, exception: Exception = None):
+class ProblemRegistry:
+    """
+    Registry mapping exception classes to problem templates.
+
+    Lookups follow the exception MRO, so a template registered for a base class applies to
+    its subclasses, and are memoized per concrete class. HTTP exceptions only match templates
+    registered on HTTPException classes, so a template of Exception does not turn every 404
+    into a 500. The version is incremented on every
+    change, so caches of rendered problems can tell their entries are stale.
+    """
+
+    def __init__(self):
+        self._templates : Dict[type, ProblemTemplate] = {}
+        self._resolved : Dict[type, Optional[ProblemTemplate]] = {}
+        self.version : int = 0
+
+    def register(self, exception_class: type, status: int, title: str = None, type: str = None,
+                 detail: str = None, extras: dict = None) -> ProblemTemplate:
         """
-        Initialize a ProblemDetailsError.
+        Register the problem template of an exception class. The template is validated once here.
 
         Parameters
         ----------
-        problem : ProblemDetails
-            The problem details.
-        exception : Exception, optional
-            The original exception that caused the problem (default is None).
+        exception_class : type
+            The exception class.
+        status : int
+            HTTP status code.
+        title : str, optional
+            A short, human-readable summary of the problem type (default is None, the class name).
+        type : str, optional
+            An absolute URI that identifies the problem type (default is None).
+        detail : str, optional
+            A fixed explanation of the problem (default is None, the exception message, or the
+            description of HTTP exceptions).
+        extras : dict, optional
+            Additional members of every problem of this class (default is None).
+
+        Returns
+        -------
+        ProblemTemplate
+            The registered template.
         """
-        self.problem: ProblemDetails = problem
-        self.inner_exception: Exception = exception
+        title : str = exception_class.__name__ if title is None else title
+        model : ProblemDetails = _problem_details_model()(status=status, title=title, type=type, detail=detail)
+        template : ProblemTemplate = ProblemTemplate(
+            status=model.status, title=model.title, type=None if model.type is None else str(model.type),
+            detail=model.detail, extras=dict(extras) if extras else None)
+        self._templates[exception_class] = template
+        self._resolved = {}
+        self.version += 1
+        return template
 
-    def to_dict(self, with_traceback: bool = None) -> dict:
+    def unregister(self, exception_class: type):
         """
-        Transform the ProblemDetailsError into a dictionary.
+        Remove the problem template of an exception class, if any.
 
         Parameters
         ----------
-        with_traceback : bool, optional
-            If True, include the last exception traceback (default is None).
+        exception_class : type
+            The exception class.
+        """
+        self._templates.pop(exception_class, None)
+        self._resolved = {}
+        self.version += 1
+
+    def lookup(self, exception_class: type) -> Optional[ProblemTemplate]:
+        """
+        Find the problem template of an exception class.
+
+        Parameters
+        ----------
+        exception_class : type
+            The exception class.
 
         Returns
         -------
-        dict
-            The problem details as a dictionary.
+        Optional[ProblemTemplate]
+            The template of the closest registered class in the MRO, or None.
         """
-        with_traceback : bool = WITH_TRACEBACK if with_traceback is None else with_traceback
-        
-        if with_traceback:
-            self.problem.traceback = traceback.format_exc()
-        return self.problem.model_dump(exclude_none=True)
-    
-    def to_json(self, with_traceback: bool = None) -> str:
+        try:
+            return self._resolved[exception_class]
+        except KeyError:
+            pass
+        template : Optional[ProblemTemplate] = None
+        if self._templates:
+            bases : Tuple[type, ...] = exception_class.__mro__
+            if issubclass(exception_class, HTTPException):
+                bases = bases[:bases.index(HTTPException) + 1]
+            for base in bases:
+                template = self._templates.get(base)
+                if template is not None:
+                    break
+        self._resolved[exception_class] = template
+        return template
+
+PROBLEM_REGISTRY : ProblemRegistry = ProblemRegistry()
+
+def register_problem(exception_class: type, status: int, title: str = None, type: str = None,
+                     detail: str = None, extras: dict = None) -> ProblemTemplate:
+    """
+    Register the problem template used by from_exception for an exception class and its subclasses.
+
+    Parameters
+    ----------
+    exception_class : type
+        The exception class.
+    status : int
+        HTTP status code.
+    title : str, optional
+        A short, human-readable summary of the problem type (default is None, the class name).
+    type : str, optional
+        An absolute URI that identifies the problem type (default is None).
+    detail : str, optional
+        A fixed explanation of the problem (default is None, the exception message).
+    extras : dict, optional
+        Additional members of every problem of this class (default is None).
+
+    Returns
+    -------
+    ProblemTemplate
+        The registered template.
+    """
+    return PROBLEM_REGISTRY.register(exception_class, status, title=title, type=type, detail=detail, extras=extras)
+
+_SCHEMA_REF : str = "#/components/schemas/{model}"
+_SCHEMA_NAME : re.Pattern = re.compile(r"^[a-zA-Z0-9.\-_]+$")
+
+class CatalogEntry(NamedTuple):
+    """
+    A problem declared in a ProblemCatalog.
+    """
+    name: str
+    exception_class: type
+    template: ProblemTemplate
+    extras_model: Optional[type] = None
+
+class ProblemCatalog:
+    """
+    Declarative catalog of the domain problems of an API.
+
+    Each problem is registered as the runtime template of its exception class, and documented as
+    a components/schemas entry (the ProblemDetails members narrowed to its status and type, plus the
+    fields of its extras model) and a reusable components/responses entry. The rendered OpenAPI
+    fragments are built once and cached until the next declaration.
+    """
+
+    def __init__(self, registry: Optional[ProblemRegistry] = None, media_types: Optional[Tuple[str, ...]] = None):
         """
-        Transform the ProblemDetailsError into a JSON string.
+        Initialize a ProblemCatalog.
 
         Parameters
         ----------
-        with_traceback : bool, optional
-            If True, include the last exception traceback (default is None).
+        registry : Optional[ProblemRegistry], optional
+            The registry receiving the templates (default is None, PROBLEM_REGISTRY).
+        media_types : Optional[Tuple[str, ...]], optional
+            The media types documented for the problem responses (default is None, PROBLEM_JSON only).
+        """
+        self.registry : ProblemRegistry = PROBLEM_REGISTRY if registry is None else registry
+        self.media_types : Tuple[str, ...] = (PROBLEM_JSON,) if media_types is None else tuple(media_types)
+        self._entries : Dict[type, CatalogEntry] = {}
+        self._schemas : Optional[Dict[str, dict]] = None
+        self._responses : Dict[Tuple[type, ...], Dict[str, dict]] = {}
+
+    def add(self, exception_class: type, status: int, title: str = None, type: str = None, detail: str = None,
+            extras_model: Optional[type] = None, name: str = None) -> CatalogEntry:
+        """
+        Declare a problem, and register its template for the exception class and its subclasses.
+
+        Parameters
+        ----------
+        exception_class : type
+            The exception class.
+        status : int
+            HTTP status code.
+        title : str, optional
+            A short, human-readable summary of the problem type (default is None, the class name).
+        type : str, optional
+            An absolute URI that identifies the problem type (default is None).
+        detail : str, optional
+            A fixed explanation of the problem (default is None, the exception message).
+        extras_model : Optional[type], optional
+            A pydantic model documenting the extension members of the problem (default is None).
+        name : str, optional
+            The name of the schema and response components (default is None, the class name).
 
         Returns
         -------
-        str
-            The problem details as a JSON string.
+        CatalogEntry
+            The declared problem.
+
+        Raises
+        ------
+        ValueError
+            If the name is not a valid component name.
         """
-        with_traceback : bool = WITH_TRACEBACK if with_traceback is None else with_traceback
-        
-        if with_traceback:
-            self.problem.traceback = traceback.format_exc()
-        return self.problem.model_dump_json(exclude_none=True)
+        name : str = exception_class.__name__ if name is None else name
+        if not _SCHEMA_NAME.match(name):
+            raise ValueError(f"Invalid component name: {name!r}")
+        template : ProblemTemplate = self.registry.register(exception_class, status, title=title, type=type, detail=detail)
+        entry : CatalogEntry = CatalogEntry(name, exception_class, template, extras_model)
+        self._entries[exception_class] = entry
+        self._schemas = None
+        self._responses = {}
+        return entry
+
+    def __iter__(self) -> Iterator[CatalogEntry]:
+        return iter(self._entries.values())
 
-    def to_http_response(self, with_traceback: bool = None) -> Response:
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schemas(self) -> Dict[str, dict]:
         """
-        Transform the ProblemDetailsError into an HTTP response.
+        Render the components/schemas entries: ProblemDetails, one per problem and the
+        definitions nested in the extras models.
+
+        Returns
+        -------
+        Dict[str, dict]
+            The JSON schemas by name, shared between calls.
+        """
+        if self._schemas is not None:
+            return self._schemas
+        schemas : Dict[str, dict] = {}
+        base : dict = _problem_details_model().model_json_schema(ref_template=_SCHEMA_REF)
+        schemas["ProblemDetails"] = base
+        for entry in self._entries.values():
+            template : ProblemTemplate = entry.template
+            properties : dict = {"status": {"type": "integer", "enum": [template.status]},
+                                 "title": {"type": "string", "example": template.title}}
+            if template.type is not None:
+                properties["type"] = {"type": "string", "format": "uri", "enum": [template.type]}
+            required : List[str] = []
+            if entry.extras_model is not None:
+                extras : dict = entry.extras_model.model_json_schema(ref_template=_SCHEMA_REF, mode="serialization")
+                schemas.update(extras.pop("$defs", {}))
+                properties.update(extras.get("properties", {}))
+                required = extras.get("required", [])
+            narrowed : dict = {"type": "object", "properties": properties}
+            if required:
+                narrowed["required"] = required
+            schemas[entry.name] = {"title": entry.name, "description": template.title,
+                                   "allOf": [{"$ref": _SCHEMA_REF.format(model="ProblemDetails")}, narrowed]}
+        self._schemas = schemas
+        return schemas
+
+    def _response(self, entries: List[CatalogEntry]) -> dict:
+        refs : List[dict] = [{"$ref": _SCHEMA_REF.format(model=entry.name)} for entry in entries]
+        schema : dict = refs[0] if len(refs) == 1 else {"oneOf": refs}
+        return {"description": " / ".join(entry.template.title for entry in entries),
+                "content": {media_type: {"schema": schema} for media_type in self.media_types}}
+
+    def responses(self, *exception_classes: type) -> Dict[str, dict]:
+        """
+        Render the responses of a route raising the given problems, grouped by status, e.g. for
+        the responses argument of the flask-openapi3 route decorators.
 
         Parameters
         ----------
-        with_traceback : bool, optional
-            If True, include the last exception traceback (default is None).
+        *exception_classes : type
+            The declared exception classes, all of them when omitted.
 
         Returns
         -------
-        Response
-            The problem details as an HTTP response.
+        Dict[str, dict]
+            The response objects by status code, shared between calls with the same classes.
+
+        Raises
+        ------
+        KeyError
+            If an exception class is not declared.
+        """
+        try:
+            return self._responses[exception_classes]
+        except KeyError:
+            pass
+        entries : Iterable[CatalogEntry] = [self._entries[cls] for cls in exception_classes] if exception_classes else self
+        by_status : Dict[str, List[CatalogEntry]] = {}
+        for entry in entries:
+            by_status.setdefault(str(entry.template.status), []).append(entry)
+        responses : Dict[str, dict] = {status: self._response(grouped) for status, grouped in by_status.items()}
+        self._responses[exception_classes] = responses
+        return responses
+
+    def components_responses(self) -> Dict[str, dict]:
+        """
+        Render the reusable components/responses entries, one per problem.
+
+        Returns
+        -------
+        Dict[str, dict]
+            The response objects by name.
+        """
+        return {entry.name: self._response([entry]) for entry in self._entries.values()}
+
+    def install(self, app: OpenAPI):
+        """
+        Add the schemas and the reusable responses of the catalog to the components of an OpenAPI app.
+
+        Parameters
+        ----------
+        app : OpenAPI
+            The flask-openapi3 application, configure_app calls it for ProblemDetailsConfig.catalog.
         """
-        with_traceback : bool = WITH_TRACEBACK if with_traceback is None else with_traceback
-        return Response(status=self.problem.status, response=self.to_json(with_traceback), mimetype="application/problem+json")
\ No newline at end of file
+        from flask_openapi3.models import Schema, Response as OpenAPIResponse
+        app.components_schemas.update({name: Schema(**schema) for name, schema in self.schemas().items()})
+        app.components.responses = {**(app.components.responses or {}),
+                                     **{name: OpenAPIResponse(**response) for name, response in self.components_responses().items()}}
+        app.spec_json = {}
+
+def from_exception(exception: Exception, extras: dict = {}) -> ProblemDetailsError:
+    """
+    Create a ProblemDetailsError from an exception.
+
+    Parameters
+    ----------
+    exception : Exception
+        The exception that caused the problem.
+    extras : dict, optional
+        Additional information to include in the problem details (default is {}).
+
+    Returns
+    -------
+    ProblemDetailsError
+        The created ProblemDetailsError instance.
+    """
+    template : Optional[ProblemTemplate] = PROBLEM_REGISTRY.lookup(exception.__class__)
+    problem_type : Optional[str] = None
+    if template is not None:
+        status, title, problem_type = template.status, template.title, template.type
+        if template.detail is not None:
+            detail = template.detail
+        else:
+            detail = exception.description if isinstance(exception, HTTPException) else str(exception)
+        if template.extras:
+            extras = {**template.extras, **extras}
+    elif isinstance(exception, HTTPException):
+        status, title, detail = exception.code, exception.__class__.__name__, exception.description
+    else:
+        status, title, detail = InternalServerError.code, InternalServerError.__name__, str(exception)
+    
+    if _CORE_FIELDS.isdisjoint(extras):
+        problem = TrustedProblemDetails(status=status, title=title, detail=detail, type=problem_type, extras=extras)
+    elif problem_type is None:
+        problem = _problem_details_model()(status=status, title=title, detail=detail, **extras)
+    else:
+        problem = _problem_details_model()(status=status, title=title, detail=detail, type=problem_type, **extras)
+    
+    return ProblemDetailsError(problem=problem, exception=exception)
+
+def compact_validation_errors(errors: List[dict], input_max_length: int = 0) -> List[dict]:
+    """
+    Group pydantic validation errors by (type, msg), collapsing the common prefix of their locations.
+
+    For instance, a thousand "int_parsing" errors on body.items.0 ... body.items.999 become
+    {"type": "int_parsing", "msg": "...", "count": 1000, "loc": ["body", "items"], "locs": [0, ..., 999]}.
+
+    Parameters
+    ----------
+    errors : List[dict]
+        The errors, as returned by ValidationError.errors().
+    input_max_length : int, optional
+        The maximum length of the one "input" sample kept per group, zero drops it (default is 0).
+
+    Returns
+    -------
+    List[dict]
+        The groups, in order of first occurrence.
+    """
+    groups : Dict[Tuple[str, str], dict] = {}
+    for error in errors:
+        key : Tuple[str, str] = (error["type"], error["msg"])
+        group : Optional[dict] = groups.get(key)
+        if group is None:
+            group = groups[key] = {"type": key[0], "msg": key[1], "count": 0, "locs": []}
+            if input_max_length > 0 and "input" in error:
+                group["input"] = str(error["input"])[:input_max_length]
+        group["count"] += 1
+        group["locs"].append(tuple(error["loc"]))
+    
+    for group in groups.values():
+        locs : List[tuple] = group.pop("locs")
+        prefix : tuple = locs[0]
+        for loc in locs[1:]:
+            if loc[:len(prefix)] != prefix:
+                size : int = 0
+                while size < len(prefix) and size < len(loc) and prefix[size] == loc[size]:
+                    size += 1
+                prefix = prefix[:size]
+        group["loc"] = list(prefix)
+        suffixes : list = [loc[len(prefix):] for loc in locs]
+        if any(suffixes):
+            group["locs"] = [suffix[0] if len(suffix) == 1 else list(suffix) for suffix in suffixes]
+    return list(groups.values())
+
+class ExtrasLimits(NamedTuple):
+    """
+    Bounds of the rendering of the extension members, see bound_extras.
+    """
+    max_depth: int = 4
+    max_items: int = 100
+    max_string: int = 1024
+    max_bytes: int = 65536
+
+def bound_extras(extras: dict, limits: ExtrasLimits = ExtrasLimits()) -> dict:
+    """
+    Render extension members of arbitrary objects into JSON-compatible values, within limits.
+
+    Strings longer than max_string are cut, containers keep their first max_items items, and
+    the values nested deeper than max_depth and the cycles are replaced by short summaries.
+    The objects that are not JSON-like are summarized as "<Class object>" without calling
+    their repr(), which may cost anything; only bytes, exceptions, classes and complex
+    numbers get a bounded repr. Every rendered value is charged to the max_bytes budget,
+    about its JSON size; once it is spent the remaining items are left out. Cut containers
+    end with a "..." member or item counting the omitted items.
+
+    Parameters
+    ----------
+    extras : dict
+        The extension members.
+    limits : ExtrasLimits, optional
+        The limits (default is ExtrasLimits()).
+
+    Returns
+    -------
+    dict
+        The bounded extension members.
+    """
+    budget : List[int] = [limits.max_bytes]
+    path : set = set()
+    def text(value: str, cut: bool = True) -> str:
+        if cut and len(value) > limits.max_string:
+            value = f"{value[:limits.max_string]}...(+{len(value) - limits.max_string} chars)"
+        budget[0] -= len(value) + 2
+        return value
+
+    def scalar(value: object) -> str:
+        if isinstance(value, str):
+            return repr(value[:limits.max_string]) + ("..." if len(value) > limits.max_string else "")
+        if isinstance(value, (bytes, bytearray)):
+            return repr(bytes(value[:limits.max_string])) + ("..." if len(value) > limits.max_string else "")
+        if value is None or value.__class__ in (bool, int, float, complex):
+            return repr(value)
+        if isinstance(value, type):
+            return f"<class {value.__qualname__}>"
+        return f"<{value.__class__.__qualname__} object>"
+
+    def label(key: object) -> str:
+        if key is None or isinstance(key, (int, float, Enum, UUID, Decimal, date, datetime_time)):
+            return str(key)
+        return scalar(key)
+
+    def summarize(value: object) -> str:
+        if isinstance(value, BaseException):
+            arguments : tuple = value.args if isinstance(value.args, tuple) else ()
+            listed : str = ", ".join(scalar(argument) for argument in arguments[:limits.max_items])
+            return text(f"{value.__class__.__qualname__}({listed}{', ...' if len(arguments) > limits.max_items else ''})")
+        return text(scalar(value))
+
+    def items(value: object) -> Optional[Iterable[Tuple[object, object]]]:
+        if isinstance(value, Mapping):
+            return value.items()
+        if hasattr(value.__class__, "model_fields") and hasattr(value, "__iter__"):
+            return iter(value)
+        if is_dataclass(value) and not isinstance(value, type):
+            return ((item.name, getattr(value, item.name)) for item in fields(value))
+        return None
+
+    def bound(value: object, depth: int) -> object:
+        cls : type = value.__class__
+        if value is None or cls is bool:
+            budget[0] -= 5
+            return value
+        if cls is int or cls is float:
+            budget[0] -= 8
+            return value
+        if isinstance(value, str):
+            return text(str(value))
+        if isinstance(value, (bool, int, float)):
+            budget[0] -= 8
+            return value
+        if isinstance(value, Enum):
+            return bound(value.value, depth)
+        if isinstance(value, (date, datetime_time)):
+            return text(value.isoformat())
+        if isinstance(value, (UUID, Decimal)) or cls.__module__ in ("pydantic.networks", "pydantic_core._pydantic_core"):
+            return text(str(value))
+        members : Optional[Iterable[Tuple[object, object]]] = items(value)
+        sequence : bool = members is None and isinstance(value, (list, tuple, set, frozenset, deque))
+        if members is None and not sequence:
+            return summarize(value)
+        if id(value) in path:
+            return text(f"<cycle {cls.__qualname__}>", False)
+        if depth >= limits.max_depth:
+            size : str = f" of {len(value)} items" if hasattr(value, "__len__") else ""
+            return text(f"<{cls.__qualname__}{size}>", False)
+        path.add(id(value))
+        budget[0] -= 2
+        try:
+            if sequence:
+                result : list = []
+                for count, item in enumerate(value):
+                    if count == limits.max_items or budget[0] <= 0:
+                        result.append(f"... +{len(value) - count} items")
+                        break
+                    result.append(bound(item, depth + 1))
+                return result
+            result : dict = {}
+            for count, (key, item) in enumerate(members):
+                if count == limits.max_items or budget[0] <= 0:
+                    size : str = f"+{len(value) - count} items" if hasattr(value, "__len__") else "more items"
+                    result["..."] = size
+                    break
+                result[text(key if isinstance(key, str) else label(key))] = bound(item, depth + 1)
+            return result
+        finally:
+            path.discard(id(value))
+
+    return bound(extras, 0)
+
+def format_traceback(exception: Optional[BaseException], tb: Optional[TracebackType], limit: Optional[int] = None,
+                     max_bytes: Optional[int] = None, summary: bool = False) -> str:
+    """
+    Format a traceback object into a string, applying frame-depth and byte-size limits.
+
+    Parameters
+    ----------
+    exception : Optional[BaseException]
+        The exception the traceback belongs to.
+    tb : Optional[TracebackType]
+        The raw traceback object.
+    limit : int, optional
+        Maximum number of frames to include, keeping the innermost ones (default is None, no limit).
+    max_bytes : int, optional
+        Maximum size in bytes of the result, keeping its tail (default is None, no limit).
+    summary : bool, optional
+        If True, render one compact "file:line in function" entry per frame (default is False).
+
+    Returns
+    -------
+    str
+        The formatted traceback.
+    """
+    frame_limit : Optional[int] = -limit if limit else None
+    if summary:
+        frames = traceback.extract_tb(tb, limit=frame_limit)
+        lines = [f"{frame.filename}:{frame.lineno} in {frame.name}" for frame in frames]
+        lines.extend(traceback.format_exception_only(type(exception), exception))
+        formatted : str = "\n".join(line.rstrip("\n") for line in lines)
+    else:
+        formatted : str = "".join(traceback.format_exception(type(exception), exception, tb, limit=frame_limit))
+    
+    if max_bytes is not None:
+        encoded : bytes = formatted.encode()
+        if len(encoded) > max_bytes:
+            #the "..." marker counts in max_bytes
+            kept : int = max(max_bytes - 3, 0)
+            formatted = "..."[:max_bytes] + encoded[len(encoded) - kept:].decode(errors="ignore")
+    return formatted
+
+def traceback_signature(exception: Optional[BaseException], tb: Optional[TracebackType]) -> str:
+    """
+    Build the signature of an exception occurrence: its class and the location it was raised from.
+
+    Parameters
+    ----------
+    exception : Optional[BaseException]
+        The exception.
+    tb : Optional[TracebackType]
+        The raw traceback object.
+
+    Returns
+    -------
+    str
+        The signature, "module.Class@file:line".
+    """
+    exception_class : type = exception.__class__
+    if tb is None:
+        return f"{exception_class.__module__}.{exception_class.__qualname__}"
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    return f"{exception_class.__module__}.{exception_class.__qualname__}@{tb.tb_frame.f_code.co_filename}:{tb.tb_lineno}"
+
+def signature_id(signature: str) -> str:
+    """
+    Build a short, stable identifier of a signature.
+
+    Parameters
+    ----------
+    signature : str
+        The signature.
+
+    Returns
+    -------
+    str
+        16 hexadecimal characters.
+    """
+    return blake2b(signature.encode(), digest_size=8).hexdigest()
+
+_VOLATILE_TEXT : re.Pattern = re.compile(
+    r"0x[0-9a-fA-F]+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+|'[^']*'|\"[^\"]*\"")
+
+def normalize_message(message: str, max_length: int = 256) -> str:
+    """
+    Replace the volatile parts of an exception message (numbers, addresses, UUIDs, quoted values) by "?".
+
+    Parameters
+    ----------
+    message : str
+        The exception message.
+    max_length : int, optional
+        The maximum length of the normalized message (default is 256).
+
+    Returns
+    -------
+    str
+        The normalized message.
+    """
+    return _VOLATILE_TEXT.sub("?", message[:max_length * 4])[:max_length]
+
+def exception_fingerprint(exception: Optional[BaseException], tb: Optional[TracebackType], frames: int = 3) -> str:
+    """
+    Compute a stable fingerprint of an exception occurrence from its class, its normalized
+    message and the file and function of its innermost frames. Line numbers are left out,
+    so the fingerprint survives unrelated edits of the same file.
+
+    Parameters
+    ----------
+    exception : Optional[BaseException]
+        The exception.
+    tb : Optional[TracebackType]
+        The raw traceback object.
+    frames : int, optional
+        The number of innermost frames included (default is 3).
+
+    Returns
+    -------
+    str
+        16 hexadecimal characters.
+    """
+    exception_class : type = exception.__class__
+    innermost : deque = deque(maxlen=frames)
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        innermost.append(f"{code.co_filename}:{code.co_name}")
+        tb = tb.tb_next
+    parts : List[str] = [f"{exception_class.__module__}.{exception_class.__qualname__}", normalize_message(str(exception)), *innermost]
+    return signature_id("|".join(parts))
+
+class ProblemAggregator:
+    """
+    Bounded in-process store aggregating problem occurrences by fingerprint, with their count,
+    first and last occurrence time and one sample traceback. Entries are flushed in batches to a
+    sink, instead of logging one record per error.
+    """
+
+    def __init__(self, sink: Callable[[List[dict]], None] = None, max_entries: int = 1024):
+        """
+        Initialize a ProblemAggregator.
+
+        Parameters
+        ----------
+        sink : Callable[[List[dict]], None], optional
+            The function receiving each flushed batch (default is None, batches are only returned by flush).
+        max_entries : int, optional
+            The maximum number of fingerprints kept between flushes, the least recently seen is
+            evicted and counted in "evicted" (default is 1024).
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries must be a positive integer")
+        self.sink : Optional[Callable[[List[dict]], None]] = sink
+        self.max_entries : int = max_entries
+        self.evicted : int = 0
+        self._entries : OrderedDict = OrderedDict()
+        self._lock : Lock = Lock()
+        self._stop : Optional[Event] = None
+        self._thread : Optional[Thread] = None
+
+    def record(self, problem: ProblemDetailsError, settings: ProblemDetailsSettings = None):
+        """
+        Record one occurrence of a problem.
+
+        Parameters
+        ----------
+        problem : ProblemDetailsError
+            The problem.
+        settings : ProblemDetailsSettings, optional
+            The settings used to format the sample traceback of a new fingerprint (default is None).
+        """
+        fingerprint : str = problem.fingerprint()
+        now : float = time()
+        with self._lock:
+            entry : Optional[dict] = self._entries.get(fingerprint)
+            if entry is not None:
+                entry["count"] += 1
+                entry["last_seen"] = now
+                self._entries.move_to_end(fingerprint)
+                return
+        # a new fingerprint: format its sample traceback outside of the lock
+        exception : BaseException = problem.inner_exception or problem
+        entry = {"fingerprint": fingerprint, "exception": f"{exception.__class__.__module__}.{exception.__class__.__qualname__}",
+                 "status": problem.problem.status, "title": problem.problem.title, "detail": problem.problem.detail,
+                 "count": 1, "first_seen": now, "last_seen": now, "traceback": problem.format_traceback(settings)}
+        with self._lock:
+            existing : Optional[dict] = self._entries.get(fingerprint)
+            if existing is not None:
+                existing["count"] += 1
+                existing["last_seen"] = now
+                return
+            self._entries[fingerprint] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def flush(self) -> List[dict]:
+        """
+        Remove the aggregated entries and pass them to the sink.
+
+        Returns
+        -------
+        List[dict]
+            The flushed entries.
+        """
+        with self._lock:
+            batch : List[dict] = list(self._entries.values())
+            self._entries = OrderedDict()
+        if batch and self.sink is not None:
+            self.sink(batch)
+        return batch
+
+    def start(self, interval: float = 60.0):
+        """
+        Flush periodically from a daemon thread.
+
+        Parameters
+        ----------
+        interval : float, optional
+            The time in seconds between flushes (default is 60.0).
+        """
+        if self._thread is not None:
+            return
+        self._stop = Event()
+        def run():
+            while not self._stop.wait(interval):
+                self.flush()
+        self._thread = Thread(target=run, name="problem-aggregator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the periodic flush and flush the remaining entries.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+def jsonl_sink(stream: IO[str]) -> Callable[[List[dict]], None]:
+    """
+    Build a sink writing each entry of a batch as one JSON line.
+
+    Parameters
+    ----------
+    stream : IO[str]
+        The text stream, e.g. an open log file or sys.stdout.
+
+    Returns
+    -------
+    Callable[[List[dict]], None]
+        The sink.
+    """
+    def write(batch: List[dict]):
+        stream.write("".join(json.dumps(entry, default=str) + "\n" for entry in batch))
+        stream.flush()
+    return write
+
+def problem_record(problem: ProblemDetailsError) -> dict:
+    """
+    Build the report record of a problem from values already computed for its response.
+
+    Parameters
+    ----------
+    problem : ProblemDetailsError
+        The problem.
+
+    Returns
+    -------
+    dict
+        The record: time, exception class, status, title, detail and the traceback if it was rendered.
+    """
+    exception : BaseException = problem.inner_exception or problem
+    record : dict = {"time": time(), "exception": f"{exception.__class__.__module__}.{exception.__class__.__qualname__}",
+                     "status": problem.problem.status, "title": problem.problem.title, "detail": problem.problem.detail}
+    if problem.problem.traceback is not None:
+        record["traceback"] = problem.problem.traceback
+    return record
+
+def http_sink(url: str, timeout: float = 5.0) -> Callable[[List[dict]], None]:
+    """
+    Build a sink posting each batch as a JSON array to an HTTP endpoint.
+
+    Parameters
+    ----------
+    url : str
+        The endpoint URL.
+    timeout : float, optional
+        The request timeout in seconds (default is 5.0).
+
+    Returns
+    -------
+    Callable[[List[dict]], None]
+        The sink.
+    """
+    def post(batch: List[dict]):
+        import urllib.request
+        data : bytes = json.dumps(batch, default=str).encode()
+        http_request = urllib.request.Request(url, data=data, method="POST", headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            response.read()
+    return post
+
+class ProblemReporter:
+    """
+    Reports problem records from a background thread, so reporting never lengthens the error responses.
+
+    Records are queued in a bounded queue, dropping the oldest ones when it is full, and passed
+    to the sink in batches of up to batch_size records, or after flush_interval seconds. The
+    worker thread is restarted in forked processes, on platforms that fork.
+    """
+
+    def __init__(self, sink: Callable[[List[dict]], None], max_queue: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 1.0):
+        """
+        Initialize a ProblemReporter and start its worker thread.
+
+        Parameters
+        ----------
+        sink : Callable[[List[dict]], None]
+            The function receiving each batch, e.g. jsonl_sink or http_sink.
+        max_queue : int, optional
+            The maximum number of queued records (default is 10000).
+        batch_size : int, optional
+            The maximum number of records per batch (default is 100).
+        flush_interval : float, optional
+            The maximum time in seconds a record waits for its batch to fill up (default is 1.0).
+        """
+        if max_queue <= 0 or batch_size <= 0:
+            raise ValueError("max_queue and batch_size must be positive integers")
+        self.sink : Callable[[List[dict]], None] = sink
+        self.batch_size : int = batch_size
+        self.flush_interval : float = flush_interval
+        self.submitted : int = 0
+        self.dropped : int = 0
+        self.reported : int = 0
+        self.failed : int = 0
+        self._queue : deque = deque(maxlen=max_queue)
+        self._condition : Condition = Condition()
+        self._closed : bool = False
+        self._thread : Thread = Thread(target=self._run, name="problem-reporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        _REPORTERS.add(self)
+
+    def submit(self, record: dict):
+        """
+        Queue a record, dropping the oldest queued one if the queue is full.
+
+        Parameters
+        ----------
+        record : dict
+            The record, e.g. built by problem_record.
+        """
+        with self._condition:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(record)
+            self.submitted += 1
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._condition.notify()
+
+    def _next_batch(self) -> List[dict]:
+        deadline : Optional[float] = None
+        with self._condition:
+            while not self._closed and len(self._queue) < self.batch_size:
+                if not self._queue:
+                    deadline = None
+                    self._condition.wait()
+                    continue
+                if deadline is None:
+                    deadline = monotonic() + self.flush_interval
+                remaining : float = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch : List[dict] = self._next_batch()
+            if not batch:
+                return
+            try:
+                self.sink(batch)
+                self.reported += len(batch)
+            except Exception:
+                self.failed += len(batch)
+
+    def after_fork(self):
+        """
+        Restart the worker thread in a forked process, dropping the records queued by the parent.
+
+        Does nothing while the worker thread is alive or after close.
+        """
+        if self._closed or self._thread.is_alive():
+            return
+        self._queue.clear()
+        self._condition = Condition()
+        self._thread = Thread(target=self._run, name="problem-reporter", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop accepting records, report the queued ones and stop the worker thread.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time in seconds to wait for the queued records (default is 5.0).
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+#the reporters alive in this process, their worker thread does not survive a fork
+_REPORTERS : weakref.WeakSet = weakref.WeakSet()
+
+def _restart_reporters():
+    for reporter in list(_REPORTERS):
+        reporter.after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_reporters)
+
+class ProblemLogger:
+    """
+    Structured logger writing one JSON line per problem response, with the request context.
+
+    The line embeds the exact JSON body of the response, so logging a problem does not serialize
+    it again. Lines are written by a ProblemReporter, in batches from its background thread, so
+    the handlers never wait for the stream.
+    """
+
+    def __init__(self, stream: IO[bytes], min_status: int = 500, request_id_header: str = "X-Request-ID",
+                 max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 1.0):
+        """
+        Initialize a ProblemLogger and start its writer thread.
+
+        Parameters
+        ----------
+        stream : IO[bytes]
+            The binary stream, e.g. a log file opened in "ab" mode or sys.stdout.buffer.
+        min_status : int, optional
+            The lowest status of the logged responses (default is 500).
+        request_id_header : str, optional
+            The request header holding the request id (default is "X-Request-ID").
+        max_queue : int, optional
+            The maximum number of queued lines, the oldest are dropped first (default is 10000).
+        batch_size : int, optional
+            The maximum number of lines per write (default is 100).
+        flush_interval : float, optional
+            The maximum time in seconds a line waits for its batch to fill up (default is 1.0).
+        """
+        self.min_status : int = min_status
+        self.request_id_header : str = request_id_header
+        self.reporter : ProblemReporter = ProblemReporter(self._writer(stream), max_queue=max_queue,
+                                                          batch_size=batch_size, flush_interval=flush_interval)
+
+    @staticmethod
+    def _writer(stream: IO[bytes]) -> Callable[[List[bytes]], None]:
+        def write(batch: List[bytes]):
+            stream.write(b"".join(batch))
+            stream.flush()
+        return write
+
+    def log(self, body: bytes, status: int, method: str, path: str, request_id: Optional[str] = None):
+        """
+        Queue the line of a problem response.
+
+        Parameters
+        ----------
+        body : bytes
+            The JSON body of the response, embedded as is.
+        status : int
+            The status of the response.
+        method : str
+            The request method.
+        path : str
+            The request path.
+        request_id : Optional[str], optional
+            The request id (default is None).
+        """
+        line : str = ('{"time":' + repr(time()) + ',"method":' + _encode_string(method) + ',"path":' + _encode_string(path)
+                      + ',"request_id":' + ("null" if request_id is None else _encode_string(request_id))
+                      + ',"status":' + str(status) + ',"problem":')
+        self.reporter.submit(line.encode() + body + b"}\n")
+
+    def close(self, timeout: float = 5.0):
+        """
+        Write the queued lines and stop the writer thread, see ProblemReporter.close.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time in seconds to wait for the queued lines (default is 5.0).
+        """
+        self.reporter.close(timeout)
+
+class TracebackSampler:
+    """
+    Token bucket per exception signature: up to burst tracebacks per signature, refilled
+    at burst per window seconds. Occurrences without a token only get the signature id.
+    """
+
+    def __init__(self, burst: int = 5, window: float = 60.0, max_signatures: int = 1024):
+        """
+        Initialize a TracebackSampler.
+
+        Parameters
+        ----------
+        burst : int, optional
+            The number of tracebacks allowed per signature and window (default is 5).
+        window : float, optional
+            The window in seconds (default is 60.0).
+        max_signatures : int, optional
+            The maximum number of tracked signatures, the least recently seen is forgotten (default is 1024).
+        """
+        if burst <= 0 or window <= 0 or max_signatures <= 0:
+            raise ValueError("burst, window and max_signatures must be positive")
+        self.burst : int = burst
+        self.rate : float = burst / window
+        self.max_signatures : int = max_signatures
+        self._buckets : OrderedDict = OrderedDict()
+        self._lock : Lock = Lock()
+
+    def allow(self, signature: str, now: float = None) -> bool:
+        """
+        Take a token from the bucket of a signature.
+
+        Parameters
+        ----------
+        signature : str
+            The exception signature.
+        now : float, optional
+            The current monotonic time (default is None, time.monotonic()).
+
+        Returns
+        -------
+        bool
+            True if the traceback of this occurrence should be included.
+        """
+        now : float = monotonic() if now is None else now
+        with self._lock:
+            bucket : Optional[list] = self._buckets.get(signature)
+            if bucket is None:
+                bucket = self._buckets[signature] = [float(self.burst), now]
+                if len(self._buckets) > self.max_signatures:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(signature)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return True
+            return False
+
+class ProblemEvent(NamedTuple):
+    """
+    One problem response, as passed to the ProblemMetrics subscribers.
+    """
+    status: int
+    exception: str
+    seconds: float
+    traceback_bytes: int
+
+class _ThreadMetrics:
+    """
+    Counters of one thread, only written by that thread.
+    """
+    __slots__ = ("responses", "buckets", "seconds", "traceback_bytes")
+
+    def __init__(self, bucket_count: int):
+        self.responses : Dict[Tuple[int, str], int] = {}
+        self.buckets : List[int] = [0] * bucket_count
+        self.seconds : float = 0.0
+        self.traceback_bytes : int = 0
+
+    def add(self, other: _ThreadMetrics):
+        """
+        Add the counters of another thread, which may still be writing them.
+
+        Parameters
+        ----------
+        other : _ThreadMetrics
+            The counters to add.
+        """
+        for key, count in other.responses.copy().items():
+            self.responses[key] = self.responses.get(key, 0) + count
+        for index, count in enumerate(list(other.buckets)):
+            self.buckets[index] += count
+        self.seconds += other.seconds
+        self.traceback_bytes += other.traceback_bytes
+
+class _ThreadSentinel:
+    """
+    Weak-referenceable marker kept in the thread local storage, collected when its thread exits.
+    """
+    __slots__ = ("__weakref__",)
+
+class ProblemMetrics:
+    """
+    Error-path metrics: responses by status and exception class, a histogram of the time spent
+    building problem responses and the total size of the rendered tracebacks.
+
+    Each thread writes its own counters without locking, they are merged when read.
+    The counters of exited threads are folded into a shared total.
+    """
+    BUCKETS : Tuple[float, ...] = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, float("inf"))
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        """
+        Initialize a ProblemMetrics.
+
+        Parameters
+        ----------
+        buckets : Tuple[float, ...], optional
+            The upper bounds in seconds of the histogram buckets, ending with infinity (default is BUCKETS).
+        """
+        self.buckets : Tuple[float, ...] = buckets
+        self._local : local = local()
+        self._threads : List[_ThreadMetrics] = []
+        self._retired : _ThreadMetrics = _ThreadMetrics(len(buckets))
+        self._lock : Lock = Lock()
+        self._subscribers : List[Callable[[ProblemEvent], None]] = []
+
+    def subscribe(self, callback: Callable[[ProblemEvent], None]):
+        """
+        Call a function with a ProblemEvent after each problem response.
+
+        Parameters
+        ----------
+        callback : Callable[[ProblemEvent], None]
+            The function to call, on the request thread.
+        """
+        self._subscribers.append(callback)
+
+    def _thread_metrics(self) -> _ThreadMetrics:
+        metrics : Optional[_ThreadMetrics] = getattr(self._local, "metrics", None)
+        if metrics is None:
+            metrics = self._local.metrics = _ThreadMetrics(len(self.buckets))
+            sentinel : _ThreadSentinel = _ThreadSentinel()
+            self._local.sentinel = sentinel
+            weakref.finalize(sentinel, ProblemMetrics._retire, weakref.ref(self), metrics).atexit = False
+            with self._lock:
+                self._threads.append(metrics)
+        return metrics
+
+    @staticmethod
+    def _retire(reference: weakref.ref, metrics: _ThreadMetrics):
+        #called when the thread of the metrics exits, it does not write them anymore
+        self : Optional[ProblemMetrics] = reference()
+        if self is None:
+            return
+        with self._lock:
+            self._threads.remove(metrics)
+            self._retired.add(metrics)
+
+    def record(self, status: int, exception: str, seconds: float, traceback_bytes: int = 0):
+        """
+        Record one problem response.
+
+        Parameters
+        ----------
+        status : int
+            The HTTP status code.
+        exception : str
+            The name of the exception class.
+        seconds : float
+            The time spent building the response.
+        traceback_bytes : int, optional
+            The size of the rendered traceback (default is 0).
+        """
+        metrics : _ThreadMetrics = self._thread_metrics()
+        key : Tuple[int, str] = (status, exception)
+        metrics.responses[key] = metrics.responses.get(key, 0) + 1
+        metrics.buckets[bisect_left(self.buckets, seconds)] += 1
+        metrics.seconds += seconds
+        metrics.traceback_bytes += traceback_bytes
+        if self._subscribers:
+            event : ProblemEvent = ProblemEvent(status, exception, seconds, traceback_bytes)
+            for callback in self._subscribers:
+                callback(event)
+
+    def observe(self, exception: BaseException, response: Response, started: float, problem: Optional[ProblemDetailsError] = None):
+        """
+        Record the response built by an error handler.
+
+        Parameters
+        ----------
+        exception : BaseException
+            The handled exception.
+        response : Response
+            The problem response.
+        started : float
+            The perf_counter value when the handler started.
+        problem : ProblemDetailsError, optional
+            The problem, used to measure the rendered traceback (default is None).
+        """
+        rendered : Optional[str] = problem.problem.traceback if problem is not None else None
+        self.record(response.status_code, exception.__class__.__name__, perf_counter() - started,
+                    len(rendered.encode()) if rendered else 0)
+
+    def snapshot(self) -> dict:
+        """
+        Merge the counters of every thread.
+
+        Returns
+        -------
+        dict
+            The "responses" counts by (status, exception), the per-bucket (not cumulative) "buckets" counts,
+            the "seconds" sum, the response "count" and the "traceback_bytes" total.
+        """
+        total : _ThreadMetrics = _ThreadMetrics(len(self.buckets))
+        with self._lock:
+            threads : List[_ThreadMetrics] = list(self._threads)
+            total.add(self._retired)
+        for metrics in threads:
+            total.add(metrics)
+        return {"responses": total.responses, "buckets": total.buckets, "seconds": total.seconds,
+                "count": sum(total.buckets), "traceback_bytes": total.traceback_bytes}
+
+    def to_prometheus(self, prefix: str = "problem_details") -> str:
+        """
+        Export the metrics in the Prometheus text format.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            The prefix of the metric names (default is "problem_details").
+
+        Returns
+        -------
+        str
+            The metrics in the Prometheus text exposition format.
+        """
+        snapshot : dict = self.snapshot()
+        lines : List[str] = [
+            f"# HELP {prefix}_responses_total Problem responses by status and exception class.",
+            f"# TYPE {prefix}_responses_total counter"]
+        for (status, exception), count in sorted(snapshot["responses"].items()):
+            lines.append(f'{prefix}_responses_total{{status="{status}",exception="{exception}"}} {count}')
+        lines.extend([
+            f"# HELP {prefix}_serialization_seconds Time spent building problem responses.",
+            f"# TYPE {prefix}_serialization_seconds histogram"])
+        cumulative : int = 0
+        for bound, count in zip(self.buckets, snapshot["buckets"]):
+            cumulative += count
+            lines.append(f'{prefix}_serialization_seconds_bucket{{le="{"+Inf" if bound == float("inf") else repr(bound)}"}} {cumulative}')
+        lines.extend([
+            f"{prefix}_serialization_seconds_sum {snapshot['seconds']!r}",
+            f"{prefix}_serialization_seconds_count {snapshot['count']}",
+            f"# HELP {prefix}_traceback_bytes_total Size of the tracebacks rendered in problem responses.",
+            f"# TYPE {prefix}_traceback_bytes_total counter",
+            f"{prefix}_traceback_bytes_total {snapshot['traceback_bytes']}"])
+        return "\n".join(lines) + "\n"
+
+PROBLEM_JSON : str = "application/problem+json"
+PROBLEM_XML : str = "application/problem+xml"
+PROBLEM_CBOR : str = "application/problem+cbor"
+PROBLEM_MSGPACK : str = "application/problem+msgpack"
+MEDIA_TYPES : Tuple[str, ...] = (PROBLEM_JSON, PROBLEM_XML, PROBLEM_CBOR, PROBLEM_MSGPACK)
+
+_XML_NAME_START : str = (r"A-Z_a-z\u00C0-\u00D6\u00D8-\u00F6\u00F8-\u02FF\u0370-\u037D\u037F-\u1FFF\u200C-\u200D"
+                         r"\u2070-\u218F\u2C00-\u2FEF\u3001-\uD7FF\uF900-\uFDCF\uFDF0-\uFFFD")
+#the XML Name production without ":", as an unbound namespace prefix is not well-formed either
+_XML_NAME : re.Pattern = re.compile(rf"[{_XML_NAME_START}][{_XML_NAME_START}\-.0-9\u00B7\u0300-\u036F\u203F-\u2040]*")
+_XML_INVALID_CHARACTERS : re.Pattern = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+def _xml_escape(text: str) -> str:
+    #xml.sax.saxutils imports urllib.request, which the module only loads for http_sink
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+    return _XML_INVALID_CHARACTERS.sub("\ufffd", text)
+
+def _xml_element(name: str, value: object, parts: List[str]):
+    if value is None:
+        return
+    if _XML_NAME.fullmatch(name):
+        parts.append(f"<{name}>")
+    else:
+        #keys echoed from the request (validation input, "..." of bounded extras) are not always XML names
+        parts.append(f'<member name="{_xml_escape(name)}">')
+        name = "member"
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _xml_element(str(key), item, parts)
+    elif isinstance(value, list):
+        for item in value:
+            _xml_element("i", item, parts)
+    elif isinstance(value, bool):
+        parts.append("true" if value else "false")
+    else:
+        parts.append(_xml_escape(str(value)))
+    parts.append(f"</{name}>")
+
+def xml_encode(data: dict) -> bytes:
+    """
+    Encode a JSON-compatible problem dictionary as described in RFC 7807 appendix A.
+
+    Parameters
+    ----------
+    data : dict
+        The problem details, with JSON-compatible values.
+
+    Returns
+    -------
+    bytes
+        The problem details as UTF-8 XML.
+    """
+    parts : List[str] = ['<?xml version="1.0" encoding="UTF-8"?><problem xmlns="urn:ietf:rfc:7807">']
+    for name, value in data.items():
+        _xml_element(name, value, parts)
+    parts.append("</problem>")
+    return "".join(parts).encode()
+
+@lru_cache(maxsize=None)
+def media_type_encoder(media_type: str) -> Callable[[dict], bytes]:
+    """
+    Select the encoder of a problem media type, once per media type.
+
+    Parameters
+    ----------
+    media_type : str
+        One of MEDIA_TYPES.
+
+    Returns
+    -------
+    Callable[[dict], bytes]
+        The encoder of JSON-compatible problem dictionaries.
+
+    Raises
+    ------
+    ImportError
+        If the library of the media type (cbor2, msgpack) is not installed.
+    ValueError
+        If the media type is unknown.
+    """
+    if media_type == PROBLEM_JSON:
+        return json_encoder("auto")
+    if media_type == PROBLEM_XML:
+        return xml_encode
+    if media_type == PROBLEM_CBOR:
+        import cbor2
+        return cbor2.dumps
+    if media_type == PROBLEM_MSGPACK:
+        import msgpack
+        return msgpack.Packer().pack
+    raise ValueError(f"Unknown problem media type: {media_type}")
+
+def available_media_types(media_types: Iterable[str] = MEDIA_TYPES) -> Tuple[str, ...]:
+    """
+    Keep the media types whose encoder can be loaded, with PROBLEM_JSON first.
+
+    Parameters
+    ----------
+    media_types : Iterable[str], optional
+        The wanted media types (default is MEDIA_TYPES).
+
+    Returns
+    -------
+    Tuple[str, ...]
+        The available media types.
+    """
+    available : List[str] = [PROBLEM_JSON]
+    for media_type in media_types:
+        if media_type in available:
+            continue
+        try:
+            media_type_encoder(media_type)
+        except ImportError:
+            continue
+        available.append(media_type)
+    return tuple(available)
+
+@lru_cache(maxsize=256)
+def negotiate_media_type(accept: str, media_types: Tuple[str, ...]) -> str:
+    """
+    Select the problem media type of a response from the Accept header of the request.
+
+    Parameters
+    ----------
+    accept : str
+        The Accept header.
+    media_types : Tuple[str, ...]
+        The offered media types, the first one is the default.
+
+    Returns
+    -------
+    str
+        The best match, or the first offered media type.
+    """
+    return parse_accept_header(accept, MIMEAccept).best_match(media_types, default=media_types[0])
+
+@lru_cache(maxsize=None)
+def _brotli() -> Optional[object]:
+    """
+    Import brotli on the first compression.
+
+    Returns
+    -------
+    Optional[object]
+        The brotli module, or None when it is not installed.
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+@lru_cache(maxsize=256)
+def negotiate_content_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Select the compression of a response from the Accept-Encoding header of the request.
+
+    Parameters
+    ----------
+    accept_encoding : str
+        The Accept-Encoding header.
+
+    Returns
+    -------
+    Optional[str]
+        "br" when brotli is installed and accepted, else "gzip" when accepted, else None.
+    """
+    accept = parse_accept_header(accept_encoding)
+    if accept["br"] > 0 and _brotli() is not None:
+        return "br"
+    if accept["gzip"] > 0:
+        return "gzip"
+    return None
+
+def compress_response(response: Response, accept_encoding: str, min_bytes: int = 1024) -> Response:
+    """
+    Compress the body of a response in place, when it is large enough and the client accepts it.
+
+    Parameters
+    ----------
+    response : Response
+        The response, not streamed.
+    accept_encoding : str
+        The Accept-Encoding header of the request.
+    min_bytes : int, optional
+        The minimum body size worth compressing (default is 1024).
+
+    Returns
+    -------
+    Response
+        The same response.
+    """
+    response.vary.add("Accept-Encoding")
+    if response.content_length is None or response.content_length < min_bytes:
+        return response
+    encoding : Optional[str] = negotiate_content_encoding(accept_encoding)
+    if encoding == "br":
+        response.set_data(_brotli().compress(response.get_data(), quality=4))
+    elif encoding == "gzip":
+        import gzip
+        response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+    else:
+        return response
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+class ProblemResponseCache:
+    """
+    Bounded LRU cache of serialized problem bodies for static HTTPException problems.
+    """
+
+    def __init__(self, max_size: int = 128):
+        """
+        Initialize a ProblemResponseCache.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            The maximum number of cached bodies before the least recently used is evicted (default is 128).
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be a positive integer")
+        self.max_size : int = max_size
+        self.hits : int = 0
+        self.misses : int = 0
+        self._entries : OrderedDict = OrderedDict()
+        self._lock : Lock = Lock()
+
+    @staticmethod
+    def key(exception: HTTPException, extras: dict = None) -> Optional[Hashable]:
+        """
+        Build the cache key of an HTTPException.
+
+        Parameters
+        ----------
+        exception : HTTPException
+            The exception to build the key for.
+        extras : dict, optional
+            Additional information included in the problem details (default is None).
+
+        Returns
+        -------
+        Optional[Hashable]
+            The key made of exception class, status, description, extras and the version of the
+            problem registry, or None if the extras are not hashable.
+        """
+        extras_key : Tuple = ()
+        if extras:
+            extras_key = tuple(sorted(extras.items()))
+            try:
+                hash(extras_key)
+            except TypeError:
+                return None
+        return exception.__class__, exception.code, exception.description, extras_key, PROBLEM_REGISTRY.version
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """
+        Look up a serialized problem body.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key returned by ProblemResponseCache.key.
+
+        Returns
+        -------
+        Optional[bytes]
+            The cached body, or None on a miss.
+        """
+        with self._lock:
+            body : Optional[bytes] = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: bytes):
+        """
+        Store a serialized problem body, evicting the least recently used one if the cache is full.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key returned by ProblemResponseCache.key.
+        body : bytes
+            The serialized problem body.
+        """
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every cached body and reset the hit/miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+_CROCKFORD_BASE32 : str = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+def ulid() -> str:
+    """
+    Generate a ULID: 48 bits of millisecond timestamp and 80 random bits, in Crockford base32.
+    ULIDs sort by creation time and are unique across processes.
+
+    Returns
+    -------
+    str
+        The 26 characters ULID.
+    """
+    value : int = (int(time() * 1000) << 80) | random.getrandbits(80)
+    return "".join([_CROCKFORD_BASE32[(value >> shift) & 31] for shift in range(125, -5, -5)])
+
+class _MonotonicIds:
+    """
+    Id generator made of a random prefix followed by a counter.
+    """
+    __slots__ = ("prefix", "counter", "__weakref__")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.prefix : str = f"{random.getrandbits(48):012x}-"
+        self.counter : Iterator[int] = count(1)
+
+    def __call__(self) -> str:
+        return self.prefix + str(next(self.counter))
+
+#the generators alive in this process, their prefix is drawn again in forked children
+_MONOTONIC_IDS : weakref.WeakSet = weakref.WeakSet()
+
+def _reset_monotonic_ids():
+    for generator in list(_MONOTONIC_IDS):
+        generator.reset()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_monotonic_ids)
+
+def monotonic_ids() -> Callable[[], str]:
+    """
+    Build the fastest id generator: a random prefix per generator followed by a counter.
+    The prefix is drawn again in forked processes, on platforms that fork.
+
+    Returns
+    -------
+    Callable[[], str]
+        The generator, e.g. "3f9a1c0e7b2d-1", "3f9a1c0e7b2d-2", ...
+    """
+    generator : _MonotonicIds = _MonotonicIds()
+    _MONOTONIC_IDS.add(generator)
+    return generator
+
+class RequestIds:
+    """
+    Request ids correlating the problem responses with the server logs.
+
+    The id of a request is taken from its request header when it is a safe token, otherwise
+    generated, and only when the request produces a problem. It fills the "instance" member,
+    as a URI reference validated once with the template, and is echoed in a response header.
+    """
+    ENVIRON_KEY : str = "problem_details.request_id"
+    SAFE_ID : re.Pattern = re.compile(r"[A-Za-z0-9._~-]{1,128}")
+    #RFC 3986 URI-reference: an optional scheme, otherwise no ":" before the first "/", "?" or "#"
+    URI_REFERENCE : re.Pattern = re.compile(r"(?:[A-Za-z][A-Za-z0-9+.-]*:|(?![^/?#]*:))(?:[A-Za-z0-9\-._~!$&'()*+,;=:@/?#\[\]]|%[0-9A-Fa-f]{2})*")
+
+    def __init__(self, header: Optional[str] = "X-Request-ID", generator: Optional[Callable[[], str]] = None,
+                 instance: str = "urn:request:{id}", response_header: Optional[str] = None):
+        """
+        Initialize a RequestIds.
+
+        Parameters
+        ----------
+        header : Optional[str], optional
+            The request header propagating the id, None always generates it (default is "X-Request-ID").
+        generator : Optional[Callable[[], str]], optional
+            The id generator, e.g. ulid or monotonic_ids() (default is None, monotonic_ids()).
+        instance : str, optional
+            The template of the instance URI reference, absolute or relative, holding one "{id}"
+            (default is "urn:request:{id}").
+        response_header : Optional[str], optional
+            The response header echoing the id (default is None, the request header or "X-Request-ID").
+
+        Raises
+        ------
+        ValueError
+            If the instance template does not hold one "{id}" or is not a URI reference.
+        """
+        if instance.count("{id}") != 1:
+            raise ValueError("instance must hold one {id} placeholder")
+        if not self.URI_REFERENCE.fullmatch(instance.replace("{id}", "id")):
+            raise ValueError(f"instance is not a URI reference: {instance!r}")
+        self.header : Optional[str] = header
+        self.generator : Callable[[], str] = monotonic_ids() if generator is None else generator
+        self.response_header : str = response_header or header or "X-Request-ID"
+        self._instance_prefix, self._instance_suffix = instance.split("{id}")
+        self._environ_header : Optional[str] = None if header is None else "HTTP_" + header.upper().replace("-", "_")
+
+    def current(self) -> str:
+        """
+        Get the id of the current request, propagated or generated once per request.
+
+        Returns
+        -------
+        str
+            The request id.
+        """
+        environ : dict = request.environ
+        request_id : Optional[str] = environ.get(self.ENVIRON_KEY)
+        if request_id is None:
+            request_id = environ.get(self._environ_header) if self._environ_header is not None else None
+            if request_id is None or not self.SAFE_ID.fullmatch(request_id):
+                request_id = self.generator()
+            environ[self.ENVIRON_KEY] = request_id
+        return request_id
+
+    def instance(self, request_id: str) -> str:
+        """
+        Build the instance URI of a request id.
+
+        Parameters
+        ----------
+        request_id : str
+            The request id.
+
+        Returns
+        -------
+        str
+            The instance URI.
+        """
+        return self._instance_prefix + request_id + self._instance_suffix
+
+class LoadShedder:
+    """
+    Overload mode: while the worker is saturated, requests and errors are answered with one
+    pre-encoded 503 or 429 problem and a Retry-After header, without capturing tracebacks,
+    adding extras or validating anything, so error handling never makes the overload worse.
+
+    The worker is saturated when more than max_in_flight requests of the app are in progress,
+    or when the predicate returns True.
+    """
+    ENVIRON_KEY : str = "problem_details.in_flight"
+
+    def __init__(self, max_in_flight: Optional[int] = None, predicate: Optional[Callable[[], bool]] = None,
+                 status: int = 503, retry_after: int = 1, reject_requests: bool = True):
+        """
+        Initialize a LoadShedder.
+
+        Parameters
+        ----------
+        max_in_flight : Optional[int], optional
+            The number of concurrent requests above which the worker is saturated (default is None, no limit).
+        predicate : Optional[Callable[[], bool]], optional
+            A cheap check returning True when the worker is saturated, e.g. on a queue depth (default is None).
+        status : int, optional
+            The status of the shed responses, 503 or 429 (default is 503).
+        retry_after : int, optional
+            The value in seconds of the Retry-After header (default is 1).
+        reject_requests : bool, optional
+            If True, reject the new requests while saturated, otherwise only their errors are
+            shed (default is True).
+        """
+        if max_in_flight is None and predicate is None:
+            raise ValueError("max_in_flight or predicate is required")
+        if status not in (429, 503):
+            raise ValueError("status must be 429 or 503")
+        exception : HTTPException = default_exceptions[status]()
+        self.max_in_flight : Optional[int] = max_in_flight
+        self.predicate : Optional[Callable[[], bool]] = predicate
+        self.status : int = status
+        self.reject_requests : bool = reject_requests
+        self.body : bytes = TrustedProblemDetails(status=status, title=exception.__class__.__name__,
+                                                  detail=exception.description).model_dump_json(exclude_none=True).encode()
+        self.headers : Dict[str, str] = {"Retry-After": str(retry_after)}
+        self.in_flight : int = 0
+        self.shed : int = 0
+        self._lock : Lock = Lock()
+
+    def overloaded(self) -> bool:
+        """
+        Tell whether the worker is saturated.
+
+        Returns
+        -------
+        bool
+            True when more than max_in_flight requests are in progress or the predicate returns True.
+        """
+        if self.max_in_flight is not None and self.in_flight > self.max_in_flight:
+            return True
+        return self.predicate is not None and self.predicate()
+
+    def response(self) -> Response:
+        """
+        Build the shed response from the pre-encoded body.
+
+        Returns
+        -------
+        Response
+            The 503 or 429 problem response.
+        """
+        self.shed += 1
+        return Response(self.body, status=self.status, headers=self.headers, mimetype=PROBLEM_JSON)
+
+    def enter(self, environ: dict) -> Optional[Response]:
+        """
+        Count a request in, before it is dispatched.
+
+        Parameters
+        ----------
+        environ : dict
+            The WSGI environment of the request, marked as counted.
+
+        Returns
+        -------
+        Optional[Response]
+            The shed response when the request is rejected, otherwise None.
+        """
+        with self._lock:
+            self.in_flight += 1
+        environ[self.ENVIRON_KEY] = True
+        if self.reject_requests and self.overloaded():
+            return self.response()
+        return None
+
+    def leave(self, environ: dict):
+        """
+        Count a request out, when its context is torn down.
+
+        Parameters
+        ----------
+        environ : dict
+            The WSGI environment of the request, only counted requests are counted out.
+        """
+        if environ.pop(self.ENVIRON_KEY, False):
+            with self._lock:
+                self.in_flight -= 1
+
+_PROBLEM_DETAILS_LOCK : Lock = Lock()
+
+def _problem_details_model() -> type:
+    """
+    Define the ProblemDetails pydantic model on first use, importing pydantic.
+
+    Returns
+    -------
+    type
+        The ProblemDetails model.
+    """
+    global ProblemDetails
+    model : Optional[type] = globals().get("ProblemDetails")
+    if model is not None:
+        return model
+    with _PROBLEM_DETAILS_LOCK:
+        if "ProblemDetails" in globals():
+            return globals()["ProblemDetails"]
+        from pydantic import BaseModel, Field, AnyUrl
+
+        class ProblemDetails(BaseModel, extra="allow"):
+            status: int = Field(..., description = "HTTP status code")
+            title: str  = Field(..., description = "A short, human-readable summary of the problem type")
+            detail: Union[str|None]  = Field(None, description = "An human readable explanation specific to this occurrence of the problem")
+            type: Union[AnyUrl|None]  = Field(None, description = "An absolute URI that identifies the problem type")
+            instance: Union[AnyUrl|None] = Field(None, description = "An URI reference that identifies the specific occurrence of the problem")
+            traceback : Union[str|None] = Field(None, description = "The stack trace of the problem")
+        return ProblemDetails
+
+def __getattr__(name: str) -> object:
+    if name == "ProblemDetails":
+        return _problem_details_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_CORE_FIELDS : frozenset = frozenset(("status", "title", "detail", "type", "instance", "traceback"))
+#extension members set by this module, kept within the body budget
+_MODULE_MEMBERS : frozenset = frozenset(("fingerprint", "traceback_id", "truncated"))
+_encode_string : Callable[[str], str] = json.encoder.encode_basestring
+#titles and the descriptions of werkzeug exceptions are a small set of constants, keep their encoding around;
+#other details are str(exception), too diverse to be cached
+_encode_cached_string : Callable[[str], str] = lru_cache(maxsize=512)(_encode_string)
+_WERKZEUG_DESCRIPTIONS : frozenset = frozenset(exception.description for exception in default_exceptions.values())
+
+def _to_json(value: object) -> bytes:
+    """
+    Encode a value into compact JSON bytes with pydantic_core, as ProblemDetails serializes its extension members.
+
+    Parameters
+    ----------
+    value : object
+        The value, e.g. the extension members of a problem.
+
+    Returns
+    -------
+    bytes
+        The JSON bytes.
+    """
+    from pydantic_core import to_json
+    return to_json(value)
+
+def _encode_members(members: dict) -> str:
+    #the members are encoded in one pass and spliced after the core members, without their braces
+    encoded : bytes = _to_json(members)
+    return "," + encoded[1:-1].decode() if len(encoded) > 2 else ""
+
+class TrustedProblemDetails:
+    """
+    Slotted, non-validating problem details for internally generated problems.
+    It mirrors the ProblemDetails interface used by ProblemDetailsError, and serializes
+    to the same JSON as ProblemDetails without going through pydantic.
+    """
+    __slots__ = ("status", "title", "detail", "type", "instance", "traceback", "extras")
+
+    def __init__(self, status: int, title: str, detail: Optional[str] = None, type: Optional[str] = None,
+                 instance: Optional[str] = None, traceback: Optional[str] = None, extras: dict = None):
+        """
+        Initialize a TrustedProblemDetails. Values are stored as given, without validation.
+
+        Parameters
+        ----------
+        status : int
+            HTTP status code.
+        title : str
+            A short, human-readable summary of the problem type.
+        detail : str, optional
+            An human readable explanation specific to this occurrence of the problem (default is None).
+        type : str, optional
+            An absolute URI that identifies the problem type (default is None).
+        instance : str, optional
+            An URI reference that identifies the specific occurrence of the problem (default is None).
+        traceback : str, optional
+            The stack trace of the problem (default is None).
+        extras : dict, optional
+            Additional members of the problem details (default is None).
+        """
+        self.status = status
+        self.title = title
+        self.detail = detail
+        self.type = type
+        self.instance = instance
+        self.traceback = traceback
+        self.extras = dict(extras) if extras else {}
+
+    def __getattr__(self, name: str):
+        if name == "extras":
+            #the slot is not set yet, e.g. while copy or pickle rebuild the instance
+            raise AttributeError(name)
+        try:
+            return self.extras[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def model_dump(self, exclude_none: bool = False) -> dict:
+        """
+        Transform the problem details into a dictionary, like ProblemDetails.model_dump.
+
+        Parameters
+        ----------
+        exclude_none : bool, optional
+            If True, omit the members whose value is None (default is False).
+
+        Returns
+        -------
+        dict
+            The problem details as a dictionary.
+        """
+        data : dict = {"status": self.status, "title": self.title, "detail": self.detail,
+                       "type": self.type, "instance": self.instance, "traceback": self.traceback}
+        data.update(self.extras)
+        if exclude_none:
+            return {key: value for key, value in data.items() if value is not None}
+        return data
+
+    def model_dump_json(self, exclude_none: bool = False) -> str:
+        """
+        Transform the problem details into a JSON string, like ProblemDetails.model_dump_json.
+
+        Parameters
+        ----------
+        exclude_none : bool, optional
+            If True, omit the members whose value is None (default is False).
+
+        Returns
+        -------
+        str
+            The problem details as a JSON string.
+        """
+        status = self.status
+        body : str = '{"status":' + ("null" if status is None else str(int(status))) + ',"title":' + _encode_cached_string(self.title)
+        detail = self.detail
+        if detail is not None:
+            body += ',"detail":' + (_encode_cached_string(detail) if detail in _WERKZEUG_DESCRIPTIONS else _encode_string(detail))
+        elif not exclude_none:
+            body += ',"detail":null'
+        for name, value in (("type", self.type), ("instance", self.instance), ("traceback", self.traceback)):
+            if value is not None:
+                body += ',"' + name + '":' + _encode_string(str(value))
+            elif not exclude_none:
+                body += ',"' + name + '":null'
+        extras : dict = self.extras
+        if extras:
+            if exclude_none:
+                extras = {name: value for name, value in extras.items() if value is not None}
+            body += _encode_members(extras)
+        return body + "}"
+
+    def to_model(self) -> ProblemDetails:
+        """
+        Validate the problem details into a ProblemDetails model.
+
+        Returns
+        -------
+        ProblemDetails
+            The validated problem details.
+        """
+        return _problem_details_model()(**self.model_dump(exclude_none=True))
+
+def _set_member(problem: Union[ProblemDetails, TrustedProblemDetails], name: str, value: object):
+    if isinstance(problem, TrustedProblemDetails):
+        problem.extras[name] = value
+    else:
+        setattr(problem, name, value)
+
+def _trusted_problem(problem: ProblemDetails) -> TrustedProblemDetails:
+    #the JSON values of every field and extra, so that members set afterwards are not validated again
+    data : dict = problem.model_dump(mode="json", exclude_none=True)
+    return TrustedProblemDetails(**{name: data.pop(name) for name in _CORE_FIELDS if name in data}, extras=data)
+
+def _set_instance(problem: ProblemDetailsError, instance: str):
+    if not isinstance(problem.problem, TrustedProblemDetails):
+        #a str instance would not serialize as the AnyUrl field of a pydantic problem
+        problem.problem = _trusted_problem(problem.problem)
+    problem.problem.instance = instance
+
+def detach_traceback(exception: Optional[BaseException]):
+    """
+    Release the frames of an exception and of its chained exceptions.
+
+    The frames that are done executing are cleared, dropping their local variables, and the
+    tracebacks are removed. This also breaks the exception -> traceback -> frame -> exception
+    cycles, so the exceptions are freed by reference counting instead of the garbage collector.
+
+    Parameters
+    ----------
+    exception : Optional[BaseException]
+        The exception, None does nothing.
+    """
+    pending : List[BaseException] = [exception] if exception is not None else []
+    seen : set = set()
+    while pending:
+        exception = pending.pop()
+        if id(exception) in seen:
+            continue
+        seen.add(id(exception))
+        if exception.__traceback__ is not None:
+            traceback.clear_frames(exception.__traceback__)
+            exception.__traceback__ = None
+        pending.extend(chained for chained in (exception.__cause__, exception.__context__) if chained is not None)
+        if isinstance(exception, ProblemDetailsError):
+            exception._traceback = None
+
+class ProblemDetailsError(Exception):
+    #BaseException creates its __dict__ lazily, the slots keep the attributes of the error out of it
+    __slots__ = ("problem", "inner_exception", "_traceback_exception", "_traceback", "_formatted_traceback",
+                 "_traceback_sample", "_fingerprint", "_extras_limits")
+
+    def __init__(self, problem: Union[ProblemDetails, TrustedProblemDetails], exception: Exception = None):
+        """
+        Initialize a ProblemDetailsError.
+
+        Parameters
+        ----------
+        problem : Union[ProblemDetails, TrustedProblemDetails]
+            The problem details.
+        exception : Exception, optional
+            The original exception that caused the problem (default is None).
+        """
+        self.problem: Union[ProblemDetails, TrustedProblemDetails] = problem
+        self.inner_exception: Exception = exception
+        self._traceback_exception : Optional[BaseException] = exception
+        self._traceback : Optional[TracebackType] = exception.__traceback__ if exception is not None else None
+        if self._traceback is None:
+            self._traceback_exception, self._traceback = sys.exc_info()[1:]
+        self._formatted_traceback : Optional[Tuple] = None
+        self._traceback_sample : Optional[Tuple[str, bool]] = None
+        self._fingerprint : Optional[Tuple[int, str]] = None
+        self._extras_limits : Optional[ExtrasLimits] = None
+
+    def format_traceback(self, settings: ProblemDetailsSettings = None) -> str:
+        """
+        Format the traceback captured for this problem.
+        The result is memoized, so repeated serializations format the traceback only once.
+
+        Parameters
+        ----------
+        settings : ProblemDetailsSettings, optional
+            The traceback limits to apply (default is None, the module traceback settings).
+
+        Returns
+        -------
+        str
+            The formatted traceback.
+        """
+        settings : ProblemDetailsSettings = _GLOBAL_SETTINGS if settings is None else settings
+        limits : Tuple = (settings.traceback_limit, settings.traceback_max_bytes, settings.traceback_summary)
+        if self._formatted_traceback is None or self._formatted_traceback[0] != limits:
+            self._formatted_traceback = (limits, format_traceback(*self._traceback_source(), *limits))
+        return self._formatted_traceback[1]
+
+    def _traceback_source(self) -> Tuple[Optional[BaseException], Optional[TracebackType]]:
+        if self._traceback_exception is None:
+            return self, self.__traceback__
+        return self._traceback_exception, self._traceback
+
+    def detach(self):
+        """
+        Release the frames captured for this problem, once its response is built.
+
+        The traceback, fingerprint and sample already computed are kept; formatting the
+        traceback again only renders the exception line. See detach_traceback.
+        """
+        if self._traceback_exception is None:
+            self._traceback_exception = self
+        detach_traceback(self._traceback_exception)
+        detach_traceback(self)
+        self._traceback = None
+
+    def _for_response(self) -> ProblemDetailsError:
+        """
+        Copy a raised problem for one response.
+
+        The members set while rendering the response (instance, traceback, traceback_id,
+        fingerprint, bounded extras, ...) are written on the copy, so a problem raised again
+        by later requests keeps its own members. The copy renders the traceback of the last raise.
+
+        Returns
+        -------
+        ProblemDetailsError
+            The copy, sharing the captured traceback and the extension member values.
+        """
+        problem : Union[ProblemDetails, TrustedProblemDetails] = self.problem
+        if isinstance(problem, TrustedProblemDetails):
+            problem = TrustedProblemDetails(problem.status, problem.title, problem.detail, problem.type,
+                                            problem.instance, problem.traceback, problem.extras)
+        else:
+            problem = problem.model_copy()
+        copy : ProblemDetailsError = self.__class__.__new__(self.__class__, problem)
+        if self.__dict__:
+            copy.__dict__.update(self.__dict__)
+        copy.problem = problem
+        copy.inner_exception = self.inner_exception
+        copy._traceback_exception, copy._traceback = self._traceback_source()
+        copy._formatted_traceback = None
+        copy._traceback_sample = None
+        copy._fingerprint = None
+        copy._extras_limits = self._extras_limits
+        return copy
+
+    def fingerprint(self, frames: int = 3) -> str:
+        """
+        Compute the stable fingerprint of the exception behind this problem, see exception_fingerprint.
+        The result is memoized.
+
+        Parameters
+        ----------
+        frames : int, optional
+            The number of innermost frames included (default is 3).
+
+        Returns
+        -------
+        str
+            The fingerprint.
+        """
+        if self._fingerprint is None or self._fingerprint[0] != frames:
+            self._fingerprint = (frames, exception_fingerprint(*self._traceback_source(), frames=frames))
+        return self._fingerprint[1]
+
+    def _prepare(self, with_traceback: Optional[bool], settings: Optional[ProblemDetailsSettings]) -> ProblemDetailsSettings:
+        """
+        Resolve the settings of a serialization and set the members they enable.
+
+        Parameters
+        ----------
+        with_traceback : Optional[bool]
+            If True, include the last exception traceback, None takes it from settings.
+        settings : Optional[ProblemDetailsSettings]
+            The resolved settings, None takes the module traceback settings.
+
+        Returns
+        -------
+        ProblemDetailsSettings
+            The resolved settings.
+        """
+        settings : ProblemDetailsSettings = _GLOBAL_SETTINGS if settings is None else settings
+        if settings.extras_limits is not None and settings.extras_limits != self._extras_limits:
+            self._bound_extras(settings.extras_limits)
+        if settings.with_traceback if with_traceback is None else with_traceback:
+            self._attach_traceback(settings)
+        if settings.fingerprint:
+            _set_member(self.problem, "fingerprint", self.fingerprint())
+        return settings
+
+    def _bound_extras(self, limits: ExtrasLimits):
+        """
+        Replace the extension members of the problem by their bounded rendering, see bound_extras.
+
+        Parameters
+        ----------
+        limits : ExtrasLimits
+            The limits to apply.
+        """
+        self._extras_limits = limits
+        if isinstance(self.problem, TrustedProblemDetails):
+            if self.problem.extras:
+                self.problem.extras = bound_extras(self.problem.extras, limits)
+        elif self.problem.__pydantic_extra__:
+            self.problem.__pydantic_extra__ = bound_extras(self.problem.__pydantic_extra__, limits)
+
+    def _attach_traceback(self, settings: ProblemDetailsSettings):
+        """
+        Set the traceback member of the problem, or only its "traceback_id" when the
+        settings sampler rejects this occurrence.
+
+        Parameters
+        ----------
+        settings : ProblemDetailsSettings
+            The resolved settings to apply.
+        """
+        sampler : Optional[TracebackSampler] = settings.traceback_sampler
+        if sampler is None:
+            self.problem.traceback = self.format_traceback(settings)
+            return
+        if self._traceback_sample is None:
+            signature : str = traceback_signature(*self._traceback_source())
+            self._traceback_sample = (signature_id(signature), sampler.allow(signature))
+        traceback_id, sampled = self._traceback_sample
+        _set_member(self.problem, "traceback_id", traceback_id)
+        if sampled:
+            self.problem.traceback = self.format_traceback(settings)
+
+    def to_dict(self, with_traceback: bool = None, settings: ProblemDetailsSettings = None) -> dict:
+        """
+        Transform the ProblemDetailsError into a dictionary.
+
+        Parameters
+        ----------
+        with_traceback : bool, optional
+            If True, include the last exception traceback (default is None, taken from settings).
+        settings : ProblemDetailsSettings, optional
+            The resolved settings to apply (default is None, the module traceback settings).
+
+        Returns
+        -------
+        dict
+            The problem details as a dictionary.
+        """
+        settings : ProblemDetailsSettings = self._prepare(with_traceback, settings)
+        return self.problem.model_dump(exclude_none=True)
+    
+    def to_json(self, with_traceback: bool = None, settings: ProblemDetailsSettings = None) -> str:
+        """
+        Transform the ProblemDetailsError into a JSON string.
+
+        Parameters
+        ----------
+        with_traceback : bool, optional
+            If True, include the last exception traceback (default is None, taken from settings).
+        settings : ProblemDetailsSettings, optional
+            The resolved settings to apply (default is None, the module traceback settings).
+
+        Returns
+        -------
+        str
+            The problem details as a JSON string.
+        """
+        settings : ProblemDetailsSettings = self._prepare(with_traceback, settings)
+        return self.problem.model_dump_json(exclude_none=True)
+
+    def to_bytes(self, with_traceback: bool = None, settings: ProblemDetailsSettings = None) -> bytes:
+        """
+        Transform the ProblemDetailsError into JSON bytes, using the settings JSON encoder if any.
+
+        Parameters
+        ----------
+        with_traceback : bool, optional
+            If True, include the last exception traceback (default is None, taken from settings).
+        settings : ProblemDetailsSettings, optional
+            The resolved settings to apply (default is None, the module traceback settings).
+
+        Returns
+        -------
+        bytes
+            The problem details as JSON bytes.
+        """
+        settings : ProblemDetailsSettings = self._prepare(with_traceback, settings)
+        if settings.json_encoder is not None:
+            return settings.json_encoder(self.problem.model_dump(exclude_none=True))
+        if isinstance(self.problem, TrustedProblemDetails):
+            return self.problem.model_dump_json(exclude_none=True).encode()
+        return self.problem.__pydantic_serializer__.to_json(self.problem, exclude_none=True)
+
+    def to_http_stream(self, name: str, items: Iterable, with_traceback: bool = None, settings: ProblemDetailsSettings = None) -> Response:
+        """
+        Transform the ProblemDetailsError into a streamed HTTP response, writing the items of an
+        array member one by one instead of serializing the whole body at once.
+
+        With settings.max_body_bytes, the members before the array are trimmed like the bodies of
+        to_http_response, and the stream stops at the first item that would exceed the budget.
+        The number of items left out, added to a "truncated" member of the problem, is written in
+        a "truncated" member after the array.
+
+        Parameters
+        ----------
+        name : str
+            The name of the array member.
+        items : Iterable
+            The items of the array member, consumed lazily while the response is written.
+        with_traceback : bool, optional
+            If True, include the last exception traceback (default is None, taken from settings).
+        settings : ProblemDetailsSettings, optional
+            The resolved settings to apply (default is None, the module traceback settings).
+
+        Returns
+        -------
+        Response
+            The problem details as a streamed HTTP response.
+        """
+        settings : ProblemDetailsSettings = _GLOBAL_SETTINGS if settings is None else settings
+        member : bytes = b"," + _encode_string(name).encode() + b":["
+        budget : Optional[int] = settings.max_body_bytes
+        truncated : int = 0
+        if budget is not None:
+            extras : dict = self.problem.extras if isinstance(self.problem, TrustedProblemDetails) else (self.problem.__pydantic_extra__ or {})
+            truncated = extras.pop("truncated", 0)
+            #room for the closing of the array and the largest "truncated" count
+            budget -= len(b'],"truncated":}') + 20
+        body : bytes = self.to_bytes(with_traceback, settings)
+        if budget is not None and len(body) + len(member) - 1 > budget:
+            body = self._encode_within_budget(PROBLEM_JSON, settings._replace(max_body_bytes=max(budget - len(member) + 1, 0)))
+        head : bytes = body[:-1] + member
+        encode : JsonEncoder = settings.json_encoder or _to_json
+        def generate() -> Iterator[bytes]:
+            written : int = len(head)
+            omitted : int = 0
+            separator : bytes = b""
+            yield head
+            remaining : Iterator = iter(items)
+            for item in remaining:
+                chunk : bytes = separator + encode(item)
+                if budget is not None and written + len(chunk) > budget:
+                    omitted = 1 + sum(1 for _ in remaining)
+                    break
+                written += len(chunk)
+                yield chunk
+                separator = b","
+            yield b'],"truncated":' + str(truncated + omitted).encode() + b"}" if truncated + omitted else b"]}"
+        return Response(generate(), status=self.problem.status, mimetype="application/problem+json")
+
+    def to_http_response(self, with_traceback: bool = None, settings: ProblemDetailsSettings = None,
+                         media_type: str = PROBLEM_JSON) -> Response:
+        """
+        Transform the ProblemDetailsError into an HTTP response.
+
+        Parameters
+        ----------
+        with_traceback : bool, optional
+            If True, include the last exception traceback (default is None, taken from settings).
+        settings : ProblemDetailsSettings, optional
+            The resolved settings to apply (default is None, the module traceback settings).
+        media_type : str, optional
+            The media type of the body, one of MEDIA_TYPES (default is PROBLEM_JSON).
+
+        Returns
+        -------
+        Response
+            The problem details as an HTTP response.
+        """
+        settings : ProblemDetailsSettings = _GLOBAL_SETTINGS if settings is None else settings
+        body : bytes = self._encode(media_type, with_traceback, settings)
+        if settings.max_body_bytes is not None and len(body) > settings.max_body_bytes:
+            body = self._encode_within_budget(media_type, settings)
+        return Response(status=self.problem.status, response=body, mimetype=media_type)
+
+    def _encode(self, media_type: str, with_traceback: Optional[bool], settings: ProblemDetailsSettings) -> bytes:
+        if media_type == PROBLEM_JSON:
+            return self.to_bytes(with_traceback, settings)
+        return media_type_encoder(media_type)(_to_jsonable_python(self.to_dict(with_traceback, settings)))
+
+    def _encode_within_budget(self, media_type: str, settings: ProblemDetailsSettings) -> bytes:
+        """
+        Encode the problem again until the body fits in settings.max_body_bytes.
+
+        The traceback is cut to the remaining space. When the body does not fit even without it,
+        the extension members are omitted (their names are listed in "omitted"), except the ones
+        set by this module, and the detail is truncated last. The budget holds unless the status,
+        title and kept members alone exceed it.
+
+        Parameters
+        ----------
+        media_type : str
+            The media type of the body.
+        settings : ProblemDetailsSettings
+            The resolved settings to apply.
+
+        Returns
+        -------
+        bytes
+            The trimmed body.
+        """
+        traceback_text : Optional[str] = self.problem.traceback
+        self.problem.traceback = None
+        body : bytes = self._encode(media_type, False, settings)
+        if len(body) <= settings.max_body_bytes:
+            return self._fit_member("traceback", traceback_text, True, media_type, settings) if traceback_text else body
+        trusted : bool = isinstance(self.problem, TrustedProblemDetails)
+        extras : dict = self.problem.extras if trusted else (self.problem.__pydantic_extra__ or {})
+        kept : dict = {name: value for name, value in extras.items() if name in _MODULE_MEMBERS}
+        omitted : List[str] = [name for name in extras if name not in _MODULE_MEMBERS]
+        if omitted:
+            kept["omitted"] = omitted
+            if trusted:
+                self.problem.extras = kept
+            else:
+                self.problem.__pydantic_extra__ = kept
+            body = self._encode(media_type, False, settings)
+        if len(body) > settings.max_body_bytes and self.problem.detail:
+            body = self._fit_member("detail", self.problem.detail, False, media_type, settings)
+        return body
+
+    def _fit_member(self, name: str, text: str, tail: bool, media_type: str, settings: ProblemDetailsSettings) -> bytes:
+        """
+        Set the longest cut of a text member, marked with "...", that keeps the body within
+        settings.max_body_bytes, or leave the member out when no cut fits.
+
+        Parameters
+        ----------
+        name : str
+            The member, "traceback" or "detail".
+        text : str
+            The full text of the member.
+        tail : bool
+            If True, keep the end of the text, otherwise its beginning.
+        media_type : str
+            The media type of the body.
+        settings : ProblemDetailsSettings
+            The resolved settings to apply.
+
+        Returns
+        -------
+        bytes
+            The body.
+        """
+        setattr(self.problem, name, None)
+        body : bytes = self._encode(media_type, False, settings)
+        available : int = settings.max_body_bytes - len(body)
+        keep : int = min(len(text), available)
+        while keep > 0:
+            setattr(self.problem, name, text if keep == len(text) else ("..." + text[-keep:] if tail else text[:keep] + "..."))
+            cut : bytes = self._encode(media_type, False, settings)
+            if len(cut) <= settings.max_body_bytes:
+                return cut
+            #escaping makes the encoded member longer than the text, shrink it in proportion
+            keep = min(keep - 1, keep * available // (len(cut) - len(body)))
+        setattr(self.problem, name, None)
+        return body
+
+class BatchTemplate(NamedTuple):
+    """
+    Members shared by the items of a ProblemDetailsBatch, with their JSON encoding.
+    """
+    status: int
+    title: str
+    type: Optional[str]
+    head: str
+    tail: str
+
+class ProblemDetailsBatch:
+    """
+    Collects the per-item problems of a bulk request, rendered as one problem whose "problems"
+    member lists them.
+
+    Items are stored as tuples sharing one template per (status, title, type), whose members are
+    encoded once, so collecting a problem costs about as much as appending a tuple to a list.
+    """
+    __slots__ = ("status", "title", "detail", "type", "_items", "_templates", "_class_templates")
+
+    def __init__(self, status: int = 422, title: str = "UnprocessableEntity", detail: Optional[str] = None,
+                 type: Optional[str] = None):
+        """
+        Initialize a ProblemDetailsBatch.
+
+        Parameters
+        ----------
+        status : int, optional
+            HTTP status code of the response (default is 422).
+        title : str, optional
+            A short, human-readable summary of the response (default is "UnprocessableEntity").
+        detail : Optional[str], optional
+            An explanation of the response (default is None).
+        type : Optional[str], optional
+            An absolute URI that identifies the problem type of the response (default is None).
+        """
+        self.status : int = status
+        self.title : str = title
+        self.detail : Optional[str] = detail
+        self.type : Optional[str] = type
+        self._items : List[Tuple[object, BatchTemplate, Optional[str], Optional[dict]]] = []
+        self._templates : Dict[Tuple[int, str, Optional[str]], BatchTemplate] = {}
+        self._class_templates : Dict[type, Tuple[BatchTemplate, Optional[str], bool]] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    def template(self, status: int, title: str, type: Optional[str] = None) -> BatchTemplate:
+        """
+        Get the shared template of the items with these members, the title is interned.
+
+        Parameters
+        ----------
+        status : int
+            HTTP status code of the items.
+        title : str
+            A short, human-readable summary of the problem type.
+        type : Optional[str], optional
+            An absolute URI that identifies the problem type (default is None).
+
+        Returns
+        -------
+        BatchTemplate
+            The template.
+        """
+        key : Tuple[int, str, Optional[str]] = (status, title, type)
+        template : Optional[BatchTemplate] = self._templates.get(key)
+        if template is None:
+            title = sys.intern(title)
+            template = BatchTemplate(status, title, type, '{"status":' + str(int(status)) + ',"title":' + _encode_string(title),
+                                     "" if type is None else ',"type":' + _encode_string(type))
+            self._templates[key] = template
+        return template
+
+    def add_problem(self, index: object, status: int, title: str, detail: Optional[str] = None,
+                    type: Optional[str] = None, extras: Optional[dict] = None):
+        """
+        Add the problem of an item.
+
+        Parameters
+        ----------
+        index : object
+            The index or identifier of the item, a JSON value.
+        status : int
+            HTTP status code of the item.
+        title : str
+            A short, human-readable summary of the problem type.
+        detail : Optional[str], optional
+            An explanation specific to this item (default is None).
+        type : Optional[str], optional
+            An absolute URI that identifies the problem type (default is None).
+        extras : Optional[dict], optional
+            Additional members of this item (default is None).
+        """
+        self._items.append((index, self.template(status, title, type), detail, extras))
+
+    def add(self, index: object, exception: BaseException, extras: Optional[dict] = None):
+        """
+        Add the problem of an item from an exception, as from_exception would describe it.
+
+        Parameters
+        ----------
+        index : object
+            The index or identifier of the item, a JSON value.
+        exception : BaseException
+            The exception raised for the item.
+        extras : Optional[dict], optional
+            Additional members of this item (default is None).
+        """
+        cls : type = exception.__class__
+        try:
+            template, detail, described = self._class_templates[cls]
+        except KeyError:
+            template, detail, described = self._class_templates[cls] = self._exception_template(cls, exception)
+        if detail is None:
+            detail = exception.description if described else str(exception)
+        self._items.append((index, template, detail, extras))
+
+    def _exception_template(self, cls: type, exception: BaseException) -> Tuple[BatchTemplate, Optional[str], bool]:
+        """
+        Resolve the template of an exception class, its fixed detail if any, and whether the
+        detail is the description of an HTTP exception rather than the exception message.
+        """
+        registered : Optional[ProblemTemplate] = PROBLEM_REGISTRY.lookup(cls)
+        if registered is not None:
+            if registered.extras:
+                raise ValueError(f"The template of {cls.__name__} has extras, add its items with add_problem")
+            return (self.template(registered.status, registered.title, registered.type), registered.detail,
+                    registered.detail is None and isinstance(exception, HTTPException))
+        if isinstance(exception, HTTPException):
+            return self.template(exception.code, cls.__name__), None, True
+        return self.template(InternalServerError.code, InternalServerError.__name__), None, False
+
+    def _item_json(self, item: Tuple[object, BatchTemplate, Optional[str], Optional[dict]]) -> str:
+        index, template, detail, extras = item
+        body : str = template.head
+        if detail is not None:
+            body += ',"detail":' + _encode_string(detail)
+        body += template.tail + ',"index":' + (str(index) if index.__class__ is int else _to_json(index).decode())
+        if extras:
+            body += _encode_members({name: value for name, value in extras.items() if value is not None})
+        return body + "}"
+
+    def _item_dict(self, item: Tuple[object, BatchTemplate, Optional[str], Optional[dict]]) -> dict:
+        index, template, detail, extras = item
+        result : dict = {"status": template.status, "title": template.title}
+        if detail is not None:
+            result["detail"] = detail
+        if template.type is not None:
+            result["type"] = template.type
+        result["index"] = index
+        if extras:
+            result.update((name, value) for name, value in extras.items() if value is not None)
+        return result
+
+    def problems(self) -> List[dict]:
+        """
+        Render the items as dictionaries.
+
+        Returns
+        -------
+        List[dict]
+            The problems of the items, in the order they were added.
+        """
+        return [self._item_dict(item) for item in self._items]
+
+    def _head(self) -> TrustedProblemDetails:
+        return TrustedProblemDetails(status=self.status, title=self.title, detail=self.detail, type=self.type)
+
+    def to_exception(self) -> ProblemDetailsError:
+        """
+        Build a ProblemDetailsError holding the problems, to raise through the app error handlers.
+
+        Returns
+        -------
+        ProblemDetailsError
+            The error, with the "problems" extension member.
+        """
+        problem : TrustedProblemDetails = self._head()
+        problem.extras = {"problems": self.problems()}
+        return ProblemDetailsError(problem=problem)
+
+    def to_bytes(self, settings: ProblemDetailsSettings = None) -> bytes:
+        """
+        Render the batch as one JSON problem.
+
+        Parameters
+        ----------
+        settings : ProblemDetailsSettings, optional
+            The settings whose JSON encoder, if any, encodes the items (default is None).
+
+        Returns
+        -------
+        bytes
+            The problem details as JSON bytes.
+        """
+        return b"".join(self._chunks(settings, len(self._items) or 1))
+
+    def _chunks(self, settings: Optional[ProblemDetailsSettings], chunk_size: int) -> Iterator[bytes]:
+        encoder : Optional[JsonEncoder] = None if settings is None else settings.json_encoder
+        yield (self._head().model_dump_json(exclude_none=True)[:-1] + ',"problems":[').encode()
+        items : list = self._items
+        for start in range(0, len(items), chunk_size):
+            chunk : list = items[start:start + chunk_size]
+            if encoder is None:
+                text : bytes = ",".join(map(self._item_json, chunk)).encode()
+            else:
+                text : bytes = b",".join(encoder(self._item_dict(item)) for item in chunk)
+            yield text if start == 0 else b"," + text
+        yield b"]}"
+
+    def to_http_response(self, settings: ProblemDetailsSettings = None, media_type: str = PROBLEM_JSON,
+                         stream: bool = False, chunk_size: int = 256) -> Response:
+        """
+        Render the batch as one HTTP problem response.
+
+        Parameters
+        ----------
+        settings : ProblemDetailsSettings, optional
+            The settings whose JSON encoder, if any, encodes the items (default is None).
+        media_type : str, optional
+            The media type of the body, one of MEDIA_TYPES (default is PROBLEM_JSON).
+        stream : bool, optional
+            If True, write the JSON items chunk by chunk through a streamed response (default is False).
+        chunk_size : int, optional
+            The number of items per streamed chunk (default is 256).
+
+        Returns
+        -------
+        Response
+            The problem details as an HTTP response.
+        """
+        if media_type != PROBLEM_JSON:
+            return self.to_exception().to_http_response(with_traceback=False, settings=settings, media_type=media_type)
+        if stream:
+            return Response(self._chunks(settings, chunk_size), status=self.status, mimetype=PROBLEM_JSON)
+        return Response(status=self.status, response=self.to_bytes(settings), mimetype=PROBLEM_JSON)
+
+def problem_response(exception: BaseException, settings: ProblemDetailsSettings = None) -> Tuple[bytes, int, Dict[str, str]]:
+    """
+    Build the parts of a problem response, independently of the web framework.
+
+    Parameters
+    ----------
+    exception : BaseException
+        The raised ProblemDetailsError, or any exception converted with from_exception.
+    settings : ProblemDetailsSettings, optional
+        The resolved settings to apply (default is None, the module traceback settings).
+
+    Returns
+    -------
+    Tuple[bytes, int, Dict[str, str]]
+        The body, the status and the headers of the response.
+    """
+    problem : ProblemDetailsError = exception._for_response() if isinstance(exception, ProblemDetailsError) else from_exception(exception)
+    return problem.to_bytes(settings=settings), problem.problem.status, {"Content-Type": "application/problem+json"}
+
+def async_handler(config: ProblemDetailsConfig = None) -> Callable[[BaseException], Awaitable[Tuple[bytes, int, Dict[str, str]]]]:
+    """
+    Build an async error handler, for frameworks awaiting their error handlers like Quart.
+    The returned (body, status, headers) tuple is accepted as a response by Flask and Quart.
+
+    Parameters
+    ----------
+    config : ProblemDetailsConfig, optional
+        The configuration, resolved once here (default is None, the module traceback settings).
+
+    Returns
+    -------
+    Callable[[BaseException], Awaitable[Tuple[bytes, int, Dict[str, str]]]]
+        The async error handler, to register for Exception.
+    """
+    settings : Optional[ProblemDetailsSettings] = None if config is None else config.resolve()
+    async def handle(exception: BaseException) -> Tuple[bytes, int, Dict[str, str]]:
+        return problem_response(exception, settings)
+    return handle
+
+class ProblemDetailsASGIMiddleware:
+    """
+    ASGI middleware converting the exceptions escaping an ASGI app into application/problem+json responses.
+    Exceptions raised after the response has started are re-raised, since the status is already sent.
+    """
+
+    def __init__(self, app: Callable, config: ProblemDetailsConfig = None):
+        """
+        Initialize a ProblemDetailsASGIMiddleware.
+
+        Parameters
+        ----------
+        app : Callable
+            The wrapped ASGI application.
+        config : ProblemDetailsConfig, optional
+            The configuration, resolved once here (default is None, the module traceback settings).
+        """
+        self.app : Callable = app
+        self.settings : Optional[ProblemDetailsSettings] = None if config is None else config.resolve()
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started : bool = False
+        async def tracking_send(message: dict):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+        try:
+            await self.app(scope, receive, tracking_send)
+        except Exception as exception:
+            if started:
+                raise
+            body, status, headers = problem_response(exception, self.settings)
+            raw_headers : List[Tuple[bytes, bytes]] = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+            await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+            await send({"type": "http.response.body", "body": body})
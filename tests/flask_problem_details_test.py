@@ -1,9 +1,31 @@
 import unittest
-from flask import Flask
+import json
+import io
+import gzip
+import copy
+import pickle
+from xml.etree import ElementTree
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+import gc
+import linecache
+import weakref
+import warnings
+import tracemalloc
+from threading import Thread, Event
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import time
+from flask import Flask, Blueprint
 from flask_openapi3 import OpenAPI
 from pydantic_core import ValidationError
-from werkzeug.exceptions import BadRequest, InternalServerError
+from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
 from pydantic import BaseModel
+from typing import List
+from datetime import datetime, timezone
+from uuid import UUID
 
 import flask_problem_details as problem
 
@@ -424,5 +446,1670 @@ class TestFromException(unittest.TestCase):
             self.assertEqual(problem_details_error.problem.title, InternalServerError.__name__)
             self.assertEqual(problem_details_error.problem.detail, str(validation_error))
 
+class TestProblemResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.app = problem.configure_app(Flask(__name__), response_cache_size=2)
+        self.client = self.app.test_client()
+        self.cache = self.app.extensions["problem_details_response_cache"]
+
+    def test_cache_disabled_by_default(self):
+        app = problem.configure_app(Flask(__name__))
+        self.assertIsNone(app.extensions["problem_details_response_cache"])
+
+    def test_cache_hit_serves_same_body(self):
+        payload = {"status": 404, "title": "NotFound", "detail": NotFound.description}
+
+        first = self.client.get('/missing')
+        second = self.client.get('/missing-too')
+
+        self.assertEqual(first.status_code, 404)
+        self.assertEqual(first.mimetype, "application/problem+json")
+        self.assertEqual(first.json, payload)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_cache_keyed_by_description(self):
+        @self.app.route('/problem')
+        def problem_route():
+            raise BadRequest("This is a bad request")
+        self.client.get('/problem')
+        response = self.client.get('/missing')
+
+        self.assertEqual(response.json.get("title"), "NotFound")
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_cache_lru_eviction(self):
+        cache = problem.ProblemResponseCache(max_size=2)
+        cache.put("a", b"a")
+        cache.put("b", b"b")
+        cache.get("a")
+        cache.put("c", b"c")
+
+        self.assertEqual(cache.get("a"), b"a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_cache_key_with_unhashable_extras(self):
+        self.assertIsNone(problem.ProblemResponseCache.key(BadRequest(), {"errors": []}))
+        self.assertIsNotNone(problem.ProblemResponseCache.key(BadRequest(), {"code": "x"}))
+
+    def test_cache_follows_registry_changes(self):
+        self.client.get('/missing')
+        problem.register_problem(NotFound, status=404, title="Missing resource")
+        try:
+            self.assertEqual(self.client.get('/missing').json.get("title"), "Missing resource")
+        finally:
+            problem.PROBLEM_REGISTRY.unregister(NotFound)
+        self.assertEqual(self.client.get('/missing').json.get("title"), "NotFound")
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_cache_bypassed_with_traceback(self):
+        problem.activate_traceback()
+        response = self.client.get('/missing')
+        problem.deactivate_traceback()
+
+        self.assertTrue("traceback" in response.json)
+        self.assertEqual(self.cache.misses, 0)
+
+class TestLazyTraceback(unittest.TestCase):
+
+    def tearDown(self):
+        # restore the default traceback settings
+        problem.activate_traceback()
+        problem.deactivate_traceback()
+
+    @staticmethod
+    def raise_nested(depth: int):
+        if depth == 0:
+            raise ValueError("deep failure")
+        TestLazyTraceback.raise_nested(depth - 1)
+
+    def capture(self) -> problem.ProblemDetailsError:
+        try:
+            self.raise_nested(20)
+        except ValueError as exception:
+            return problem.from_exception(exception)
+
+    def test_traceback_captured_at_construction(self):
+        error = self.capture()
+        # the traceback is formatted outside of the except block
+        self.assertIn("deep failure", error.to_dict(with_traceback=True).get("traceback"))
+        self.assertIn("raise_nested", error.problem.traceback)
+
+    def test_traceback_formatted_once(self):
+        error = self.capture()
+        first = error.format_traceback()
+        self.assertIs(error.format_traceback(), first)
+
+    def test_traceback_frame_limit(self):
+        error = self.capture()
+        problem.activate_traceback(limit=2)
+        formatted = error.format_traceback()
+        self.assertEqual(formatted.count("in raise_nested"), 2)
+
+    def test_traceback_max_bytes(self):
+        error = self.capture()
+        problem.activate_traceback(max_bytes=64)
+        formatted = error.format_traceback()
+        self.assertTrue(formatted.startswith("..."))
+        self.assertLessEqual(len(formatted.encode()), 64)
+        self.assertGreaterEqual(len(formatted.encode()), 61)
+        self.assertEqual(problem.format_traceback(error, error.__traceback__, max_bytes=2), "..")
+        self.assertTrue(formatted.endswith("ValueError: deep failure\n"))
+
+    def test_traceback_summary(self):
+        error = self.capture()
+        problem.activate_traceback(summary=True)
+        formatted = error.format_traceback()
+        self.assertNotIn("Traceback (most recent call last)", formatted)
+        self.assertIn("in raise_nested", formatted)
+        self.assertTrue(formatted.endswith("ValueError: deep failure"))
+
+class TestProblemDetailsConfig(unittest.TestCase):
+
+    @staticmethod
+    def make_app(config: problem.ProblemDetailsConfig) -> Flask:
+        app = problem.configure_app(Flask(__name__), config=config)
+
+        @app.route('/problem')
+        def problem_route():
+            raise Exception("This is a failure")
+        return app
+
+    def test_config_stored_on_extensions(self):
+        config = problem.ProblemDetailsConfig(with_traceback=True)
+        app = self.make_app(config)
+        self.assertIs(app.extensions["problem_details"], config)
+
+    def test_apps_have_independent_settings(self):
+        traced = self.make_app(problem.ProblemDetailsConfig(with_traceback=True)).test_client()
+        untraced = self.make_app(problem.ProblemDetailsConfig()).test_client()
+
+        self.assertTrue("traceback" in traced.get('/problem').json)
+        self.assertFalse("traceback" in untraced.get('/problem').json)
+        self.assertFalse(problem.WITH_TRACEBACK)
+
+    def test_config_ignores_global_traceback(self):
+        client = self.make_app(problem.ProblemDetailsConfig()).test_client()
+        problem.activate_traceback()
+        response = client.get('/problem')
+        problem.deactivate_traceback()
+
+        self.assertFalse("traceback" in response.json)
+
+    def test_blueprint_override(self):
+        config = problem.ProblemDetailsConfig(blueprints={"admin": {"with_traceback": True, "traceback_summary": True}})
+        admin = Blueprint("admin", __name__)
+
+        @admin.route('/problem')
+        def admin_route():
+            raise Exception("This is an admin failure")
+        app = self.make_app(config)
+        app.register_blueprint(admin, url_prefix="/admin")
+        client = app.test_client()
+
+        self.assertFalse("traceback" in client.get('/problem').json)
+        traceback = client.get('/admin/problem').json.get("traceback")
+        self.assertIn("in admin_route", traceback)
+
+    def test_nested_blueprint_override(self):
+        config = problem.ProblemDetailsConfig(blueprints={"admin": {"with_traceback": True}, "api": {"traceback_summary": True}})
+        api, admin = Blueprint("api", __name__), Blueprint("admin", __name__)
+
+        @admin.route('/problem')
+        def admin_route():
+            raise Exception("This is an admin failure")
+        @api.route('/problem')
+        def api_route():
+            raise Exception("This is an api failure")
+        api.register_blueprint(admin, url_prefix="/admin")
+        app = self.make_app(config)
+        app.register_blueprint(api, url_prefix="/api")
+        client = app.test_client()
+
+        self.assertIn("in admin_route", client.get('/api/admin/problem').json.get("traceback"))
+        self.assertNotIn("traceback", client.get('/api/problem').json)
+
+    def test_unknown_blueprint_override(self):
+        config = problem.ProblemDetailsConfig(blueprints={"amdin": {"with_traceback": True}})
+        app = Flask(__name__)
+        app.register_blueprint(Blueprint("admin", __name__))
+        with self.assertRaises(ValueError):
+            problem.configure_app(app, config=config)
+
+        client = problem.configure_app(Flask(__name__), config=config).test_client()
+        with self.assertWarns(UserWarning):
+            client.get('/missing')
+
+    def test_resolved_settings_are_frozen(self):
+        settings = problem.ProblemDetailsConfig(traceback_limit=3).resolve()
+        self.assertEqual(settings.traceback_limit, 3)
+        with self.assertRaises(AttributeError):
+            settings.with_traceback = True
+
+class TestTrustedProblemDetails(unittest.TestCase):
+
+    def test_from_exception_uses_trusted_problem(self):
+        problem_details_error = problem.from_exception(NotFound(), extras={"custom_field": "custom_value"})
+        self.assertIsInstance(problem_details_error.problem, problem.TrustedProblemDetails)
+        self.assertEqual(problem_details_error.problem.custom_field, "custom_value")
+
+    def test_from_exception_validates_core_extras(self):
+        problem_details_error = problem.from_exception(NotFound(), extras={"type": "uri:localhost:notfound"})
+        self.assertIsInstance(problem_details_error.problem, problem.ProblemDetails)
+
+    def test_json_matches_pydantic(self):
+        extras = {"text": "é\"\n<", "nested": {"value": None, "items": [1, None, (2, 3)]}, "missing": None}
+        trusted = problem.TrustedProblemDetails(status=404, title="NotFound", detail="Not \x01 found", extras=extras)
+        model = problem.ProblemDetails(status=404, title="NotFound", detail="Not \x01 found", **extras)
+
+        self.assertEqual(trusted.model_dump_json(exclude_none=True), model.model_dump_json(exclude_none=True))
+        self.assertEqual(trusted.model_dump_json(), model.model_dump_json())
+        self.assertEqual(trusted.model_dump(exclude_none=True), model.model_dump(exclude_none=True))
+
+    def test_large_extras_match_pydantic(self):
+        errors = [{"loc": ["body", index], "msg": "Field required", "ratio": index / 3, "tags": {"a"},
+                   "at": datetime(2024, 1, 1, tzinfo=timezone.utc), "id": UUID(int=index)} for index in range(1000)]
+        trusted = problem.TrustedProblemDetails(status=422, title="UnprocessableEntity", extras={"errors": errors})
+        model = problem.ProblemDetails(status=422, title="UnprocessableEntity", errors=errors)
+
+        self.assertEqual(trusted.model_dump_json(exclude_none=True), model.model_dump_json(exclude_none=True))
+
+    def test_to_model_validates(self):
+        trusted = problem.TrustedProblemDetails(status=412, title="No shelter", type="uri:localhost:noshelter")
+        self.assertEqual(str(trusted.to_model().type), "uri:localhost:noshelter")
+        with self.assertRaises(ValidationError):
+            problem.TrustedProblemDetails(status=412, title="No shelter", type="not an uri").to_model()
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            _ = problem.TrustedProblemDetails(status=404, title="NotFound").custom_field
+
+    def test_copy_and_pickle(self):
+        trusted = problem.from_exception(NotFound(), extras={"custom_field": ["custom_value"]}).problem
+        for clone in (copy.copy(trusted), copy.deepcopy(trusted), pickle.loads(pickle.dumps(trusted))):
+            self.assertEqual(clone.model_dump_json(), trusted.model_dump_json())
+            self.assertEqual(clone.custom_field, ["custom_value"])
+
+    def test_arbitrary_details_not_cached(self):
+        problem._encode_cached_string.cache_clear()
+        problem.from_exception(ValueError("x" * 10000)).to_bytes(with_traceback=False)
+        problem.from_exception(NotFound()).to_bytes(with_traceback=False)
+        self.assertEqual(problem._encode_cached_string.cache_info().currsize, 3)
+
+class TestJsonEncoder(unittest.TestCase):
+
+    def test_backends_produce_bytes(self):
+        data = {"status": 400, "title": "BadRequest", "errors": [{"loc": ("id",), "msg": "é"}]}
+        for backend in ("auto", "json", "orjson", "msgspec"):
+            try:
+                encoder = problem.json_encoder(backend)
+            except ImportError:
+                continue
+            with self.subTest(backend=backend):
+                body = encoder(data)
+                self.assertIsInstance(body, bytes)
+                self.assertEqual(json.loads(body), {"status": 400, "title": "BadRequest", "errors": [{"loc": ["id"], "msg": "é"}]})
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            problem.json_encoder("yaml")
+
+    def test_to_bytes_matches_to_json(self):
+        pydantic_error = problem.ProblemDetailsError(problem.ProblemDetails(status=412, title="No shelter", type="uri:localhost:noshelter"))
+        trusted_error = problem.from_exception(NotFound(), extras={"custom_field": "custom_value"})
+        for error in (pydantic_error, trusted_error):
+            self.assertEqual(error.to_bytes(with_traceback=False), error.to_json(with_traceback=False).encode())
+
+    def test_configure_app_with_encoder(self):
+        calls = []
+        def encoder(data: dict) -> bytes:
+            calls.append(data)
+            # problem dictionaries may hold values like AnyUrl that are not JSON native
+            return json.dumps(data, default=str).encode()
+        app = problem.configure_app(Flask(__name__), json_encoder=encoder)
+
+        @app.route('/problem')
+        def problem_route():
+            raise problem.ProblemDetailsError(problem.ProblemDetails(status=412, title="No shelter", type="uri:localhost:noshelter"))
+        response = app.test_client().get('/problem')
+
+        self.assertEqual(response.json, {"status": 412, "title": "No shelter", "type": "uri:localhost:noshelter"})
+        self.assertEqual(len(calls), 1)
+
+    def test_config_with_backend_name(self):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(json_encoder="json"))
+        response = app.test_client().get('/missing')
+        self.assertEqual(response.json.get("title"), "NotFound")
+
+    def test_legacy_app_with_encoder_follows_global_traceback(self):
+        app = problem.configure_app(Flask(__name__), json_encoder="json")
+        problem.activate_traceback()
+        response = app.test_client().get('/missing')
+        problem.deactivate_traceback()
+
+        self.assertTrue("traceback" in response.json)
+
+class TestValidationErrorLimits(unittest.TestCase):
+
+    class ItemsModel(BaseModel):
+        items: List[int]
+
+    def make_client(self, config: problem.ProblemDetailsConfig):
+        app = problem.configure_app(lambda args : OpenAPI(__name__, **args), config=config)
+
+        @app.post('/items')
+        def items_route(body: TestValidationErrorLimits.ItemsModel):
+            return {}
+        return app.test_client()
+
+    def post_bad_items(self, config: problem.ProblemDetailsConfig, count: int = 50):
+        return self.make_client(config).post('/items', json={"items": ["bad"] * count})
+
+    def test_errors_not_truncated_by_default(self):
+        response = self.post_bad_items(problem.ProblemDetailsConfig())
+        self.assertEqual(len(response.json.get("errors")), 50)
+        self.assertFalse("truncated" in response.json)
+
+    def test_errors_truncated(self):
+        response = self.post_bad_items(problem.ProblemDetailsConfig(max_validation_errors=10))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json.get("detail"), "Validation Failed! Error count: 50")
+        self.assertEqual(len(response.json.get("errors")), 10)
+        self.assertEqual(response.json.get("truncated"), 40)
+
+    def test_errors_streamed(self):
+        expected = self.post_bad_items(problem.ProblemDetailsConfig()).json
+        response = self.post_bad_items(problem.ProblemDetailsConfig(stream_validation_errors=True))
+
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.mimetype, "application/problem+json")
+        self.assertEqual(response.json, expected)
+
+    def test_errors_streamed_with_encoder_and_truncation(self):
+        config = problem.ProblemDetailsConfig(stream_validation_errors=True, max_validation_errors=5, json_encoder="json")
+        response = self.post_bad_items(config)
+
+        self.assertEqual(len(response.json.get("errors")), 5)
+        self.assertEqual(response.json.get("truncated"), 45)
+
+    def test_errors_streamed_within_body_budget(self):
+        config = problem.ProblemDetailsConfig(stream_validation_errors=True, max_validation_errors=40, max_body_bytes=2000)
+        response = self.post_bad_items(config, count=50)
+        errors = response.json.get("errors")
+
+        self.assertLessEqual(len(response.data), 2000)
+        self.assertLess(len(errors), 40)
+        self.assertEqual(len(errors) + response.json.get("truncated"), 50)
+        self.assertEqual(errors, self.post_bad_items(problem.ProblemDetailsConfig(), count=50).json["errors"][:len(errors)])
+
+    def test_streamed_errors_are_not_compressed(self):
+        with self.assertRaises(ValueError):
+            problem.ProblemDetailsConfig(stream_validation_errors=True, compress_min_bytes=1024).resolve()
+
+class TestCompactValidationErrors(unittest.TestCase):
+
+    def test_group_and_collapse_prefix(self):
+        errors = [{"type": "int_parsing", "msg": "bad int", "loc": ("body", "items", index), "input": "x" * 100} for index in range(3)]
+        errors.append({"type": "missing", "msg": "Field required", "loc": ("body", "name"), "input": {}})
+        compact = problem.compact_validation_errors(errors)
+
+        self.assertEqual(compact, [
+            {"type": "int_parsing", "msg": "bad int", "count": 3, "loc": ["body", "items"], "locs": [0, 1, 2]},
+            {"type": "missing", "msg": "Field required", "count": 1, "loc": ["body", "name"]},
+        ])
+
+    def test_nested_suffixes_and_input_sample(self):
+        errors = [{"type": "missing", "msg": "Field required", "loc": ("body", index, "id"), "input": "x" * 100} for index in range(2)]
+        compact = problem.compact_validation_errors(errors, input_max_length=10)
+
+        self.assertEqual(compact, [
+            {"type": "missing", "msg": "Field required", "count": 2, "input": "x" * 10, "loc": ["body"], "locs": [[0, "id"], [1, "id"]]},
+        ])
+
+    def test_configure_app_compact_format(self):
+        config = problem.ProblemDetailsConfig(compact_validation_errors=True)
+        response = TestValidationErrorLimits().post_bad_items(config, count=100)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json.get("detail"), "Validation Failed! Error count: 100")
+        errors = response.json.get("errors")
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].get("count"), 100)
+        self.assertEqual(errors[0].get("loc"), ["items"])
+        self.assertEqual(errors[0].get("locs"), list(range(100)))
+        self.assertFalse("input" in errors[0])
+
+class TestProblemMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = problem.ProblemMetrics()
+        self.events = []
+        self.metrics.subscribe(self.events.append)
+
+    def make_client(self, **options):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(metrics=self.metrics, **options))
+
+        @app.route('/exception')
+        def exception_route():
+            raise ValueError("This is a failure")
+
+        @app.route('/problem')
+        def problem_route():
+            raise problem.from_exception(BadRequest("This is a bad request"))
+        return app.test_client()
+
+    def test_counts_by_status_and_exception(self):
+        client = self.make_client(response_cache_size=8)
+        client.get('/missing')
+        client.get('/missing')
+        client.get('/exception')
+        client.get('/problem')
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["responses"], {(404, "NotFound"): 2, (500, "ValueError"): 1, (400, "BadRequest"): 1})
+        self.assertEqual(snapshot["count"], 4)
+        self.assertEqual(snapshot["traceback_bytes"], 0)
+        self.assertEqual([event.status for event in self.events], [404, 404, 500, 400])
+
+    def test_traceback_bytes(self):
+        client = self.make_client(with_traceback=True)
+        body = client.get('/exception').json
+
+        self.assertEqual(self.metrics.snapshot()["traceback_bytes"], len(body.get("traceback").encode()))
+        self.assertEqual(self.events[0].traceback_bytes, len(body.get("traceback").encode()))
+
+    def test_threads_are_merged(self):
+        threads = [Thread(target=lambda: [self.metrics.record(404, "NotFound", 0.001) for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.metrics.snapshot()["responses"], {(404, "NotFound"): 400})
+        self.assertEqual(len(self.events), 400)
+
+    def test_exited_threads_are_folded(self):
+        for _ in range(50):
+            thread = Thread(target=lambda: self.metrics.record(404, "NotFound", 0.001, traceback_bytes=10))
+            thread.start()
+            thread.join()
+        self.metrics.record(500, "ValueError", 0.001)
+
+        self.assertEqual(len(self.metrics._threads), 1)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["responses"], {(404, "NotFound"): 50, (500, "ValueError"): 1})
+        self.assertEqual(snapshot["count"], 51)
+        self.assertEqual(snapshot["traceback_bytes"], 500)
+
+    def test_prometheus_export(self):
+        self.metrics.record(404, "NotFound", 0.00002)
+        self.metrics.record(500, "ValueError", 0.2, traceback_bytes=120)
+        text = self.metrics.to_prometheus()
+
+        self.assertIn('problem_details_responses_total{status="404",exception="NotFound"} 1', text)
+        self.assertIn('problem_details_serialization_seconds_bucket{le="5e-05"} 1', text)
+        self.assertIn('problem_details_serialization_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("problem_details_serialization_seconds_count 2", text)
+        self.assertIn("problem_details_traceback_bytes_total 120", text)
+
+class InsufficientFunds(Exception):
+    pass
+
+class InsufficientCredit(InsufficientFunds):
+    pass
+
+class TestProblemRegistry(unittest.TestCase):
+
+    def tearDown(self):
+        problem.PROBLEM_REGISTRY.unregister(InsufficientFunds)
+        problem.PROBLEM_REGISTRY.unregister(NotFound)
+        problem.PROBLEM_REGISTRY.unregister(Exception)
+
+    def test_registered_exception(self):
+        problem.register_problem(InsufficientFunds, status=402, type="https://example.com/problems/funds")
+        problem_details_error = problem.from_exception(InsufficientFunds("Balance is 10, price is 20"))
+
+        self.assertEqual(problem_details_error.to_dict(with_traceback=False), {
+            "status": 402, "title": "InsufficientFunds", "detail": "Balance is 10, price is 20",
+            "type": "https://example.com/problems/funds"})
+
+    def test_lookup_follows_mro_and_is_memoized(self):
+        template = problem.register_problem(InsufficientFunds, status=402, title="Insufficient funds", extras={"retryable": False})
+
+        self.assertIs(problem.PROBLEM_REGISTRY.lookup(InsufficientCredit), template)
+        self.assertIs(problem.PROBLEM_REGISTRY._resolved[InsufficientCredit], template)
+        self.assertIsNone(problem.PROBLEM_REGISTRY.lookup(ValueError))
+        problem_details_error = problem.from_exception(InsufficientCredit("No credit"), extras={"balance": 10})
+        self.assertEqual(problem_details_error.to_dict(with_traceback=False), {
+            "status": 402, "title": "Insufficient funds", "detail": "No credit", "retryable": False, "balance": 10})
+
+    def test_register_invalidates_memo(self):
+        self.assertIsNone(problem.PROBLEM_REGISTRY.lookup(InsufficientCredit))
+        problem.register_problem(InsufficientFunds, status=402)
+        self.assertEqual(problem.PROBLEM_REGISTRY.lookup(InsufficientCredit).status, 402)
+
+    def test_register_validates_template(self):
+        with self.assertRaises(ValidationError):
+            problem.register_problem(InsufficientFunds, status=402, type="not an uri")
+
+    def test_base_template_does_not_override_http_exceptions(self):
+        problem.register_problem(Exception, status=500, title="Unexpected error")
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(response_cache_size=8))
+        client = app.test_client()
+
+        self.assertEqual(client.get('/missing').json, {"status": 404, "title": "NotFound", "detail": NotFound.description})
+        self.assertEqual(problem.from_exception(ValueError("failure")).problem.title, "Unexpected error")
+        batch = problem.ProblemDetailsBatch()
+        batch.add(0, NotFound())
+        self.assertEqual(batch.problems()[0]["status"], 404)
+
+    def test_http_template_without_detail_uses_description(self):
+        problem.register_problem(NotFound, status=404, type="https://example.com/problems/not-found")
+        self.assertEqual(problem.from_exception(NotFound()).problem.detail, NotFound.description)
+        batch = problem.ProblemDetailsBatch()
+        batch.add(0, NotFound())
+        self.assertEqual(batch.problems()[0]["detail"], NotFound.description)
+
+    def test_registered_http_exception(self):
+        problem.register_problem(NotFound, status=404, type="https://example.com/problems/not-found", detail="No such resource")
+        app = problem.configure_app(Flask(__name__))
+        response = app.test_client().get('/missing')
+
+        self.assertEqual(response.json, {"status": 404, "title": "NotFound", "detail": "No such resource",
+                                         "type": "https://example.com/problems/not-found"})
+
+class TestAsync(unittest.TestCase):
+
+    @staticmethod
+    def call_asgi(app) -> list:
+        messages = []
+        async def receive():
+            return {"type": "http.request", "body": b""}
+        async def send(message):
+            messages.append(message)
+        asyncio.run(app({"type": "http", "method": "GET", "path": "/"}, receive, send))
+        return messages
+
+    def test_asgi_middleware_converts_exceptions(self):
+        async def failing_app(scope, receive, send):
+            raise NotFound()
+        messages = self.call_asgi(problem.ProblemDetailsASGIMiddleware(failing_app))
+
+        self.assertEqual(messages[0]["status"], 404)
+        self.assertIn((b"content-type", b"application/problem+json"), messages[0]["headers"])
+        self.assertEqual(json.loads(messages[1]["body"]), {"status": 404, "title": "NotFound", "detail": NotFound.description})
+
+    def test_asgi_middleware_with_config(self):
+        async def failing_app(scope, receive, send):
+            raise problem.from_exception(Exception("The method is not implemented"))
+        middleware = problem.ProblemDetailsASGIMiddleware(failing_app, problem.ProblemDetailsConfig(with_traceback=True))
+        body = json.loads(self.call_asgi(middleware)[1]["body"])
+
+        self.assertEqual(body.get("status"), 500)
+        self.assertIn("failing_app", body.get("traceback"))
+
+    def test_asgi_middleware_reraises_after_response_start(self):
+        async def failing_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            raise ValueError("Too late")
+        with self.assertRaises(ValueError):
+            self.call_asgi(problem.ProblemDetailsASGIMiddleware(failing_app))
+
+    def test_async_handler(self):
+        handle = problem.async_handler()
+        body, status, headers = asyncio.run(handle(BadRequest("This is a bad request")))
+
+        self.assertEqual(status, 400)
+        self.assertEqual(headers, {"Content-Type": "application/problem+json"})
+        self.assertEqual(json.loads(body), {"status": 400, "title": "BadRequest", "detail": "This is a bad request"})
+
+    @unittest.skipUnless(importlib.util.find_spec("asgiref"), "async views require flask[async]")
+    def test_async_flask_view(self):
+        app = problem.configure_app(Flask(__name__))
+
+        @app.route('/problem')
+        async def problem_route():
+            raise BadRequest("This is a bad request")
+        response = app.test_client().get('/problem')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {"status": 400, "title": "BadRequest", "detail": "This is a bad request"})
+
+class TestTracebackSampler(unittest.TestCase):
+
+    def test_token_bucket(self):
+        sampler = problem.TracebackSampler(burst=2, window=10.0)
+
+        self.assertEqual([sampler.allow("a", now=0.0) for _ in range(3)], [True, True, False])
+        self.assertTrue(sampler.allow("b", now=0.0))
+        self.assertFalse(sampler.allow("a", now=4.0))
+        self.assertTrue(sampler.allow("a", now=5.0))
+
+    def test_max_signatures(self):
+        sampler = problem.TracebackSampler(burst=1, window=10.0, max_signatures=1)
+        sampler.allow("a", now=0.0)
+        sampler.allow("b", now=0.0)
+        # "a" was forgotten, so it gets a fresh bucket
+        self.assertTrue(sampler.allow("a", now=0.0))
+
+    def test_sampled_responses(self):
+        config = problem.ProblemDetailsConfig(with_traceback=True, traceback_sampler=problem.TracebackSampler(burst=2))
+        app = problem.configure_app(Flask(__name__), config=config)
+
+        @app.route('/exception')
+        def exception_route():
+            raise ValueError("This is a failure")
+
+        @app.route('/other')
+        def other_route():
+            raise ValueError("This is another failure")
+        client = app.test_client()
+        bodies = [client.get('/exception').json for _ in range(3)]
+        other = client.get('/other').json
+
+        self.assertEqual(["traceback" in body for body in bodies], [True, True, False])
+        self.assertEqual(len({body.get("traceback_id") for body in bodies}), 1)
+        self.assertEqual(len(bodies[2].get("traceback_id")), 16)
+        self.assertTrue("traceback" in other)
+        self.assertNotEqual(other.get("traceback_id"), bodies[0].get("traceback_id"))
+
+class TestFingerprint(unittest.TestCase):
+
+    @staticmethod
+    def capture(message: str) -> problem.ProblemDetailsError:
+        try:
+            raise ValueError(message)
+        except ValueError as exception:
+            return problem.from_exception(exception)
+
+    def test_normalize_message(self):
+        self.assertEqual(problem.normalize_message("User 42 'bob' at 0x7f3a not found"), "User ? ? at ? not found")
+
+    def test_fingerprint_is_stable(self):
+        first = self.capture("Order 1 failed").fingerprint()
+        second = self.capture("Order 2 failed").fingerprint()
+        other = self.capture("Payment failed").fingerprint()
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(first), 16)
+
+    def test_fingerprint_member(self):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(fingerprint=True, response_cache_size=8))
+
+        @app.route('/exception/<int:order>')
+        def exception_route(order: int):
+            raise ValueError(f"Order {order} failed")
+        client = app.test_client()
+
+        self.assertEqual(client.get('/exception/1').json.get("fingerprint"), client.get('/exception/2').json.get("fingerprint"))
+        self.assertTrue("fingerprint" in client.get('/missing').json)
+
+class TestProblemAggregator(unittest.TestCase):
+
+    def test_aggregates_by_fingerprint(self):
+        batches = []
+        aggregator = problem.ProblemAggregator(sink=batches.append)
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(aggregator=aggregator, response_cache_size=8))
+
+        @app.route('/exception/<int:order>')
+        def exception_route(order: int):
+            raise ValueError(f"Order {order} failed")
+        client = app.test_client()
+        for order in range(3):
+            client.get(f'/exception/{order}')
+        client.get('/missing')
+        client.get('/missing')
+        flushed = aggregator.flush()
+
+        self.assertEqual(batches, [flushed])
+        self.assertEqual([(entry["exception"], entry["status"], entry["count"]) for entry in flushed],
+                         [("builtins.ValueError", 500, 3), ("werkzeug.exceptions.NotFound", 404, 2)])
+        self.assertIn("exception_route", flushed[0]["traceback"])
+        self.assertLessEqual(flushed[0]["first_seen"], flushed[0]["last_seen"])
+        self.assertEqual(aggregator.flush(), [])
+
+    def test_bounded_entries(self):
+        aggregator = problem.ProblemAggregator(max_entries=1)
+        aggregator.record(TestFingerprint.capture("Order failed"))
+        aggregator.record(TestFingerprint.capture("Payment failed"))
+
+        self.assertEqual(aggregator.evicted, 1)
+        self.assertEqual(len(aggregator.flush()), 1)
+
+    def test_jsonl_sink_and_stop(self):
+        stream = io.StringIO()
+        aggregator = problem.ProblemAggregator(sink=problem.jsonl_sink(stream))
+        aggregator.start(interval=60.0)
+        aggregator.record(TestFingerprint.capture("Order failed"))
+        aggregator.stop()
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0]).get("count"), 1)
+
+class TestProblemReporter(unittest.TestCase):
+
+    def test_reports_in_batches_and_flushes_on_close(self):
+        batches = []
+        reporter = problem.ProblemReporter(batches.append, batch_size=2, flush_interval=60.0)
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(reporter=reporter))
+        client = app.test_client()
+        for _ in range(3):
+            client.get('/missing')
+        reporter.close()
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(batches[0][0]["status"], 404)
+        self.assertEqual(batches[0][0]["exception"], "werkzeug.exceptions.NotFound")
+        self.assertEqual((reporter.submitted, reporter.reported, reporter.dropped), (3, 3, 0))
+
+    def test_drop_oldest_when_full(self):
+        release = Event()
+        batches = []
+        def blocked_sink(batch):
+            release.wait()
+            batches.append(batch)
+        reporter = problem.ProblemReporter(blocked_sink, max_queue=2, batch_size=1, flush_interval=0.0)
+        reporter.submit({"id": 0})
+        # wait for the worker to take the first record
+        while reporter._queue:
+            time.sleep(0.001)
+        for index in range(1, 5):
+            reporter.submit({"id": index})
+        release.set()
+        reporter.close()
+
+        self.assertEqual([batch[0]["id"] for batch in batches], [0, 3, 4])
+        self.assertEqual(reporter.dropped, 2)
+
+    def test_failing_sink_is_counted(self):
+        def failing_sink(batch):
+            raise ConnectionError("collector is down")
+        reporter = problem.ProblemReporter(failing_sink)
+        reporter.submit({"id": 0})
+        reporter.close()
+
+        self.assertEqual(reporter.failed, 1)
+
+    def test_http_sink(self):
+        received = []
+        class Collector(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                self.send_response(204)
+                self.end_headers()
+            def log_message(self, *args):
+                pass
+        server = HTTPServer(("127.0.0.1", 0), Collector)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            reporter = problem.ProblemReporter(problem.http_sink(f"http://127.0.0.1:{server.server_port}/"))
+            reporter.submit({"id": 0})
+            reporter.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(received, [[{"id": 0}]])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork is not available")
+    def test_restarts_after_fork(self):
+        parent, release = os.getpid(), Event()
+        read, write = os.pipe()
+        def sink(batch):
+            if os.getpid() == parent:
+                release.wait()
+            else:
+                os.write(write, json.dumps([record["id"] for record in batch]).encode())
+        reporter = problem.ProblemReporter(sink, batch_size=1, flush_interval=0.0)
+        reporter.submit({"id": "taken"})
+        # wait for the worker to take the first record, the second one stays queued in the parent
+        while reporter._queue:
+            time.sleep(0.001)
+        reporter.submit({"id": "queued"})
+        pid = os.fork()
+        if pid == 0:
+            reporter.submit({"id": "child"})
+            reporter.close()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        os.close(write)
+        child = os.read(read, 64)
+        os.close(read)
+        release.set()
+        reporter.close()
+
+        self.assertEqual(json.loads(child), ["child"])
+        self.assertEqual(reporter.reported, 2)
+
+class TestContentNegotiation(unittest.TestCase):
+
+    def setUp(self):
+        config = problem.ProblemDetailsConfig(media_types=problem.MEDIA_TYPES, response_cache_size=8)
+        self.app = problem.configure_app(Flask(__name__), config=config)
+        self.client = self.app.test_client()
+
+    def test_json_by_default(self):
+        response = self.client.get('/missing', headers={"Accept": "*/*"})
+        self.assertEqual(response.mimetype, problem.PROBLEM_JSON)
+        self.assertEqual(response.json.get("title"), "NotFound")
+        self.assertIn("Accept", response.vary)
+
+    def test_negotiation_disabled(self):
+        client = problem.configure_app(Flask(__name__)).test_client()
+        response = client.get('/missing', headers={"Accept": problem.PROBLEM_XML})
+        self.assertEqual(response.mimetype, problem.PROBLEM_JSON)
+        self.assertNotIn("Accept", response.vary)
+
+    def test_xml(self):
+        @self.app.route('/problem')
+        def problem_route():
+            raise problem.from_exception(BadRequest("Bad <request>"), extras={"accounts": ["a", "b"], "retryable": False})
+        response = self.client.get('/problem', headers={"Accept": problem.PROBLEM_XML})
+
+        self.assertEqual(response.mimetype, problem.PROBLEM_XML)
+        root = ElementTree.fromstring(response.data)
+        namespace = "{urn:ietf:rfc:7807}"
+        self.assertEqual(root.tag, f"{namespace}problem")
+        self.assertEqual(root.find(f"{namespace}status").text, "400")
+        self.assertEqual(root.find(f"{namespace}detail").text, "Bad <request>")
+        self.assertEqual([item.text for item in root.find(f"{namespace}accounts")], ["a", "b"])
+        self.assertEqual(root.find(f"{namespace}retryable").text, "false")
+
+    def test_xml_member_names(self):
+        namespace = "{urn:ietf:rfc:7807}"
+        app = problem.configure_app(lambda args : OpenAPI(__name__, **args),
+                                    config=problem.ProblemDetailsConfig(media_types=(problem.PROBLEM_XML,)))
+        class Account(BaseModel):
+            id: int
+        @app.post('/accounts')
+        def post_account(body: Account):
+            return "ok"
+        response = app.test_client().post('/accounts', json={"bad key": 1, "<a": 2, "x:y": "\x01"},
+                                               headers={"Accept": problem.PROBLEM_XML})
+
+        self.assertEqual(response.status_code, 400)
+        root = ElementTree.fromstring(response.data)
+        members = root.find(f"{namespace}errors/{namespace}i/{namespace}input")
+        self.assertEqual({member.get("name"): member.text for member in members}, {"bad key": "1", "<a": "2", "x:y": "\ufffd"})
+
+    def test_xml_bounded_extras(self):
+        namespace = "{urn:ietf:rfc:7807}"
+        data = {"status": 400, "title": "BadRequest", "ids": problem.bound_extras({"ids": {str(index): index for index in range(5)}},
+                                                                                   problem.ExtrasLimits(max_items=2))["ids"]}
+        root = ElementTree.fromstring(problem.xml_encode(data))
+
+        self.assertEqual([member.tag for member in root.find(f"{namespace}ids")], [f"{namespace}member"] * 3)
+        self.assertEqual(root.find(f"{namespace}ids/{namespace}member[@name='...']").text, data["ids"]["..."])
+
+    @unittest.skipUnless(importlib.util.find_spec("msgpack"), "msgpack is not installed")
+    def test_msgpack(self):
+        import msgpack
+        response = self.client.get('/missing', headers={"Accept": problem.PROBLEM_MSGPACK})
+        self.assertEqual(response.mimetype, problem.PROBLEM_MSGPACK)
+        self.assertEqual(msgpack.unpackb(response.data).get("status"), 404)
+
+    @unittest.skipUnless(importlib.util.find_spec("cbor2"), "cbor2 is not installed")
+    def test_cbor(self):
+        import cbor2
+        response = self.client.get('/missing', headers={"Accept": f"{problem.PROBLEM_CBOR}, {problem.PROBLEM_JSON};q=0.5"})
+        self.assertEqual(response.mimetype, problem.PROBLEM_CBOR)
+        self.assertEqual(cbor2.loads(response.data).get("status"), 404)
+
+    def test_encoder_selected_once(self):
+        self.assertIs(problem.media_type_encoder(problem.PROBLEM_XML), problem.media_type_encoder(problem.PROBLEM_XML))
+        with self.assertRaises(ValueError):
+            problem.media_type_encoder("application/problem+yaml")
+
+class TestCompressionAndBudget(unittest.TestCase):
+
+    def make_client(self, **options):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(**options))
+
+        @app.route('/large')
+        def large_route():
+            raise problem.from_exception(BadRequest("Too many errors"), extras={"errors": ["Input should be a valid integer"] * 500})
+
+        @app.route('/exception')
+        def exception_route():
+            raise ValueError("This is a failure")
+        return app.test_client()
+
+    def test_gzip_above_threshold(self):
+        client = self.make_client(compress_min_bytes=1024)
+        response = client.get('/large', headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+        self.assertIn("Accept-Encoding", response.vary)
+        self.assertEqual(len(json.loads(gzip.decompress(response.data)).get("errors")), 500)
+
+    def test_no_compression_below_threshold_or_when_not_accepted(self):
+        client = self.make_client(compress_min_bytes=1024)
+
+        self.assertIsNone(client.get('/missing', headers={"Accept-Encoding": "gzip"}).headers.get("Content-Encoding"))
+        self.assertIsNone(client.get('/large', headers={"Accept-Encoding": "identity"}).headers.get("Content-Encoding"))
+
+    def test_budget_cuts_traceback_first(self):
+        client = self.make_client(with_traceback=True, max_body_bytes=200)
+        response = client.get('/exception')
+
+        # escaped characters can leave a byte or two unused
+        self.assertGreaterEqual(len(response.data), 195)
+        self.assertLessEqual(len(response.data), 200)
+        body = response.json
+        self.assertEqual({name: body[name] for name in ("status", "title", "detail")},
+                         {"status": 500, "title": "InternalServerError", "detail": "This is a failure"})
+        self.assertTrue(body["traceback"].startswith("..."))
+        self.assertTrue(body["traceback"].endswith("ValueError: This is a failure\n"))
+
+    def test_budget_truncates_detail(self):
+        client = self.make_client(with_traceback=True, fingerprint=True, max_body_bytes=1000)
+        @client.application.route('/oversized')
+        def oversized_route():
+            raise problem.from_exception(ValueError("x" * 100000), extras={"code": "E42"})
+        response = client.get('/oversized')
+
+        self.assertLessEqual(len(response.data), 1000)
+        body = response.json
+        self.assertEqual(body["omitted"], ["code"])
+        self.assertIn("fingerprint", body)
+        self.assertNotIn("traceback", body)
+        self.assertRegex(body["detail"], r"^x+\.\.\.$")
+
+    def test_budget_trims_extras(self):
+        client = self.make_client(max_body_bytes=200)
+        response = client.get('/large')
+
+        self.assertLessEqual(len(response.data), 200)
+        self.assertEqual(response.json, {"status": 400, "title": "BadRequest", "detail": "Too many errors", "omitted": ["errors"]})
+
+    def test_budget_not_reached(self):
+        client = self.make_client(max_body_bytes=100000)
+        self.assertEqual(len(client.get('/large').json.get("errors")), 500)
+
+class TestLazyImports(unittest.TestCase):
+
+    def run_python(self, script):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        return subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout.split()
+
+    def test_import_skips_pydantic_and_openapi(self):
+        output = self.run_python(
+            "import sys, flask_problem_details; print('pydantic' in sys.modules, 'flask_openapi3' in sys.modules)")
+        self.assertEqual(output, ["False", "False"])
+
+    def test_import_skips_optional_modules(self):
+        output = self.run_python(
+            "import sys, flask_problem_details\n"
+            "print(*[name in sys.modules for name in ('urllib.request', 'brotli', 'gzip')])")
+        self.assertEqual(output, ["False", "False", "False"])
+
+    def test_flask_error_path_stays_light(self):
+        output = self.run_python(
+            "import sys, flask, flask_problem_details as problem\n"
+            "app = problem.configure_app(flask.Flask('lazy'))\n"
+            "response = app.test_client().get('/missing')\n"
+            "print(response.status_code, 'pydantic' in sys.modules)")
+        self.assertEqual(output, ["404", "False"])
+
+    def test_problem_details_model_loaded_on_access(self):
+        output = self.run_python(
+            "import sys, flask_problem_details as problem\n"
+            "model = problem.ProblemDetails\n"
+            "print(model.__name__, model is problem.ProblemDetails, 'pydantic' in sys.modules)")
+        self.assertEqual(output, ["ProblemDetails", "True", "True"])
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            problem.NoSuchThing
+
+class TestWarmup(unittest.TestCase):
+
+    def test_warmup_primes_first_error(self):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(with_traceback=True))
+        def failing_view():
+            raise ValueError("failure")
+        app.add_url_rule('/exception', 'exception', failing_view)
+        linecache.clearcache()
+        problem.media_type_encoder.cache_clear()
+        problem.warmup(app)
+
+        self.assertIn(failing_view.__code__.co_filename, linecache.cache)
+        self.assertIn(sys.modules[Flask.__module__].__file__, linecache.cache)
+        self.assertIsNotNone(problem.ProblemDetails.__pydantic_serializer__)
+        self.assertEqual(problem.media_type_encoder.cache_info().currsize, len(problem.available_media_types(problem.MEDIA_TYPES)))
+
+    def test_warmup_primes_response_cache_without_observing(self):
+        metrics = problem.ProblemMetrics()
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(response_cache_size=32, metrics=metrics))
+        problem.warmup(app, statuses=(404, 405))
+        cache = app.extensions["problem_details_response_cache"]
+
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(metrics.snapshot()["count"], 0)
+        response = app.test_client().get('/missing')
+        self.assertEqual(response.json, {"status": 404, "title": "NotFound", "detail": NotFound.description})
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(metrics.snapshot()["count"], 1)
+
+    def test_warmup_negotiated_media_types_and_validation(self):
+        app = problem.configure_app(lambda args: OpenAPI(__name__, **args),
+                                    config=problem.ProblemDetailsConfig(media_types=problem.MEDIA_TYPES, compress_min_bytes=1))
+        problem.warmup(app)
+        problem.warmup()
+
+class FundsExtras(BaseModel):
+    balance: float
+    accounts: List[str] = []
+
+class TestProblemCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = problem.ProblemCatalog()
+        self.catalog.add(InsufficientFunds, 402, title="Insufficient funds",
+                         type="https://example.com/problems/funds", extras_model=FundsExtras)
+        self.catalog.add(InsufficientCredit, 402, name="NoCredit")
+
+    def tearDown(self):
+        problem.PROBLEM_REGISTRY.unregister(InsufficientFunds)
+        problem.PROBLEM_REGISTRY.unregister(InsufficientCredit)
+
+    def test_schemas(self):
+        schemas = self.catalog.schemas()
+
+        self.assertEqual(set(schemas), {"ProblemDetails", "InsufficientFunds", "NoCredit"})
+        base, narrowed = schemas["InsufficientFunds"]["allOf"]
+        self.assertEqual(base, {"$ref": "#/components/schemas/ProblemDetails"})
+        self.assertEqual(narrowed["properties"]["status"], {"type": "integer", "enum": [402]})
+        self.assertEqual(narrowed["properties"]["type"]["enum"], ["https://example.com/problems/funds"])
+        self.assertEqual(narrowed["required"], ["balance"])
+        self.assertIn("accounts", narrowed["properties"])
+
+    def test_fragments_are_cached_until_next_declaration(self):
+        schemas, responses = self.catalog.schemas(), self.catalog.responses(InsufficientFunds)
+
+        self.assertIs(self.catalog.schemas(), schemas)
+        self.assertIs(self.catalog.responses(InsufficientFunds), responses)
+        self.catalog.add(InsufficientFunds, 409)
+        self.assertIsNot(self.catalog.schemas(), schemas)
+        self.assertEqual(list(self.catalog.responses(InsufficientFunds)), ["409"])
+
+    def test_responses_group_by_status(self):
+        responses = self.catalog.responses()
+
+        self.assertEqual(list(responses), ["402"])
+        self.assertEqual(responses["402"]["content"]["application/problem+json"]["schema"], {"oneOf": [
+            {"$ref": "#/components/schemas/InsufficientFunds"}, {"$ref": "#/components/schemas/NoCredit"}]})
+        with self.assertRaises(KeyError):
+            self.catalog.responses(ValueError)
+
+    def test_invalid_name(self):
+        with self.assertRaises(ValueError):
+            self.catalog.add(ValueError, 400, name="bad name")
+
+    def test_runtime_templates(self):
+        problem_details_error = problem.from_exception(InsufficientCredit("No credit"))
+
+        self.assertEqual(problem_details_error.to_dict(with_traceback=False),
+                         {"status": 402, "title": "InsufficientCredit", "detail": "No credit"})
+
+    def test_openapi_components(self):
+        app = problem.configure_app(lambda args: OpenAPI(__name__, **args),
+                                    config=problem.ProblemDetailsConfig(catalog=self.catalog))
+
+        @app.get('/pay', responses=self.catalog.responses(InsufficientFunds))
+        def pay_route():
+            raise InsufficientFunds("Balance is 10, price is 20")
+
+        document = app.api_doc
+        self.assertIn("InsufficientFunds", document["components"]["schemas"])
+        self.assertEqual(set(document["components"]["responses"]), {"InsufficientFunds", "NoCredit"})
+        self.assertEqual(document["paths"]["/pay"]["get"]["responses"]["402"]["content"]["application/problem+json"],
+                         {"schema": {"$ref": "#/components/schemas/InsufficientFunds"}})
+        response = app.test_client().get('/pay')
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(response.json["type"], "https://example.com/problems/funds")
+
+class FrameLocal:
+    pass
+
+class TestDetachTracebacks(unittest.TestCase):
+
+    def setUp(self):
+        gc.disable()
+        self.locals = []
+
+    def tearDown(self):
+        gc.enable()
+
+    def make_client(self, **options):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(**options))
+
+        @app.route('/problem')
+        def problem_route():
+            local = FrameLocal()
+            local.buffer = bytearray(1000000)
+            self.locals.append(weakref.ref(local))
+            try:
+                raise ValueError("This is a failure")
+            except ValueError as exception:
+                error = problem.from_exception(exception)
+            # the view frame references the error, whose traceback references the frame
+            raise error
+
+        @app.route('/exception')
+        def exception_route():
+            local = FrameLocal()
+            self.locals.append(weakref.ref(local))
+            raise ValueError("This is a failure")
+        return app.test_client()
+
+    def test_frames_retained_by_default(self):
+        client = self.make_client()
+        client.get('/problem')
+
+        self.assertIsNotNone(self.locals[0]())
+        gc.collect()
+        self.assertIsNone(self.locals[0]())
+
+    def test_no_frame_retention_after_request(self):
+        client = self.make_client(detach_tracebacks=True, with_traceback=True)
+        client.get('/problem')
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            for _ in range(5):
+                response = client.get('/problem')
+            after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertIn("raise ValueError", response.json["traceback"])
+        self.assertEqual([local() for local in self.locals], [None] * 6)
+        self.assertLess(after - before, 500000)
+
+    def test_detach_http_and_generic_exceptions(self):
+        client = self.make_client(detach_tracebacks=True, response_cache_size=8)
+        client.get('/exception')
+        client.get('/missing')
+
+        self.assertIsNone(self.locals[0]())
+
+    def test_detach_keeps_computed_members(self):
+        try:
+            raise ValueError("This is a failure")
+        except ValueError as exception:
+            error = problem.from_exception(exception)
+        formatted, fingerprint = error.format_traceback(), error.fingerprint()
+        error.detach()
+
+        self.assertIsNone(error.inner_exception.__traceback__)
+        self.assertEqual(error.format_traceback(), formatted)
+        self.assertEqual(error.fingerprint(), fingerprint)
+        self.assertEqual(error.problem.title, "InternalServerError")
+
+    def test_slots(self):
+        self.assertIn("_traceback", problem.ProblemDetailsError.__slots__)
+        error = problem.from_exception(ValueError("This is a failure"))
+        self.assertEqual(error.__dict__, {})
+        self.assertEqual(error._for_response().__dict__, {})
+
+class TestProblemDetailsBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = problem.ProblemDetailsBatch(detail="3 items failed")
+        self.batch.add(0, ValueError("Quantity must be positive"), extras={"field": "quantity"})
+        self.batch.add("sku-2", NotFound())
+        self.batch.add_problem(5, 409, "Conflict", type="https://example.com/problems/duplicate")
+
+    def tearDown(self):
+        problem.PROBLEM_REGISTRY.unregister(InsufficientFunds)
+
+    def test_to_bytes(self):
+        self.assertEqual(json.loads(self.batch.to_bytes()), {
+            "status": 422, "title": "UnprocessableEntity", "detail": "3 items failed", "problems": [
+                {"status": 500, "title": "InternalServerError", "detail": "Quantity must be positive", "index": 0, "field": "quantity"},
+                {"status": 404, "title": "NotFound", "detail": NotFound.description, "index": "sku-2"},
+                {"status": 409, "title": "Conflict", "type": "https://example.com/problems/duplicate", "index": 5}]})
+
+    def test_matches_problem_details_error(self):
+        self.assertEqual(json.loads(self.batch.to_bytes()), self.batch.to_exception().to_dict(with_traceback=False))
+        self.assertEqual(self.batch.problems(), json.loads(self.batch.to_bytes())["problems"])
+
+    def test_shared_templates_and_interned_titles(self):
+        batch = problem.ProblemDetailsBatch()
+        for index in range(100):
+            batch.add(index, ValueError(f"Item {index} is invalid"))
+            batch.add_problem(index, 409, "".join(["Con", "flict"]))
+
+        self.assertEqual(len(batch), 200)
+        self.assertEqual(len(batch._templates), 2)
+        self.assertIs(batch._items[1][1].title, batch._items[3][1].title)
+        self.assertIs(batch._items[0][1], batch._items[198][1])
+
+    def test_registered_template(self):
+        problem.register_problem(InsufficientFunds, status=402, type="https://example.com/problems/funds")
+        batch = problem.ProblemDetailsBatch()
+        batch.add(0, InsufficientCredit("No credit"))
+
+        self.assertEqual(batch.problems(), [{"status": 402, "title": "InsufficientFunds", "detail": "No credit",
+                                             "type": "https://example.com/problems/funds", "index": 0}])
+
+    def test_empty(self):
+        batch = problem.ProblemDetailsBatch()
+
+        self.assertFalse(batch)
+        self.assertEqual(json.loads(batch.to_bytes())["problems"], [])
+
+    def test_http_response_and_stream(self):
+        app = Flask(__name__)
+
+        @app.post('/import')
+        def import_route():
+            return self.batch.to_http_response(stream=True, chunk_size=2)
+
+        response = app.test_client().post('/import')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.mimetype, "application/problem+json")
+        self.assertEqual(response.data, self.batch.to_bytes())
+
+    def test_json_encoder_and_media_type(self):
+        settings = problem.ProblemDetailsConfig(json_encoder="json").resolve()
+
+        self.assertEqual(json.loads(self.batch.to_bytes(settings)), json.loads(self.batch.to_bytes()))
+        response = self.batch.to_http_response(media_type=problem.PROBLEM_XML)
+        self.assertEqual(response.mimetype, problem.PROBLEM_XML)
+        self.assertEqual(ElementTree.fromstring(response.data).find("{urn:ietf:rfc:7807}status").text, "422")
+
+    def test_raise_through_handlers(self):
+        app = problem.configure_app(Flask(__name__))
+
+        @app.post('/import')
+        def import_route():
+            raise self.batch.to_exception()
+
+        self.assertEqual(app.test_client().post('/import').json, json.loads(self.batch.to_bytes()))
+
+class TestLoadShedder(unittest.TestCase):
+
+    def make_app(self, shedder, **options):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(load_shedder=shedder, **options))
+
+        @app.route('/ok')
+        def ok_route():
+            return "ok"
+
+        @app.route('/exception')
+        def exception_route():
+            raise ValueError("This is a failure")
+        return app
+
+    def test_rejects_requests_above_max_in_flight(self):
+        shedder = problem.LoadShedder(max_in_flight=0)
+        response = self.make_app(shedder).test_client().get('/ok')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(response.mimetype, "application/problem+json")
+        self.assertEqual(response.data, shedder.body)
+        self.assertEqual(response.json["title"], "ServiceUnavailable")
+        self.assertEqual((shedder.in_flight, shedder.shed), (0, 1))
+
+    def test_counts_concurrent_requests(self):
+        started, release = Event(), Event()
+        shedder = problem.LoadShedder(max_in_flight=1)
+        app = self.make_app(shedder)
+
+        @app.route('/slow')
+        def slow_route():
+            started.set()
+            release.wait(5)
+            return "done"
+
+        responses = []
+        thread = Thread(target=lambda: responses.append(app.test_client().get('/slow')))
+        thread.start()
+        started.wait(5)
+        self.assertEqual(shedder.in_flight, 1)
+        self.assertEqual(app.test_client().get('/ok').status_code, 503)
+        release.set()
+        thread.join()
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(shedder.in_flight, 0)
+        self.assertEqual(app.test_client().get('/ok').status_code, 200)
+
+    def test_sheds_errors_only(self):
+        overloaded = [False]
+        shedder = problem.LoadShedder(predicate=lambda: overloaded[0], status=429, retry_after=30, reject_requests=False)
+        client = self.make_app(shedder, with_traceback=True, fingerprint=True).test_client()
+
+        self.assertIn("traceback", client.get('/exception').json)
+        overloaded[0] = True
+        self.assertEqual(client.get('/ok').status_code, 200)
+        response = client.get('/exception')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "30")
+        self.assertEqual(response.json, {"status": 429, "title": "TooManyRequests",
+                                         "detail": problem.default_exceptions[429].description})
+        self.assertEqual(client.get('/missing').status_code, 429)
+
+    def test_warmup_does_not_count(self):
+        shedder = problem.LoadShedder(max_in_flight=10)
+        problem.warmup(self.make_app(shedder))
+
+        self.assertEqual(shedder.in_flight, 0)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            problem.LoadShedder()
+        with self.assertRaises(ValueError):
+            problem.LoadShedder(max_in_flight=10, status=500)
+
+class FailingRepr:
+    def __repr__(self):
+        raise RuntimeError("no repr")
+
+class TestBoundExtras(unittest.TestCase):
+
+    def test_limits(self):
+        limits = problem.ExtrasLimits(max_depth=2, max_items=3, max_string=6)
+        bounded = problem.bound_extras({"text": "abcdefghi", "items": list(range(10)), "nested": {"a": {"b": 1}}, 1: None}, limits)
+
+        self.assertEqual(bounded, {"text": "abcdef...(+3 chars)", "items": [0, 1, 2, "... +7 items"],
+                                   "nested": {"a": "<dict of 1 items>"}, "...": "+1 items"})
+
+    def test_cycles_and_objects(self):
+        cycle = {"name": "root"}
+        cycle["self"] = cycle
+        bounded = problem.bound_extras({"cycle": cycle, "object": FailingRepr(), "generator": (i for i in range(3)),
+                                        "class": problem.TrustedProblemDetails, "when": time.gmtime(0)})
+
+        self.assertEqual(bounded["cycle"], {"name": "root", "self": "<cycle dict>"})
+        self.assertEqual(bounded["object"], "<FailingRepr object>")
+        self.assertEqual(bounded["generator"], "<generator object>")
+        self.assertEqual(bounded["class"], "<class TrustedProblemDetails>")
+        self.assertEqual(bounded["when"], [1970, 1, 1, 0, 0, 0, 3, 1, 0])
+        json.dumps(bounded)
+
+    def test_objects_are_not_repred(self):
+        bounded = problem.bound_extras({"object": FailingRepr(), "error": ValueError("bad", FailingRepr()),
+                                        "blob": b"y" * 2000, FailingRepr(): 1})
+
+        self.assertEqual(bounded["object"], "<FailingRepr object>")
+        self.assertEqual(bounded["error"], "ValueError('bad', <FailingRepr object>)")
+        self.assertEqual(bounded["blob"], "b'" + "y" * 1022 + "...(+6 chars)")
+        self.assertEqual(bounded["<FailingRepr object>"], 1)
+
+    def test_models_and_dataclasses(self):
+        class Item(BaseModel):
+            name: str
+            tags: List[str]
+
+        bounded = problem.bound_extras({"item": Item(name="book", tags=["a", "b"]), "value": ValueError("bad")})
+
+        self.assertEqual(bounded, {"item": {"name": "book", "tags": ["a", "b"]}, "value": "ValueError('bad')"})
+
+    def test_byte_budget_caps_cost(self):
+        huge = {f"key{index}": ["x" * 1000] * 100 for index in range(10000)}
+        bounded = problem.bound_extras(huge, problem.ExtrasLimits(max_bytes=10000))
+
+        self.assertLess(len(json.dumps(bounded)), 12000)
+        self.assertLess(len(bounded), 20)
+        self.assertIn("...", bounded)
+
+    def test_circular_extras_through_handlers(self):
+        cycle = []
+        cycle.append(cycle)
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(extras_limits=problem.ExtrasLimits()))
+
+        @app.route('/problem')
+        def problem_route():
+            raise problem.from_exception(Exception("This is a failure"), extras={"graph": cycle, "session": FailingRepr()})
+
+        response = app.test_client().get('/problem')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json["graph"], ["<cycle list>"])
+        self.assertEqual(response.json["session"], "<FailingRepr object>")
+
+    def test_pydantic_extras_bounded_once(self):
+        error = problem.from_exception(Exception("This is a failure"), extras={"instance": "https://example.com/1", "blob": "x" * 50})
+        settings = problem.ProblemDetailsConfig(extras_limits=problem.ExtrasLimits(max_string=10)).resolve()
+        error.to_dict(settings=settings)
+
+        self.assertEqual(error.to_dict(settings=settings)["blob"], "xxxxxxxxxx...(+40 chars)")
+
+class TestProblemLogger(unittest.TestCase):
+
+    def make_client(self, logger, **options):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(logger=logger, **options))
+
+        @app.route('/exception', methods=['POST'])
+        def exception_route():
+            raise ValueError("This is a failure")
+        return app.test_client()
+
+    def lines(self, stream):
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork is not available")
+    def test_logs_after_fork(self):
+        read, write = os.pipe()
+        stream = os.fdopen(write, "wb")
+        logger = problem.ProblemLogger(stream, min_status=400, flush_interval=0.0)
+        client = self.make_client(logger)
+        pid = os.fork()
+        if pid == 0:
+            client.get('/missing')
+            logger.close()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        logger.close()
+        stream.close()
+        line = json.loads(os.read(read, 4096))
+        os.close(read)
+
+        self.assertEqual((line["path"], line["status"]), ("/missing", 404))
+
+    def test_logs_response_body_and_request_context(self):
+        stream = io.BytesIO()
+        logger = problem.ProblemLogger(stream)
+        client = self.make_client(logger)
+        response = client.post('/exception', headers={"X-Request-ID": "req-1"})
+        client.get('/missing')
+        logger.close()
+
+        self.assertIn(b',"problem":' + response.data + b'}\n', stream.getvalue())
+        line, = self.lines(stream)
+        self.assertEqual({name: line[name] for name in ("method", "path", "request_id", "status")},
+                         {"method": "POST", "path": "/exception", "request_id": "req-1", "status": 500})
+        self.assertEqual(line["problem"], response.json)
+        self.assertIsInstance(line["time"], float)
+
+    def test_min_status_and_cached_responses(self):
+        stream = io.BytesIO()
+        logger = problem.ProblemLogger(stream, min_status=400, request_id_header="X-Correlation-ID")
+        client = self.make_client(logger, response_cache_size=8)
+        client.get('/missing')
+        client.get('/missing', headers={"X-Correlation-ID": "req-2"})
+        logger.close()
+
+        self.assertEqual([(line["status"], line["request_id"]) for line in self.lines(stream)], [(404, None), (404, "req-2")])
+
+    def test_logs_json_before_compression_and_negotiation(self):
+        stream = io.BytesIO()
+        logger = problem.ProblemLogger(stream)
+        client = self.make_client(logger, compress_min_bytes=1, media_types=(problem.PROBLEM_JSON, problem.PROBLEM_XML))
+        client.post('/exception', headers={"Accept-Encoding": "gzip"})
+        client.post('/exception', headers={"Accept": problem.PROBLEM_XML})
+        logger.close()
+
+        self.assertEqual([line["problem"]["detail"] for line in self.lines(stream)], ["This is a failure"] * 2)
+
+    def test_logs_streamed_validation_errors(self):
+        class ItemsModel(BaseModel):
+            items: List[int]
+        stream = io.BytesIO()
+        logger = problem.ProblemLogger(stream, min_status=400)
+        config = problem.ProblemDetailsConfig(logger=logger, stream_validation_errors=True)
+        app = problem.configure_app(lambda args : OpenAPI(__name__, **args), config=config)
+        @app.post('/items')
+        def post_items(body: ItemsModel):
+            return "ok"
+        response = app.test_client().post('/items', json={"items": ["a", "b"]})
+        # the line is written once the client has read the whole body
+        body = response.json
+        logger.close()
+
+        line, = self.lines(stream)
+        self.assertEqual(line["problem"], body)
+        self.assertEqual(len(line["problem"]["errors"]), 2)
+
+    def test_warmup_is_not_logged(self):
+        stream = io.BytesIO()
+        logger = problem.ProblemLogger(stream, min_status=400)
+        client = self.make_client(logger)
+        problem.warmup(client.application)
+        client.post('/exception')
+        logger.close()
+
+        self.assertEqual([line["path"] for line in self.lines(stream)], ["/exception"])
+
+    def test_does_not_block_handlers(self):
+        release = Event()
+        class BlockedStream(io.BytesIO):
+            def write(self, data):
+                release.wait(5)
+                return super().write(data)
+        stream = BlockedStream()
+        logger = problem.ProblemLogger(stream, flush_interval=0.0)
+        client = self.make_client(logger)
+
+        started = time.perf_counter()
+        for _ in range(3):
+            self.assertEqual(client.post('/exception').status_code, 500)
+        self.assertLess(time.perf_counter() - started, 2)
+        release.set()
+        logger.close()
+        self.assertEqual(len(self.lines(stream)), 3)
+
+class TestRequestIds(unittest.TestCase):
+
+    def make_client(self, request_ids, **options):
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(request_ids=request_ids, **options))
+
+        @app.route('/exception')
+        def exception_route():
+            raise ValueError("This is a failure")
+
+        @app.route('/typed')
+        def typed_route():
+            raise problem.from_exception(ValueError("This is a failure"), extras={"type": "https://example.com/problems/typed"})
+
+        @app.route('/instance')
+        def instance_route():
+            raise problem.from_exception(ValueError("This is a failure"), extras={"instance": "https://example.com/orders/1"})
+        return app.test_client()
+
+    def test_generated_ids(self):
+        client = self.make_client(problem.RequestIds())
+        first, second = client.get('/exception'), client.get('/exception')
+
+        self.assertEqual(first.json["instance"], "urn:request:" + first.headers["X-Request-ID"])
+        self.assertNotEqual(first.headers["X-Request-ID"], second.headers["X-Request-ID"])
+
+    def test_propagated_ids(self):
+        client = self.make_client(problem.RequestIds(instance="https://api.example.com/requests/{id}", response_header="X-Trace"))
+        response = client.get('/exception', headers={"X-Request-ID": "abc-123"})
+
+        self.assertEqual(response.json["instance"], "https://api.example.com/requests/abc-123")
+        self.assertEqual(response.headers["X-Trace"], "abc-123")
+        unsafe = client.get('/exception', headers={"X-Request-ID": "<script>"})
+        self.assertNotEqual(unsafe.headers["X-Trace"], "<script>")
+        self.assertEqual(unsafe.json["instance"], "https://api.example.com/requests/" + unsafe.headers["X-Trace"])
+
+    def test_cached_responses(self):
+        client = self.make_client(problem.RequestIds(), response_cache_size=8)
+        responses = [client.get('/missing', headers={"X-Request-ID": f"req-{index}"}) for index in range(2)]
+
+        self.assertEqual([response.json["instance"] for response in responses], ["urn:request:req-0", "urn:request:req-1"])
+        self.assertEqual(responses[1].json["detail"], NotFound.description)
+        self.assertEqual(client.application.extensions["problem_details_response_cache"].hits, 1)
+
+    def test_cached_responses_with_custom_encoder(self):
+        encoder = lambda data: json.dumps(data, indent=2).encode() + b"\n"
+        client = self.make_client(problem.RequestIds(), response_cache_size=8, json_encoder=encoder)
+        responses = [client.get('/missing', headers={"X-Request-ID": f"req-{index}"}) for index in range(2)]
+
+        self.assertEqual([response.json["instance"] for response in responses], ["urn:request:req-0", "urn:request:req-1"])
+        self.assertEqual(client.application.extensions["problem_details_response_cache"].hits, 1)
+
+    def test_pydantic_problems(self):
+        client = self.make_client(problem.RequestIds())
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            typed = client.get('/typed', headers={"X-Request-ID": "req-1"})
+            explicit = client.get('/instance', headers={"X-Request-ID": "req-2"})
+
+        self.assertEqual(typed.json["instance"], "urn:request:req-1")
+        self.assertEqual(explicit.json["instance"], "https://example.com/orders/1")
+        self.assertEqual(explicit.headers["X-Request-ID"], "req-2")
+
+    def test_shared_problem_is_not_changed(self):
+        shared = problem.from_exception(ValueError("This is a failure"))
+        config = problem.ProblemDetailsConfig(request_ids=problem.RequestIds(), with_traceback=True, fingerprint=True,
+                                              traceback_sampler=problem.TracebackSampler(burst=1))
+        app = problem.configure_app(Flask(__name__), config=config)
+        @app.route('/shared')
+        def shared_route():
+            raise shared
+        client = app.test_client()
+        responses = [client.get('/shared', headers={"X-Request-ID": f"req-{index}"}) for index in range(2)]
+
+        self.assertEqual([response.json["instance"] for response in responses], ["urn:request:req-0", "urn:request:req-1"])
+        self.assertIn("traceback", responses[0].json)
+        self.assertNotIn("traceback", responses[1].json)
+        self.assertEqual(responses[0].json["fingerprint"], responses[1].json["fingerprint"])
+        self.assertEqual(shared.to_dict(with_traceback=False), {"status": 500, "title": "InternalServerError", "detail": "This is a failure"})
+
+    def test_logger_uses_request_id(self):
+        stream = io.BytesIO()
+        logger = problem.ProblemLogger(stream)
+        client = self.make_client(problem.RequestIds(header=None), logger=logger)
+        response = client.get('/exception', headers={"X-Request-ID": "ignored"})
+        logger.close()
+
+        self.assertNotEqual(response.headers["X-Request-ID"], "ignored")
+        self.assertEqual(json.loads(stream.getvalue())["request_id"], response.headers["X-Request-ID"])
+
+    def test_generators(self):
+        generate = problem.monotonic_ids()
+        ids = [generate() for _ in range(3)]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(ids[1].rsplit("-", 1), [ids[0].rsplit("-", 1)[0], "2"])
+
+        gc.collect()
+        registered = len(problem._MONOTONIC_IDS)
+        generators = [problem.monotonic_ids() for _ in range(10)]
+        self.assertEqual(len(problem._MONOTONIC_IDS), registered + 10)
+        del generators
+        gc.collect()
+        self.assertEqual(len(problem._MONOTONIC_IDS), registered)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork is not available")
+    def test_monotonic_ids_after_fork(self):
+        generate = problem.monotonic_ids()
+        generate()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write, generate().encode())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        os.close(write)
+        child = os.read(read, 64).decode()
+        os.close(read)
+
+        self.assertEqual(child.rsplit("-", 1)[1], "1")
+        self.assertNotEqual(child.rsplit("-", 1)[0], generate().rsplit("-", 1)[0])
+
+    def test_ulid(self):
+        first = problem.ulid()
+        time.sleep(0.002)
+        second = problem.ulid()
+        self.assertEqual(len(first), 26)
+        self.assertTrue(set(first) <= set("0123456789ABCDEFGHJKMNPQRSTVWXYZ"))
+        self.assertLess(first, second)
+
+    def test_invalid_instance_template(self):
+        for instance in ("urn:request", "urn:request {id}", "1a:{id}", "/requests/{id}%zz"):
+            with self.assertRaises(ValueError):
+                problem.RequestIds(instance=instance)
+
+    def test_relative_instance(self):
+        client = self.make_client(problem.RequestIds(instance="/requests/{id}"))
+        for path in ('/exception', '/typed'):
+            response = client.get(path, headers={"X-Request-ID": "req-1"})
+            self.assertEqual(response.json["instance"], "/requests/req-1")
+
+    def test_problem_details_subclass(self):
+        class Conflict(problem.ProblemDetails):
+            resource: str
+        app = problem.configure_app(Flask(__name__), config=problem.ProblemDetailsConfig(request_ids=problem.RequestIds()))
+        @app.route('/conflict')
+        def conflict_route():
+            raise problem.ProblemDetailsError(Conflict(status=409, title="Conflict", resource="orders/1"))
+        response = app.test_client().get('/conflict', headers={"X-Request-ID": "req-1"})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json, {"status": 409, "title": "Conflict", "instance": "urn:request:req-1", "resource": "orders/1"})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file